@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Baraza load-testing harness.
+
+Starts N headless aiortc listeners against /ws/baraza/<space_id>, performs
+the offer/answer over the WebSocket and consumes the audio, stepping the
+listener count up to build a capacity curve.
+
+Usage:
+    python scripts/baraza_load_test.py --url ws://localhost:5000/ws/baraza/<space_id> \
+        --token <access token from the Flask API> --steps 10,50,100,200 --hold 20 --server-pid <pid of the Quart app>
+
+Per step it reports join latency (WebSocket connect to first decoded audio
+frame), server CPU per listener and memory per RTCPeerConnection (sampled
+from --server-pid with psutil) and the packet loss seen by the listeners.
+Requires aiortc, websockets and psutil.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from urllib.parse import urlencode
+
+import psutil
+import websockets
+from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError
+
+
+class SyntheticListener:
+    """A headless Baraza listener: one WebSocket plus one RTCPeerConnection."""
+
+    def __init__(self, url, join_timeout):
+        self.url = url
+        self.join_timeout = join_timeout
+        self.join_latency = None
+        self.error = None
+        self.frames = 0
+        self.packets_received = 0
+        self.packets_lost = 0
+        self._stop = asyncio.Event()
+        self._connected = asyncio.Event()
+        self._first_frame = asyncio.Event()
+
+    async def run(self):
+        pc = RTCPeerConnection()
+        pc.addTransceiver('audio', direction='recvonly')
+        consumer = None
+
+        @pc.on('track')
+        def on_track(track):
+            nonlocal consumer
+            consumer = asyncio.ensure_future(self._consume(track))
+
+        started = time.perf_counter()
+        try:
+            async with websockets.connect(self.url) as ws:
+                await pc.setLocalDescription(await pc.createOffer())
+                await ws.send(json.dumps({'type': 'offer', 'sdp': pc.localDescription.sdp}))
+                answer = json.loads(await asyncio.wait_for(ws.recv(), self.join_timeout))
+                await pc.setRemoteDescription(RTCSessionDescription(sdp=answer['sdp'], type=answer['type']))
+
+                await asyncio.wait_for(self._first_frame.wait(), self.join_timeout)
+                self.join_latency = time.perf_counter() - started
+                self._connected.set()
+
+                await self._stop.wait()
+                await self._collect_stats(pc)
+        except Exception as e:
+            self.error = repr(e)
+        finally:
+            self._connected.set()
+            if consumer:
+                consumer.cancel()
+            await pc.close()
+
+    async def _consume(self, track):
+        while True:
+            try:
+                await track.recv()
+            except MediaStreamError:
+                return
+            self.frames += 1
+            self._first_frame.set()
+
+    async def _collect_stats(self, pc):
+        for receiver in pc.getReceivers():
+            stats = await receiver.getStats()
+            for report in stats.values():
+                if report.type == 'inbound-rtp':
+                    self.packets_received += report.packetsReceived
+                    self.packets_lost += max(report.packetsLost, 0)
+
+    async def wait_connected(self):
+        await self._connected.wait()
+
+    def stop(self):
+        self._stop.set()
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def sample_server(process, interval):
+    """Return (cpu percent, rss bytes) for the server over a short interval."""
+    if process is None:
+        return None, None
+    process.cpu_percent(None)
+    time.sleep(interval)
+    return process.cpu_percent(None), process.memory_info().rss
+
+
+async def run_step(args, count, server, baseline_rss):
+    listeners = [SyntheticListener(args.url, args.join_timeout) for _ in range(count)]
+    tasks = []
+    for listener in listeners:
+        tasks.append(asyncio.ensure_future(listener.run()))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / count)
+    await asyncio.gather(*(listener.wait_connected() for listener in listeners))
+
+    await asyncio.sleep(args.hold)
+    loop = asyncio.get_event_loop()
+    cpu, rss = await loop.run_in_executor(None, sample_server, server, args.sample)
+
+    for listener in listeners:
+        listener.stop()
+    await asyncio.gather(*tasks)
+
+    joined = [listener for listener in listeners if listener.error is None]
+    latencies = [listener.join_latency for listener in joined]
+    received = sum(listener.packets_received for listener in joined)
+    lost = sum(listener.packets_lost for listener in joined)
+
+    return {
+        'listeners': count,
+        'joined': len(joined),
+        'failed': count - len(joined),
+        'join_p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'join_p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'server_cpu_percent': cpu,
+        'cpu_per_listener': round(cpu / len(joined), 3) if cpu is not None and joined else None,
+        'mem_per_pc_kb': round((rss - baseline_rss) / len(joined) / 1024, 1) if rss and joined else None,
+        'packet_loss_percent': round(lost / (received + lost) * 100, 3) if received + lost else None,
+        'errors': sorted({listener.error for listener in listeners if listener.error})[:3]
+    }
+
+
+def print_table(results):
+    columns = ['listeners', 'joined', 'failed', 'join_p50_ms', 'join_p95_ms',
+               'server_cpu_percent', 'cpu_per_listener', 'mem_per_pc_kb', 'packet_loss_percent']
+    print('| ' + ' | '.join(columns) + ' |')
+    print('|' + '---|' * len(columns))
+    for row in results:
+        print('| ' + ' | '.join('-' if row[c] is None else str(row[c]) for c in columns) + ' |')
+
+
+async def main(args):
+    server = psutil.Process(args.server_pid) if args.server_pid else None
+    if server is None:
+        print("No --server-pid given: CPU and memory per listener will not be reported", file=sys.stderr)
+    baseline_rss = server.memory_info().rss if server else None
+
+    results = []
+    for count in args.steps:
+        print(f"Running step with {count} listeners...", file=sys.stderr)
+        result = await run_step(args, count, server, baseline_rss)
+        results.append(result)
+        if result['errors']:
+            print(f"  errors: {result['errors']}", file=sys.stderr)
+        if args.max_loss is not None and (result['packet_loss_percent'] or 0) > args.max_loss:
+            print(f"  packet loss above {args.max_loss}%, stopping", file=sys.stderr)
+            break
+        # Let the server release the previous step's peer connections
+        await asyncio.sleep(args.cooldown)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Baraza WebRTC listener capacity test')
+    parser.add_argument('--url', required=True, help='WebSocket URL, e.g. ws://localhost:5000/ws/baraza/<space_id>')
+    parser.add_argument('--token', required=True, help='Access token the listeners connect with')
+    parser.add_argument('--steps', type=lambda s: [int(n) for n in s.split(',')], default=[10, 25, 50, 100],
+                        help='Comma-separated listener counts for the capacity curve')
+    parser.add_argument('--hold', type=float, default=15.0, help='Seconds to hold each step before measuring')
+    parser.add_argument('--ramp', type=float, default=5.0, help='Seconds over which listeners are started')
+    parser.add_argument('--sample', type=float, default=2.0, help='Seconds to sample server CPU over')
+    parser.add_argument('--cooldown', type=float, default=5.0, help='Seconds between steps')
+    parser.add_argument('--join-timeout', type=float, default=20.0, help='Seconds before a join is counted as failed')
+    parser.add_argument('--server-pid', type=int, help='PID of the Baraza server process to sample')
+    parser.add_argument('--max-loss', type=float, help='Stop once packet loss exceeds this percentage')
+    parser.add_argument('--output', help='Write the capacity curve as JSON to this file')
+    args = parser.parse_args()
+    args.url += ('&' if '?' in args.url else '?') + urlencode({'access_token': args.token})
+    asyncio.run(main(args))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for EncryptionManager asymmetric encryption.
+
+Compares direct RSA-4096 OAEP with the hybrid RSA + AES-GCM mode for
+single values of increasing size.
+
+Usage:
+    python scripts/benchmark_asymmetric_encryption.py --iterations 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from security.encryption_manager import encryption_manager
+
+
+def timed(iterations, fn):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def single_values(args):
+    print(f"{'payload':<10} {'mode':<8} {'size':>8} {'encrypt us':>12} {'decrypt us':>12}")
+    for size in (32, 256, 446, 4096, 65536):
+        payload = os.urandom(size // 2).hex()
+        for hybrid in (False, True):
+            mode = 'hybrid' if hybrid else 'rsa'
+            try:
+                token = encryption_manager.encrypt_asymmetric(payload, hybrid=hybrid)
+            except ValueError:
+                print(f"{size:<10} {mode:<8} {'too large for RSA-OAEP':>34}")
+                continue
+            encrypt_us = timed(args.iterations, lambda: encryption_manager.encrypt_asymmetric(payload, hybrid=hybrid))
+            decrypt_us = timed(max(1, args.iterations // 10), lambda: encryption_manager.decrypt_asymmetric(token))
+            print(f"{size:<10} {mode:<8} {len(token):>8} {encrypt_us:>12,.0f} {decrypt_us:>12,.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Asymmetric encryption micro-benchmarks')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    single_values(args)
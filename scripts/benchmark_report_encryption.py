@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Size and throughput benchmark for report content encryption.
+
+Compares the previous Fernet levels (standard, and military_grade which
+runs Fernet twice) with envelope encryption at the standard and high
+levels. Decryption is measured with a cold data key cache (every token
+unwrapped) and a warm one (the same reports read again).
+
+Usage:
+    python scripts/benchmark_report_encryption.py --reports 5000 --size 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from security.envelope_encryption import EnvelopeCipher
+
+
+def fernet_levels(key):
+    fernet = Fernet(key)
+    standard = (
+        lambda data: fernet.encrypt(data).decode(),
+        lambda token: fernet.decrypt(token.encode())
+    )
+    double = (
+        lambda data: fernet.encrypt(fernet.encrypt(data)).decode(),
+        lambda token: fernet.decrypt(fernet.decrypt(token.encode()))
+    )
+    return standard, double
+
+
+def run(name, encrypt, decrypt, corpus):
+    started = time.perf_counter()
+    tokens = [encrypt(data) for data in corpus]
+    encrypt_rate = len(corpus) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for token in tokens:
+        decrypt(token)
+    decrypt_rate = len(corpus) / (time.perf_counter() - started)
+
+    plaintext = sum(len(data) for data in corpus)
+    ciphertext = sum(len(token) for token in tokens)
+    print(f"{name:<32} {ciphertext / plaintext:>6.2f}x {encrypt_rate:>12,.0f} enc/s {decrypt_rate:>12,.0f} dec/s")
+
+
+def main(args):
+    corpus = [os.urandom(args.size // 2).hex().encode() for _ in range(args.reports)]
+    print(f"{args.reports} reports of {args.size} bytes, ciphertext size relative to plaintext\n")
+
+    standard, double = fernet_levels(Fernet.generate_key())
+    run('fernet standard', *standard, corpus)
+    run('fernet military_grade', *double, corpus)
+
+    master_key = Fernet.generate_key()
+    for level in ('standard', 'high'):
+        # Cold: no data key cache, every decrypt unwraps its key
+        cold = EnvelopeCipher(master_key, cache_size=0)
+        run(f'envelope {level} (cold cache)', lambda d: cold.encrypt(d, level), cold.decrypt, corpus)
+
+        warm = EnvelopeCipher(master_key, cache_size=args.reports)
+        run(f'envelope {level} (warm cache)', lambda d: warm.encrypt(d, level), warm.decrypt, corpus)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report encryption size and throughput benchmark')
+    parser.add_argument('--reports', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=2000, help='Plaintext bytes per report')
+    main(parser.parse_args())
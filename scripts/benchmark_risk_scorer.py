@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for anonymous report risk scoring.
+
+Compares the previous per-keyword substring scan (as it was, and extended
+to the same keyword coverage as the new scorer) with the compiled
+Aho-Corasick scorer (the pyahocorasick C automaton when installed, and
+the pure-Python substring fallback) on a bulk corpus of synthetic report
+text.
+
+Usage:
+    python scripts/benchmark_risk_scorer.py --reports 20000 --words 120
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import risk_scoring
+from risk_scoring import KeywordAutomaton, RiskScorer
+
+FILLER = (
+    'the county office said funds for the road project were released last year but '
+    'residents say nothing has been done and officials refused to answer questions '
+    'wananchi wanasema mradi huu haujakamilika na viongozi hawajibu maswali yetu'
+).split()
+
+
+def legacy_score(content, category):
+    """The original calculate_risk_score, kept here for comparison"""
+    risk_keywords = {
+        'corruption': ['bribe', 'kickback', 'fraud', 'embezzlement', 'corrupt'],
+        'human_rights': ['abduction', 'killing', 'torture', 'detention', 'brutality'],
+        'tribalism': ['tribal', 'ethnic', 'discrimination', 'hate', 'incitement'],
+        'mismanagement': ['misappropriation', 'delay', 'failure', 'negligence']
+    }
+    base_risk = {'corruption': 7.0, 'human_rights': 9.0, 'tribalism': 8.0, 'mismanagement': 6.0}
+    score = base_risk.get(category, 5.0)
+    for cat, keywords in risk_keywords.items():
+        if category == cat:
+            matches = sum(1 for keyword in keywords if keyword.lower() in content.lower())
+            score += min(matches * 0.5, 2.0)
+    return min(score, 10.0)
+
+
+def legacy_all_categories(keywords):
+    """The original approach extended to every category and language"""
+    def score(content, category):
+        return {cat: [keyword for keyword in terms if keyword.lower() in content.lower()]
+                for cat, terms in keywords.items()}
+    return score
+
+
+def build_corpus(scorer, reports, words, seed):
+    rng = random.Random(seed)
+    keywords = [keyword for languages in scorer.config['keywords'].values()
+                for terms in languages.values() for keyword in terms]
+    categories = list(scorer.base_risk)
+    corpus = []
+    for _ in range(reports):
+        text = [rng.choice(FILLER) for _ in range(words)]
+        for _ in range(rng.randint(0, 4)):
+            text.insert(rng.randrange(len(text)), rng.choice(keywords).upper() if rng.random() < 0.3 else rng.choice(keywords))
+        corpus.append((' '.join(text), rng.choice(categories)))
+    return corpus
+
+
+def run(name, score, corpus):
+    total_bytes = sum(len(text) for text, _ in corpus)
+    started = time.perf_counter()
+    for text, category in corpus:
+        score(text, category)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<32} {len(corpus) / elapsed:>12,.0f} reports/s {total_bytes / elapsed / 1e6:>8.2f} MB/s")
+
+
+def main(args):
+    compiled = RiskScorer()
+    corpus = build_corpus(compiled, args.reports, args.words, args.seed)
+    print(f"{len(corpus)} reports, {sum(len(t) for t, _ in corpus) / 1e6:.1f} MB of text\n")
+
+    run('legacy scan (own category, en)', legacy_score, corpus)
+    all_keywords = {cat: [keyword for terms in languages.values() for keyword in terms]
+                    for cat, languages in compiled.config['keywords'].items()}
+    run('legacy scan (all categories)', legacy_all_categories(all_keywords), corpus)
+
+    if risk_scoring.ahocorasick is not None:
+        run('aho-corasick (pyahocorasick)', lambda t, c: compiled.score(t, c), corpus)
+
+    # Force the pure-Python fallback for comparison
+    c_module, risk_scoring.ahocorasick = risk_scoring.ahocorasick, None
+    try:
+        pure = RiskScorer()
+    finally:
+        risk_scoring.ahocorasick = c_module
+    run('substring fallback (pure python)', lambda t, c: pure.score(t, c), corpus)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Risk scorer throughput benchmark')
+    parser.add_argument('--reports', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=120, help='Filler words per report')
+    parser.add_argument('--seed', type=int, default=7)
+    main(parser.parse_args())
@@ -2,7 +2,13 @@ from flask import Blueprint, request, jsonify, session
 from security.security_config import security_manager
 from security.encryption_manager import encryption_manager
 from security.audit_logger import audit_logger
-from typing import Dict, Any
+from risk_scoring import risk_scorer, risk_score_to_level
+from evidence_ingest import evidence_pipeline
+from ngo_outbox import notification_dispatcher
+from api.ngo_escalation import ngo_manager
+from database.models import SensitiveReport, EvidenceFile
+from typing import Dict, Any, List
+import hashlib
 import uuid
 from datetime import datetime, timedelta
 import logging
@@ -10,8 +16,18 @@ import logging
 anonymous_bp = Blueprint('anonymous', __name__)
 logger = logging.getLogger(__name__)
 
+def get_db():
+    """Get database instance to avoid circular imports"""
+    from main import db
+    return db
+
+@anonymous_bp.record_once
+def init_evidence_pipeline(state):
+    evidence_pipeline.init_app(state.app, get_db())
+
 @anonymous_bp.route('/api/anonymous/report', methods=['POST'])
 def submit_anonymous_report():
+    reserved = 0
     try:
         # Generate session token for anonymous user
         session_token = security_manager.generate_session_token()
@@ -26,39 +42,52 @@ def submit_anonymous_report():
         if not category or not content:
             return jsonify({'error': 'Category and content are required'}), 400
 
+        # Evidence is held in memory until processed, so refuse it while the pipeline is full
+        evidence_pipeline.sweep_if_due()
+        if evidence_files:
+            if not evidence_pipeline.reserve(len(evidence_files)):
+                response = jsonify({'error': 'Evidence uploads are busy, please retry shortly'})
+                response.headers['Retry-After'] = '30'
+                return response, 503
+            reserved = len(evidence_files)
+
         # Calculate risk score (simplified AI assessment)
         risk_score = calculate_risk_score(content, category)
 
         # Encrypt sensitive content
         encrypted_content = security_manager.encrypt_sensitive_data(
             content,
-            level='military_grade' if risk_score > 8.0 else 'standard'
+            level='high' if risk_score > 8.0 else 'standard'
         )
 
         # Generate report ID
         report_id = security_manager.generate_report_id()
 
-        # Create database entry
-        report_data = {
-            'report_id': report_id,
-            'category': category,
-            'encrypted_content': encrypted_content,
-            'risk_score': risk_score,
-            'session_token': session_token,
-            'submission_method': 'web',
-            'ip_masked': True,
-            'metadata_stripped': True,
-            'status': 'pending'
-        }
-
-        # Store in database (implementation depends on your ORM)
-        # report = SensitiveReport(**report_data)
-        # db.session.add(report)
-        # db.session.commit()
-
-        # Process evidence files
-        for file_data in evidence_files:
-            process_evidence_file(file_data, report_id)
+        # Store in database
+        db = get_db()
+        report = SensitiveReport(
+            report_id=report_id,
+            encrypted_content=encrypted_content.encode(),
+            content_hash=hashlib.sha256(content.encode()).hexdigest(),
+            risk_level=risk_score_to_level(risk_score),
+            category=category,
+            status='pending',
+            ip_hash=security_manager.hash_ip(request.remote_addr) if request.remote_addr else None
+        )
+        db.session.add(report)
+        # Evidence rows are committed as queued before the upload is acknowledged
+        evidence_rows = evidence_pipeline.queue(report, evidence_files) if evidence_files else []
+        # Escalation notifications are committed with the report and delivered in the background
+        escalated = ngo_manager.evaluate_and_escalate(report_id, risk_score, category,
+                                                    session=db.session, report=report)
+        db.session.commit()
+        if escalated:
+            notification_dispatcher.wake()
+
+        # Evidence is stripped, encrypted and stored in the background
+        if evidence_files:
+            reserved = 0
+            process_evidence_files(evidence_files, evidence_rows, report)
 
         # Log submission (without sensitive data)
         logger.info(f"Anonymous report submitted: {report_id}, category: {category}, risk: {risk_score}")
@@ -67,32 +96,23 @@ def submit_anonymous_report():
             'report_id': report_id,
             'status': 'submitted',
             'risk_level': get_risk_level(risk_score),
+            'evidence_files': len(evidence_files),
             'next_steps': 'Your report will be reviewed by our moderation team'
         }), 201
 
     except Exception as e:
+        if reserved:
+            evidence_pipeline.cancel(reserved)
         logger.error(f"Error submitting anonymous report: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 def calculate_risk_score(content: str, category: str) -> float:
     """Calculate risk score based on content analysis"""
-    risk_keywords = {
-        'corruption': ['bribe', 'kickback', 'fraud', 'embezzlement', 'corrupt'],
-        'human_rights': ['abduction', 'killing', 'torture', 'detention', 'brutality'],
-        'tribalism': ['tribal', 'ethnic', 'discrimination', 'hate', 'incitement'],
-        'mismanagement': ['misappropriation', 'delay', 'failure', 'negligence']
-    }
-
-    base_risk = {'corruption': 7.0, 'human_rights': 9.0, 'tribalism': 8.0, 'mismanagement': 6.0}
-    score = base_risk.get(category, 5.0)
-
-    # Increase score based on keyword matches
-    for cat, keywords in risk_keywords.items():
-        if category == cat:
-            matches = sum(1 for keyword in keywords if keyword.lower() in content.lower())
-            score += min(matches * 0.5, 2.0)  # Cap at +2.0
+    return assess_risk(content, category)['score']
 
-    return min(score, 10.0)
+def assess_risk(content: str, category: str) -> Dict[str, Any]:
+    """Score content against every category, with per-category keyword hits"""
+    return risk_scorer.score(content, category)
 
 def get_risk_level(score: float) -> str:
     if score >= 8.5:
@@ -104,30 +124,55 @@ def get_risk_level(score: float) -> str:
     else:
         return 'low'
 
-def process_evidence_file(file_data: Dict[str, Any], report_id: str):
-    """Process and store evidence files securely"""
-    # Implementation for file processing
-    # - Encrypt file
-    # - Generate hash
-    # - Store metadata
-    # - Create database entry
-    pass
+def process_evidence_files(evidence_files: List[Dict[str, Any]], evidence_rows: List[EvidenceFile],
+                           report: SensitiveReport):
+    """
+    Hand evidence files to the ingest pipeline.
+
+    Each file is {'filename', 'content_type', 'data'} with base64 data, and
+    evidence_rows are their committed rows from evidence_pipeline.queue.
+    Metadata stripping, hashing, encryption and storage run on the
+    pipeline's worker pool, so this returns without touching the file bytes.
+    """
+    evidence_pipeline.submit(report.report_id, evidence_rows, evidence_files)
+
+def get_evidence_progress(report: SensitiveReport) -> List[Dict[str, Any]]:
+    """Per-file evidence progress, falling back to stored rows once it expires"""
+    progress = evidence_pipeline.progress(report.report_id)
+    if progress is not None:
+        return progress
+
+    # Rows left queued by a stopped process would otherwise never finish
+    evidence_pipeline.sweep_if_due()
+    rows = get_db().session.query(EvidenceFile.filename, EvidenceFile.file_size, EvidenceFile.status).filter_by(
+        report_id=report.id).order_by(EvidenceFile.id).all()
+    return [
+        {'index': index, 'filename': row.filename, 'state': row.status,
+         'size': row.file_size if row.status == 'stored' else None}
+        for index, row in enumerate(rows)
+    ]
+
+def evidence_is_complete(evidence: List[Dict[str, Any]]) -> bool:
+    """True once every file is stored or failed; no files on record is never complete"""
+    return bool(evidence) and all(entry['state'] in ('stored', 'failed') for entry in evidence)
 
 @anonymous_bp.route('/api/anonymous/status/<report_id>', methods=['GET'])
 def get_report_status(report_id: str):
     """Get status of anonymous report"""
     try:
-        # Implementation to retrieve report status
-        # report = SensitiveReport.query.filter_by(report_id=report_id).first()
+        report = SensitiveReport.query.filter_by(report_id=report_id).first()
 
-        # if not report:
-        #     return jsonify({'error': 'Report not found'}), 404
+        if not report:
+            return jsonify({'error': 'Report not found'}), 404
 
+        evidence = get_evidence_progress(report)
         return jsonify({
             'report_id': report_id,
-            'status': 'pending',  # Would come from database
-            'submitted_at': '2024-01-01T00:00:00Z',  # Would come from database
-            'estimated_review_time': '24-48 hours'
+            'status': report.status,
+            'submitted_at': report.created_at.isoformat() + 'Z' if report.created_at else None,
+            'estimated_review_time': '24-48 hours',
+            'evidence': evidence,
+            'evidence_complete': evidence_is_complete(evidence)
         })
 
     except Exception as e:
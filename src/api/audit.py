@@ -0,0 +1,129 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import tuple_
+from datetime import datetime
+import base64
+import json
+import os
+
+from database.models import AdminAuditLog, SensitiveReport, User
+from security.audit_logger import audit_logger
+
+audit_bp = Blueprint('audit', __name__)
+
+DEFAULT_PAGE_SIZE = int(os.getenv('AUDIT_QUERY_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('AUDIT_QUERY_MAX_PAGE_SIZE', '500'))
+
+
+def get_db():
+    """Get database instance to avoid circular imports"""
+    from main import db
+    return db
+
+
+def encode_cursor(log: AdminAuditLog) -> str:
+    raw = json.dumps([log.timestamp.isoformat(), log.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Return (timestamp, id) of the last row of the previous page"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    timestamp, log_id = json.loads(raw)
+    return datetime.fromisoformat(timestamp), int(log_id)
+
+
+def _parse_time(name: str):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+
+def query_audit_logs(admin_id: str = None, report_pk: int = None, action: str = None,
+                     since: datetime = None, until: datetime = None, errors_only: bool = False,
+                     after=None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    One page of AdminAuditLog rows, newest first.
+
+    Every filter is an equality or range on a column that leads one of the
+    (column, timestamp, id) indexes, and pages continue from the (timestamp,
+    id) of the previous page's last row instead of an OFFSET, so a page
+    costs the same however deep the investigation goes. Returns (rows,
+    has_more).
+    """
+    query = AdminAuditLog.query
+    if admin_id is not None:
+        query = query.filter(AdminAuditLog.admin_id == admin_id)
+    if report_pk is not None:
+        query = query.filter(AdminAuditLog.report_id == report_pk)
+    if action is not None:
+        query = query.filter(AdminAuditLog.action == action)
+    if errors_only:
+        query = query.filter(AdminAuditLog.is_error.is_(True))
+    if since is not None:
+        query = query.filter(AdminAuditLog.timestamp >= since)
+    if until is not None:
+        query = query.filter(AdminAuditLog.timestamp < until)
+    if after is not None:
+        query = query.filter(tuple_(AdminAuditLog.timestamp, AdminAuditLog.id) < tuple_(*after))
+
+    rows = query.order_by(AdminAuditLog.timestamp.desc(), AdminAuditLog.id.desc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+@audit_bp.route('/logs', methods=['GET'])
+@jwt_required()
+def get_audit_logs():
+    """
+    Search admin audit records.
+
+    Query parameters: admin_id, report_id (the public report ID), action,
+    since and until (ISO 8601; since inclusive, until exclusive),
+    errors_only, limit and cursor (next_cursor of the previous page).
+    Only profiles with the admin role may search.
+    """
+    user = get_db().session.get(User, get_jwt_identity())
+    if user is None or user.role != 'admin':
+        return jsonify({'success': False, 'error': 'Admin role required'}), 403
+
+    try:
+        since, until = _parse_time('since'), _parse_time('until')
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'error': f'Invalid query parameter: {e}'}), 400
+
+    report_pk = None
+    if request.args.get('report_id'):
+        report = get_db().session.query(SensitiveReport.id).filter_by(report_id=request.args['report_id']).first()
+        if report is None:
+            return jsonify({'success': True, 'logs': [], 'next_cursor': None})
+        report_pk = report.id
+
+    # Searching the audit trail is itself an audited action
+    audit_logger.log_admin_action(
+        admin_user_id=get_jwt_identity(),
+        action='search_audit_logs',
+        target_resource='admin_audit_logs',
+        details={
+            'ip_address': request.remote_addr,
+            'user_agent': request.headers.get('User-Agent'),
+            'report_pk': report_pk,
+            'filters': {key: value for key, value in request.args.items() if key != 'cursor'}
+        }
+    )
+
+    logs, has_more = query_audit_logs(
+        admin_id=request.args.get('admin_id'),
+        report_pk=report_pk,
+        action=request.args.get('action'),
+        since=since,
+        until=until,
+        errors_only=request.args.get('errors_only', 'false').lower() == 'true',
+        after=after,
+        limit=limit
+    )
+    return jsonify({
+        'success': True,
+        'logs': [log.to_dict() for log in logs],
+        'next_cursor': encode_cursor(logs[-1]) if has_more else None
+    })
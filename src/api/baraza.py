@@ -1,5 +1,7 @@
 from flask import Blueprint, request, jsonify, g
 from database.models import BarazaSpace, BarazaParticipant, BarazaRecording
+from baraza_presence import presence_tracker
+from baraza_join_buffer import join_buffer
 from datetime import datetime
 import uuid
 
@@ -10,6 +12,10 @@ def get_db():
     from main import db
     return db
 
+@baraza_bp.record_once
+def init_join_buffer(state):
+    join_buffer.init_app(state.app, get_db())
+
 @baraza_bp.route('/create', methods=['POST'])
 def create_space():
     data = request.json
@@ -42,6 +48,8 @@ def create_space():
     )
     db.session.add(participant)
     db.session.commit()
+    join_buffer.cache_space(space_id, space.id)
+    presence_tracker.join(space_id, host_user_id)
 
     return jsonify({'space_id': space_id, 'message': 'Baraza space created successfully'}), 201
 
@@ -52,21 +60,35 @@ def join_space():
     user_id = data.get('user_id')
     role = data.get('role', 'listener')
 
-    space = BarazaSpace.query.filter_by(space_id=space_id, is_live=True).first()
-    if not space:
+    space_pk = join_buffer.get_live_space(space_id)
+    if space_pk is None:
         return jsonify({'error': 'Space not found or not live'}), 404
 
-    participant = BarazaParticipant(
-        space_id=space.id,
-        user_id=user_id,
-        role=role,
-        joined_at=datetime.utcnow()
-    )
+    # Participant rows are written in bulk by the join buffer
+    join_buffer.add(space_pk, user_id, role)
+    presence_tracker.join(space_id, user_id)
+
+    return jsonify({'message': f'User {user_id} joined space {space_id} as {role}'}), 200
+
+@baraza_bp.route('/leave', methods=['POST'])
+def leave_space():
+    data = request.json
+    space_id = data.get('space_id')
+    user_id = data.get('user_id')
+
+    space = BarazaSpace.query.filter_by(space_id=space_id).first()
+    if not space:
+        return jsonify({'error': 'Space not found'}), 404
+
     db = get_db()
-    db.session.add(participant)
+    join_buffer.flush()
+    BarazaParticipant.query.filter_by(space_id=space.id, user_id=user_id, left_at=None).update(
+        {'left_at': datetime.utcnow()}, synchronize_session=False
+    )
     db.session.commit()
+    presence_tracker.leave(space_id, user_id)
 
-    return jsonify({'message': f'User {user_id} joined space {space_id} as {role}'}), 200
+    return jsonify({'message': f'User {user_id} left space {space_id}'}), 200
 
 @baraza_bp.route('/speakers/<space_id>', methods=['GET'])
 def get_speakers(space_id):
@@ -74,6 +96,7 @@ def get_speakers(space_id):
     if not space:
         return jsonify({'error': 'Space not found'}), 404
 
+    join_buffer.flush()
     speakers = BarazaParticipant.query.filter_by(space_id=space.id).filter(BarazaParticipant.role.in_(['host', 'speaker'])).all()
     speaker_list = [{'user_id': sp.user_id, 'role': sp.role} for sp in speakers]
 
@@ -86,7 +109,13 @@ def get_recordings(space_id):
         return jsonify({'error': 'Space not found'}), 404
 
     recordings = BarazaRecording.query.filter_by(space_id=space.id).all()
-    recording_list = [{'recording_url': rec.recording_url, 'created_at': rec.created_at.isoformat()} for rec in recordings]
+    recording_list = [{
+        'recording_url': rec.recording_url,
+        'duration_seconds': rec.duration_seconds,
+        'file_size_bytes': rec.file_size_bytes,
+        'is_complete': rec.is_complete,
+        'created_at': rec.created_at.isoformat()
+    } for rec in recordings]
 
     return jsonify({'recordings': recording_list}), 200
 
@@ -102,6 +131,7 @@ def manage_role():
     if not space:
         return jsonify({'error': 'Space not found or not authorized'}), 404
 
+    join_buffer.flush()
     participant = BarazaParticipant.query.filter_by(space_id=space.id, user_id=target_user_id).first()
     if not participant:
         return jsonify({'error': 'Participant not found'}), 404
@@ -118,16 +148,26 @@ def manage_role():
 @baraza_bp.route('/spaces', methods=['GET'])
 def get_live_spaces():
     db = get_db()
+    if presence_tracker.reconcile_due():
+        reconcile_presence()
+
     spaces = db.session.query(BarazaSpace).filter_by(is_live=True).order_by(BarazaSpace.created_at.desc()).limit(10).all()
-    space_list = []
-    for space in spaces:
-        participant_count = db.session.query(BarazaParticipant).filter_by(space_id=space.id).count()
-        space_list.append({
-            'space_id': space.space_id,
-            'title': space.title,
-            'description': space.description,
-            'host_user_id': space.host_user_id,
-            'participant_count': participant_count,
-            'created_at': space.created_at.isoformat()
-        })
+    participant_counts = presence_tracker.counts(space.space_id for space in spaces)
+    space_list = [{
+        'space_id': space.space_id,
+        'title': space.title,
+        'description': space.description,
+        'host_user_id': space.host_user_id,
+        'participant_count': participant_counts.get(space.space_id, 0),
+        'created_at': space.created_at.isoformat()
+    } for space in spaces]
     return jsonify({'spaces': space_list}), 200
+
+def reconcile_presence():
+    """Resync the presence cache with participants who have not left live spaces"""
+    db = get_db()
+    join_buffer.flush()
+    active_participants = db.session.query(BarazaSpace.space_id, BarazaParticipant.user_id).join(
+        BarazaParticipant, BarazaParticipant.space_id == BarazaSpace.id
+    ).filter(BarazaSpace.is_live == True, BarazaParticipant.left_at.is_(None)).all()
+    presence_tracker.reconcile(active_participants)
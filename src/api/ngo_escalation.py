@@ -1,23 +1,76 @@
-import requests
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import bisect
+import hashlib
+import json
 import logging
-from datetime import datetime, timedelta
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import has_app_context
+from sqlalchemy import and_, bindparam, event, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database.models import EscalationWorkflow, NGOPartner, NGOWebhookDelivery, SensitiveReport
+from ngo_outbox import notification_dispatcher
+from risk_scoring import risk_score_to_level
 
 logger = logging.getLogger(__name__)
 
+PARTNER_RELOAD_SECONDS = float(os.getenv('NGO_PARTNER_RELOAD_SECONDS', '30'))
+WEBHOOK_MAX_BATCH = int(os.getenv('NGO_WEBHOOK_MAX_BATCH', '1000'))
+
+# EscalationWorkflow statuses a partner callback may set
+RESPONSE_STATUSES = {'acknowledged', 'investigating', 'resolved', 'declined'}
+
+def parse_callback_time(value: Optional[str]) -> Optional[datetime]:
+    """A callback's ISO 8601 sent_at as naive UTC, like the other timestamps"""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise TypeError(f"sent_at must be a string, not {type(value).__name__}")
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def hash_api_key(api_key: str) -> str:
+    """Lookup key for a partner API key; partner keys are random, so a plain SHA-256 suffices"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
 class NGOEscalationManager:
-    def __init__(self):
-        self.ngo_partners = self._load_ngo_partners()
+    """
+    Routes escalations to NGO partners.
+
+    Partners come from the NGOPartner table, with the built-in defaults
+    kept for any category no active row handles, and are indexed on load: each
+    category maps to its partners sorted by escalation threshold, and API
+    keys map to partners by their SHA-256. The index is rebuilt when a
+    commit in this process changes NGOPartner, and otherwise when the
+    table's row count or latest updated_at changes, checked at most every
+    PARTNER_RELOAD_SECONDS.
+    """
+    def __init__(self, reload_seconds: float = PARTNER_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._index = self._build_index(self._load_ngo_partners())
+        self._signature = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
 
     def _load_ngo_partners(self) -> Dict[str, Dict[str, Any]]:
-        """Load NGO partner configurations"""
+        """Built-in NGO partner configurations, used until partners are stored in the database"""
         return {
             'knchr': {
                 'name': 'Kenya National Commission on Human Rights',
                 'tier': 1,
                 'api_endpoint': 'https://api.knchr.org/escalation',
                 'api_key': 'your_api_key_here',  # In production, use secure key management
+                'signing_secret': 'your_signing_secret_here',
                 'escalation_threshold': 8.0,
+                'categories': ['human_rights', 'police_brutality', 'tribalism'],
                 'contact_email': 'escalation@knchr.org'
             },
             'transparency_intl': {
@@ -25,53 +78,162 @@ class NGOEscalationManager:
                 'tier': 2,
                 'api_endpoint': 'https://api.tikenya.org/reports',
                 'api_key': 'your_api_key_here',
+                'signing_secret': 'your_signing_secret_here',
                 'escalation_threshold': 7.5,
+                'categories': ['corruption', 'mismanagement', 'electoral'],
                 'contact_email': 'reports@tikenya.org'
             }
         }
 
-    def evaluate_and_escalate(self, report_id: str, risk_score: float, category: str):
-        """Evaluate report and escalate to appropriate NGOs"""
+    def _load_db_partners(self) -> Dict[str, Dict[str, Any]]:
+        """Active partners from the NGOPartner table, keyed by slug"""
+        from security.encryption_manager import encryption_manager
+
+        partners = {}
+        for partner in NGOPartner.query.filter_by(is_active=True).all():
+            try:
+                api_key = encryption_manager._software_decrypt(partner.api_key_encrypted.decode())
+                signing_secret = (encryption_manager._software_decrypt(partner.signing_secret_encrypted.decode())
+                                  if partner.signing_secret_encrypted else None)
+            except Exception as e:
+                logger.error(f"Skipping NGO partner {partner.id}: API key cannot be decrypted: {e}")
+                continue
+            if not partner.categories:
+                logger.warning(f"NGO partner {partner.id} handles no categories and will receive no escalations")
+            partners[partner.slug or f'ngo-{partner.id}'] = {
+                'partner_id': partner.id,
+                'name': partner.name,
+                'tier': partner.tier,
+                'api_endpoint': partner.api_endpoint,
+                'api_key': api_key,
+                'signing_secret': signing_secret,
+                'escalation_threshold': partner.escalation_threshold,
+                'categories': partner.categories or [],
+                'contact_email': partner.contact_email
+            }
+        return partners
+
+    def _with_builtin_fallback(self, partners: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Stored partners, plus the built-in ones for categories no stored partner handles"""
+        covered = {category for ngo in partners.values() for category in ngo['categories']}
+        merged = dict(partners)
+        for ngo_key, ngo in self._load_ngo_partners().items():
+            categories = [category for category in ngo['categories'] if category not in covered]
+            if categories and ngo_key not in merged:
+                merged[ngo_key] = {**ngo, 'categories': categories}
+        return merged
+
+    @staticmethod
+    def _build_index(partners: Dict[str, Dict[str, Any]]) -> Tuple[Dict, Dict, Dict]:
+        routes = {}
+        for ngo_key, ngo in partners.items():
+            for category in ngo['categories']:
+                routes.setdefault(category, []).append((ngo['escalation_threshold'], ngo_key))
+        routes = {
+            category: ([threshold for threshold, _ in entries], [ngo_key for _, ngo_key in entries])
+            for category, entries in ((category, sorted(entries)) for category, entries in routes.items())
+        }
+        api_keys = {hash_api_key(ngo['api_key']): ngo_key for ngo_key, ngo in partners.items()}
+        return partners, routes, api_keys
+
+    @property
+    def ngo_partners(self) -> Dict[str, Dict[str, Any]]:
+        return self._index[0]
+
+    def invalidate(self):
+        """Rebuild the index on next use"""
+        self._stale = True
+
+    def refresh(self, force: bool = False):
+        """Rebuild the routing index if the NGOPartner table changed"""
+        if not (force or self._stale) and time.monotonic() - self._checked_at < self.reload_seconds:
+            return
+        if not has_app_context():
+            return
+        with self._lock:
+            stale, self._stale = self._stale, False
+            self._checked_at = time.monotonic()
+            try:
+                signature = tuple(get_db().session.query(
+                    func.count(NGOPartner.id), func.max(NGOPartner.updated_at)).one())
+                if signature == self._signature and not (force or stale):
+                    return
+                partners = self._load_db_partners()
+            except Exception as e:
+                logger.error(f"Could not load NGO partners: {e}")
+                return
+            self._index = self._build_index(self._with_builtin_fallback(partners))
+            self._signature = signature
+
+    def get_partner(self, ngo_key: str) -> Optional[Dict[str, Any]]:
+        """Partner config by key, used by the notification dispatcher at delivery time"""
+        self.refresh()
+        return self.ngo_partners.get(ngo_key)
+
+    def find_partner_by_api_key(self, api_key: str) -> Optional[Dict[str, Any]]:
+        """Partner authenticated by an API key, without comparing against every partner"""
+        self.refresh()
+        partners, _, api_keys = self._index
+        ngo_key = api_keys.get(hash_api_key(api_key))
+        return {**partners[ngo_key], 'id': ngo_key} if ngo_key is not None else None
+
+    def get_partner_health(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit breaker state and rolling latency/error rate of each partner endpoint"""
+        return {
+            ngo_key: {'name': ngo['name'], 'tier': ngo['tier'],
+                      **notification_dispatcher.breakers.get(ngo_key).get_status()}
+            for ngo_key, ngo in self.ngo_partners.items()
+        }
+
+    def evaluate_and_escalate(self, report_id: str, risk_score: float, category: str,
+                              session=None, report=None) -> Optional[Dict[str, Any]]:
+        """
+        Evaluate report and queue notifications to the appropriate NGOs.
+
+        EscalationWorkflow rows and outbox notifications are added to the
+        given session, so they commit (or roll back) together with the
+        report; the caller commits and then wakes the dispatcher. Without a
+        session they are committed here. report is the SensitiveReport,
+        looked up by report_id if not given.
+        """
         # Determine which NGOs should receive this report
         relevant_ngos = self._get_relevant_ngos(category, risk_score)
 
         if not relevant_ngos:
             logger.info(f"No escalation needed for report {report_id}")
-            return
+            return None
 
-        # Create escalation workflow
-        workflow = self._create_escalation_workflow(report_id, relevant_ngos)
+        # Queue NGO notifications
+        own_session = session is None
+        if own_session:
+            session = get_db().session
 
-        # Notify NGOs
+        # Create escalation workflow
+        workflow = self._create_escalation_workflow(report_id, relevant_ngos, session, report)
         for ngo in relevant_ngos:
-            self._notify_ngo(report_id, ngo, workflow)
+            self._notify_ngo(report_id, ngo, workflow, category, risk_score, session)
+        if own_session:
+            session.commit()
+            notification_dispatcher.wake()
 
         logger.info(f"Escalated report {report_id} to {len(relevant_ngos)} NGOs")
+        return workflow
 
     def _get_relevant_ngos(self, category: str, risk_score: float) -> List[Dict[str, Any]]:
         """Get list of NGOs that should receive this report"""
-        relevant = []
-
-        for ngo_id, ngo_config in self.ngo_partners.items():
-            # Check if risk score meets threshold
-            if risk_score >= ngo_config['escalation_threshold']:
-                # Check if NGO handles this category
-                if self._handles_category(ngo_id, category):
-                    relevant.append({**ngo_config, 'id': ngo_id})
-
-        return relevant
+        self.refresh()
+        partners, routes, _ = self._index
+        thresholds, ngo_keys = routes.get(category, ((), ()))
+        # Partners are sorted by threshold, so the matches are a prefix
+        matched = ngo_keys[:bisect.bisect_right(thresholds, risk_score)]
+        return [{**partners[ngo_key], 'id': ngo_key} for ngo_key in matched]
 
     def _handles_category(self, ngo_id: str, category: str) -> bool:
         """Check if NGO handles specific category"""
-        category_mapping = {
-            'knchr': ['human_rights', 'police_brutality', 'tribalism'],
-            'transparency_intl': ['corruption', 'mismanagement', 'electoral'],
-            'law_society': ['legal', 'human_rights', 'police_brutality']
-        }
-
-        return category in category_mapping.get(ngo_id, [])
+        return category in self.ngo_partners.get(ngo_id, {}).get('categories', ())
 
-    def _create_escalation_workflow(self, report_id: str, ngos: List[Dict]) -> Dict[str, Any]:
+    def _create_escalation_workflow(self, report_id: str, ngos: List[Dict], session,
+                                    report=None) -> Dict[str, Any]:
         """Create escalation workflow tracking"""
         workflow = {
             'report_id': report_id,
@@ -81,73 +243,206 @@ class NGOEscalationManager:
             'responses': {}
         }
 
-        # Store workflow in database
-        # escalation = EscalationWorkflow(**workflow)
-        # db.session.add(escalation)
-        # db.session.commit()
+        # Store one workflow row per partner; built-in partners have no NGOPartner row
+        if report is None:
+            report = session.query(SensitiveReport).filter_by(report_id=report_id).first()
+        if report is not None:
+            for ngo in ngos:
+                if ngo.get('partner_id') is not None:
+                    session.add(EscalationWorkflow(report=report, ngo_id=ngo['partner_id'], status='pending'))
 
         return workflow
 
-    def _notify_ngo(self, report_id: str, ngo: Dict[str, Any], workflow: Dict[str, Any]):
-        """Send notification to NGO"""
+    def record_responses(self, ngo: Dict[str, Any], responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply a batch of callbacks from one partner in a single transaction.
+
+        Callbacks whose delivery_id this partner already sent are skipped, so
+        redelivery is harmless. Matching EscalationWorkflow rows are updated
+        with one executemany statement, and the batch commits once. A
+        callback only applies if its sent_at (the receipt time when the
+        partner sends none) is not older than the response already
+        recorded, so callbacks delivered out of order cannot roll a status
+        back; those are counted as stale.
+        """
+        session = get_db().session
+        result = {'accepted': 0, 'duplicates': 0, 'unmatched': 0, 'stale': 0, 'rejected': []}
+        received_at = datetime.utcnow()
+
+        # Validate and drop repeats within the batch
+        batch = {}
+        for index, item in enumerate(responses):
+            if not isinstance(item, dict):
+                result['rejected'].append({'index': index, 'error': 'Response must be an object'})
+                continue
+            delivery_id, report_id = item.get('delivery_id'), item.get('report_id')
+            status = item.get('status', 'acknowledged')
+            if not isinstance(delivery_id, str) or not delivery_id or len(delivery_id) > 128 \
+                    or not isinstance(report_id, str) or not report_id:
+                result['rejected'].append({'index': index, 'error': 'delivery_id and report_id are required'})
+                continue
+            if status not in RESPONSE_STATUSES:
+                result['rejected'].append({'index': index, 'error': f'Unknown status {status}'})
+                continue
+            try:
+                sent_at = parse_callback_time(item.get('sent_at')) or received_at
+            except (TypeError, ValueError):
+                result['rejected'].append({'index': index, 'error': 'sent_at must be an ISO 8601 timestamp'})
+                continue
+            if delivery_id in batch:
+                result['duplicates'] += 1
+                continue
+            batch[delivery_id] = {**item, 'status': status, 'sent_at': sent_at}
+
+        for attempt in range(2):
+            seen = {row.delivery_id for row in session.query(NGOWebhookDelivery.delivery_id).filter(
+                NGOWebhookDelivery.ngo_key == ngo['id'],
+                NGOWebhookDelivery.delivery_id.in_(list(batch))
+            )} if batch else set()
+            fresh = {delivery_id: item for delivery_id, item in batch.items() if delivery_id not in seen}
+
+            report_pks = dict(session.query(SensitiveReport.report_id, SensitiveReport.id).filter(
+                SensitiveReport.report_id.in_({item['report_id'] for item in fresh.values()})
+            )) if fresh else {}
+            now = datetime.utcnow()
+            updates = []
+            unmatched = 0
+            # Oldest first, so the newest callback for a workflow in this batch is the one left applied
+            for item in sorted(fresh.values(), key=lambda item: item['sent_at']):
+                report_pk = report_pks.get(item['report_id'])
+                if report_pk is None or ngo.get('partner_id') is None:
+                    unmatched += 1
+                    continue
+                updates.append({
+                    'b_report': report_pk, 'b_ngo': ngo['partner_id'], 'b_status': item['status'],
+                    'b_response': json.dumps({'response': item.get('response'),
+                                              'action_taken': item.get('action_taken')}),
+                    'b_received': now, 'b_sent': item['sent_at']
+                })
+
+            try:
+                applied = 0
+                if updates:
+                    table = EscalationWorkflow.__table__
+                    statement = table.update().where(and_(
+                        table.c.report_id == bindparam('b_report'),
+                        table.c.ngo_id == bindparam('b_ngo'),
+                        or_(table.c.response_sent_at.is_(None), table.c.response_sent_at <= bindparam('b_sent'))
+                    )).values(status=bindparam('b_status'), ngo_response=bindparam('b_response'),
+                              response_received=bindparam('b_received'), response_sent_at=bindparam('b_sent'))
+                    if session.get_bind().dialect.supports_sane_multi_rowcount:
+                        applied = session.execute(statement, updates).rowcount
+                    else:
+                        applied = sum(session.execute(statement, update).rowcount for update in updates)
+                if fresh:
+                    session.execute(NGOWebhookDelivery.__table__.insert(), [
+                        {'ngo_key': ngo['id'], 'delivery_id': delivery_id, 'received_at': now}
+                        for delivery_id in fresh
+                    ])
+                session.commit()
+                break
+            except IntegrityError:
+                # Another request recorded some of these deliveries first; recheck once
+                session.rollback()
+                if attempt:
+                    raise
+
+        result['duplicates'] += len(batch) - len(fresh)
+        result['accepted'] = applied
+        result['stale'] = len(updates) - applied
+        result['unmatched'] = unmatched
+        return result
+
+    def _notify_ngo(self, report_id: str, ngo: Dict[str, Any], workflow: Dict[str, Any],
+                    category: str, risk_score: float, session):
+        """Add a notification for an NGO to the outbox"""
+        from database.models import NGONotification
+
         notification_data = {
             'report_id': report_id,
-            'category': 'human_rights',  # Would come from report
-            'risk_level': 'high',  # Would come from report
+            'category': category,
+            'risk_level': risk_score_to_level(risk_score),
             'urgency': 'immediate' if ngo['tier'] == 1 else 'standard',
+            'escalation_date': workflow['escalation_date'],
             'secure_link': f"https://wana.iq/ngo-access/{report_id}",
             'callback_url': 'https://api.wana.iq/ngo/response'
         }
-
-        try:
-            response = requests.post(
-                ngo['api_endpoint'],
-                json=notification_data,
-                headers={'Authorization': f"Bearer {ngo['api_key']}"},
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                logger.info(f"Successfully notified {ngo['name']} about report {report_id}")
-            else:
-                logger.error(f"Failed to notify {ngo['name']}: {response.status_code}")
-
-        except Exception as e:
-            logger.error(f"Error notifying {ngo['name']}: {e}")
+        # Lower tiers are sent as a digest at the end of their window
+        session.add(NGONotification(report_id=report_id, ngo_key=ngo['id'], payload=notification_data,
+                                    next_attempt_at=notification_dispatcher.digest_due_at(ngo['tier'])))
 
 # Initialize escalation manager
 ngo_manager = NGOEscalationManager()
 
+@event.listens_for(NGOPartner, 'after_insert')
+@event.listens_for(NGOPartner, 'after_update')
+@event.listens_for(NGOPartner, 'after_delete')
+def _ngo_partner_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['ngo_partners_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _rebuild_ngo_index_after_commit(session):
+    if session.info.pop('ngo_partners_changed', False):
+        ngo_manager.invalidate()
+
 # Flask routes for NGO integration
 from flask import Blueprint, request, jsonify
 
 ngo_bp = Blueprint('ngo', __name__)
 
+def get_db():
+    """Get database instance to avoid circular imports"""
+    from main import db
+    return db
+
+@ngo_bp.record_once
+def init_notification_dispatcher(state):
+    notification_dispatcher.init_app(state.app, get_db(), ngo_manager.get_partner)
+
+def authenticate_partner() -> Optional[Dict[str, Any]]:
+    """Partner identified by the request's Bearer API key"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return ngo_manager.find_partner_by_api_key(auth_header.split(' ')[1])
+
 @ngo_bp.route('/api/ngo/response', methods=['POST'])
 def handle_ngo_response():
-    """Handle responses from NGO partners"""
+    """
+    Handle responses from NGO partners.
+
+    Accepts one response object or a batch as {"responses": [...]}; each
+    response needs a delivery_id (unique per partner) and a report_id, and
+    may carry status, response, action_taken and sent_at (ISO 8601), which
+    orders callbacks for the same report.
+    """
     try:
-        data = request.get_json()
-        report_id = data.get('report_id')
-        ngo_id = data.get('ngo_id')
-        response = data.get('response')
-        action_taken = data.get('action_taken')
-
-        # Store NGO response
-        # ngo_response = NGOReportResponse(
-        #     report_id=report_id,
-        #     ngo_id=ngo_id,
-        #     response=response,
-        #     action_taken=action_taken
-        # )
-        # db.session.add(ngo_response)
-        # db.session.commit()
-
-        logger.info(f"Received response from NGO {ngo_id} for report {report_id}")
-        return jsonify({'status': 'received'}), 200
+        ngo = authenticate_partner()
+        if ngo is None:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and 'responses' in data:
+            responses = data['responses']
+        elif isinstance(data, dict):
+            responses = [data]
+        else:
+            return jsonify({'error': 'Expected a response object or {"responses": [...]}'}), 400
+        if not isinstance(responses, list):
+            return jsonify({'error': 'responses must be a list'}), 400
+        if len(responses) > WEBHOOK_MAX_BATCH:
+            return jsonify({'error': f'At most {WEBHOOK_MAX_BATCH} responses per request'}), 413
+
+        result = ngo_manager.record_responses(ngo, responses)
+        logger.info(f"Received {len(responses)} response(s) from NGO {ngo['id']}: "
+                    f"{result['accepted']} applied, {result['duplicates']} duplicate, {result['stale']} stale")
+        return jsonify({'status': 'received', **result}), 200
 
     except Exception as e:
         logger.error(f"Error handling NGO response: {e}")
+        get_db().session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
 @ngo_bp.route('/api/ngo/access/<report_id>', methods=['GET'])
@@ -159,14 +454,8 @@ def get_ngo_report_access(report_id: str):
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({'error': 'Unauthorized'}), 401
 
-        api_key = auth_header.split(' ')[1]
-
         # Find NGO by API key
-        ngo = None
-        for ngo_data in ngo_manager.ngo_partners.values():
-            if ngo_data['api_key'] == api_key:
-                ngo = ngo_data
-                break
+        ngo = authenticate_partner()
 
         if not ngo:
             return jsonify({'error': 'Invalid API key'}), 403
@@ -3,6 +3,8 @@ import os
 import uuid
 import json
 import logging
+from datetime import datetime
+import jwt
 from quart import Quart, request, jsonify, websocket
 from quart_cors import cors
 from werkzeug.utils import secure_filename
@@ -12,13 +14,19 @@ from supabase import create_client, Client
 from video_analyzer import VideoAnalyzer
 from audio_manager import AudioManager
 from audio_streaming import AudioStreaming, pcs
+from baraza_recorder import BarazaRecorder
+from baraza_presence import presence_tracker
+from video_storage import VideoStorage
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 UPLOAD_FOLDER = 'uploads'
+RECORDING_ENABLED = os.getenv('BARAZA_RECORDING_ENABLED', 'true').lower() == 'true'
 ALLOWED_EXTENSIONS = {'mp4', 'webm', 'mov', 'jpg', 'jpeg', 'png', 'gif'}
+# Same secret as the Flask API (main.py), which issues the access tokens
+JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
 
 app = Quart(__name__)
 app = cors(app, allow_origin="*") # In production, restrict this to your frontend's origin
@@ -30,12 +38,42 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 # Initialize managers
 video_analyzer = VideoAnalyzer()
 audio_manager = AudioManager()
+recording_storage = VideoStorage(bucket_name="baraza-recordings")
+baraza_recorders = {}
+
 
 # Initialize Supabase
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 supabase: Client = create_client(url, key)
 
+@app.before_serving
+async def check_presence_backend():
+    # Listener joins and disconnects seen here must reach the HTTP API's counts
+    presence_tracker.require_shared()
+
+def jwt_identity(source=None):
+    """
+    Identity of a valid access token issued by the Flask API, or None. The
+    token is read from the Authorization header, or for a WebSocket, whose
+    browser API cannot set headers, from the access_token query parameter.
+    """
+    source = source or request
+    auth_header = source.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        token = auth_header[len('Bearer '):]
+    else:
+        token = source.args.get('access_token') if source is websocket else None
+    if not token:
+        return None
+    try:
+        claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if claims.get('type') != 'access':
+        return None
+    return claims.get('sub')
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -175,8 +213,13 @@ async def get_videos():
 @app.websocket('/ws/baraza/<space_id>')
 async def baraza_stream_ws(space_id):
     """
-    WebSocket endpoint for Baraza audio WebRTC signaling.
+    WebSocket endpoint for Baraza audio WebRTC signaling. The listener is
+    the identity of the access token, never a client-supplied user_id.
     """
+    user_id = jwt_identity(websocket)
+    if user_id is None:
+        return "Authentication required", 401
+
     audio_path = os.path.join(UPLOAD_FOLDER, space_id)  # Example: space_id is the filename or identifier
     audio_track = audio_manager.get_stream_track(space_id, audio_path)
 
@@ -184,7 +227,12 @@ async def baraza_stream_ws(space_id):
         logging.error(f"Baraza space {space_id} not found or failed to create audio track.")
         return
 
-    streamer = AudioStreaming(audio_track)
+    if RECORDING_ENABLED and space_id not in baraza_recorders:
+        recorder = BarazaRecorder(space_id, audio_manager.subscribe_track(space_id), recording_storage)
+        baraza_recorders[space_id] = recorder
+        await recorder.start()
+
+    streamer = AudioStreaming(audio_track, audio_manager.get_quality_tiers(space_id))
     pcs.add(streamer)
     logging.info(f"New listener for Baraza space {space_id}. Total listeners: {len(pcs)}")
 
@@ -201,3 +249,57 @@ async def baraza_stream_ws(space_id):
         if streamer in pcs:
             await streamer.stop_stream()
             pcs.remove(streamer)
+        await mark_listener_left(space_id, str(user_id))
+
+async def mark_listener_left(space_id, user_id):
+    """Drop a disconnected listener from presence and close their participant row."""
+    presence_tracker.leave(space_id, user_id)
+    try:
+        data, count = supabase.table('baraza_spaces').select('id').eq('space_id', space_id).execute()
+        if data[1]:
+            supabase.table('baraza_participants').update({
+                "left_at": datetime.utcnow().isoformat()
+            }).eq('space_id', data[1][0]['id']).eq('user_id', user_id).is_('left_at', 'null').execute()
+    except Exception as e:
+        logging.error(f"Failed to mark {user_id} as left from Baraza space {space_id}: {e}")
+
+@app.route('/api/baraza/<space_id>/end', methods=['POST'])
+async def end_baraza_space(space_id):
+    """
+    Ends a live Baraza space, finalizes its recording and stores the
+    BarazaRecording row once all segments have been uploaded. Only the
+    space's host may end it.
+    """
+    user_id = jwt_identity()
+    if user_id is None:
+        return jsonify({"error": "Authentication required"}), 401
+    try:
+        data, count = supabase.table('baraza_spaces').select('id, host_user_id').eq('space_id', space_id).execute()
+        if not data[1]:
+            return jsonify({"error": "Space not found"}), 404
+        if data[1][0]['host_user_id'] != str(user_id):
+            return jsonify({"error": "Only the host can end this space"}), 403
+        space_pk = data[1][0]['id']
+
+        # Kept until stop() succeeds, so a retry can still publish the recording
+        recorder = baraza_recorders.get(space_id)
+        summary = await recorder.stop() if recorder else None
+        baraza_recorders.pop(space_id, None)
+        audio_manager.remove_stream_track(space_id)
+        presence_tracker.end_space(space_id)
+
+        supabase.table('baraza_spaces').update({
+            "is_live": False,
+            "ended_at": datetime.utcnow().isoformat()
+        }).eq('id', space_pk).execute()
+
+        recording_url = None
+        if summary:
+            supabase.table('baraza_recordings').insert({"space_id": space_pk, **summary}).execute()
+            recording_url = summary['recording_url']
+            logging.info(f"Stored recording for Baraza space {space_id}: {recording_url}")
+
+        return jsonify({"message": "Baraza space ended", "recording_url": recording_url}), 200
+    except Exception as e:
+        logging.error(f"Error ending Baraza space {space_id}: {e}", exc_info=True)
+        return jsonify({"error": "Failed to end space"}), 500
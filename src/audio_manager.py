@@ -1,6 +1,7 @@
 import logging
 import os
 from aiortc.contrib.media import MediaPlayer, MediaRelay
+from audio_quality import SpaceQualityTiers
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -12,6 +13,7 @@ class AudioManager:
         self._streams = {}
         self._relays = {}
         self._players = {}
+        self._tiers = {}
 
     def get_stream_track(self, space_id, audio_path):
         """
@@ -36,6 +38,26 @@ class AudioManager:
 
         return self._streams.get(space_id)
 
+    def subscribe_track(self, space_id):
+        """
+        Returns an additional relay subscription for an existing stream,
+        e.g. so the space can be recorded alongside its listeners.
+        """
+        if space_id not in self._relays:
+            return None
+        return self._relays[space_id].subscribe(self._players[space_id].audio)
+
+    def get_quality_tiers(self, space_id):
+        """
+        Returns the pre-encoded Opus quality tiers for an existing stream,
+        creating them on first use.
+        """
+        if space_id not in self._relays:
+            return None
+        if space_id not in self._tiers:
+            self._tiers[space_id] = SpaceQualityTiers(self._relays[space_id], self._players[space_id].audio)
+        return self._tiers[space_id]
+
     def remove_stream_track(self, space_id):
         """
         Cleans up an audio stream when it's no longer needed.
@@ -47,3 +69,6 @@ class AudioManager:
             del self._streams[space_id]
             del self._relays[space_id]
             del self._players[space_id]
+            tiers = self._tiers.pop(space_id, None)
+            if tiers:
+                tiers.stop()
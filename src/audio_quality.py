@@ -0,0 +1,164 @@
+import asyncio
+import collections
+import logging
+import os
+from fractions import Fraction
+
+from av import AudioResampler, CodecContext
+from aiortc import MediaStreamTrack
+from aiortc.contrib.media import MediaRelay
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SAMPLE_RATE = 48000
+SAMPLES_PER_FRAME = 960  # 20ms Opus frames
+TIME_BASE = Fraction(1, SAMPLE_RATE)
+
+# Ordered from best to worst; listeners start on DEFAULT_TIER
+QUALITY_TIERS = collections.OrderedDict([
+    ('high', 64000),
+    ('medium', 32000),
+    ('low', 16000),
+])
+DEFAULT_TIER = os.getenv('BARAZA_DEFAULT_TIER', 'medium')
+
+STATS_INTERVAL_SECONDS = 2.0
+DOWNGRADE_LOSS = 0.05        # fraction of packets lost in the last RTCP interval
+DOWNGRADE_JITTER = 0.030     # seconds
+UPGRADE_LOSS = 0.01
+UPGRADE_JITTER = 0.010
+DOWNGRADE_AFTER = 2          # consecutive congested reports
+UPGRADE_AFTER = 5            # consecutive clean reports
+
+
+class OpusTierTrack(MediaStreamTrack):
+    """
+    Encodes a space's audio once at a fixed Opus bitrate and yields the
+    encoded packets. aiortc senders pack pre-encoded packets as-is, so the
+    encode cost is paid per tier rather than per listener.
+    """
+    kind = "audio"
+
+    def __init__(self, source, bitrate):
+        super().__init__()
+        self.source = source
+        self.bitrate = bitrate
+        self.codec = CodecContext.create('libopus', 'w')
+        self.codec.bit_rate = bitrate
+        self.codec.format = 's16'
+        self.codec.layout = 'stereo'
+        self.codec.options = {'application': 'voip'}
+        self.codec.sample_rate = SAMPLE_RATE
+        self.codec.time_base = TIME_BASE
+        self.resampler = AudioResampler(format='s16', layout='stereo', rate=SAMPLE_RATE,
+                                        frame_size=SAMPLES_PER_FRAME)
+        self._packets = collections.deque()
+
+    async def recv(self):
+        while not self._packets:
+            frame = await self.source.recv()
+            for resampled in self.resampler.resample(frame):
+                for packet in self.codec.encode(resampled):
+                    packet.time_base = TIME_BASE
+                    self._packets.append(packet)
+        return self._packets.popleft()
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+
+
+class SpaceQualityTiers:
+    """
+    The set of pre-encoded Opus tiers for one Baraza space. Each tier is
+    relayed so any number of listeners can subscribe to it.
+    """
+    def __init__(self, player_relay, audio_source):
+        self._tracks = {}
+        self._relays = {}
+        for tier, bitrate in QUALITY_TIERS.items():
+            # Unbuffered so an idle tier holds at most one frame
+            source = player_relay.subscribe(audio_source, buffered=False)
+            self._tracks[tier] = OpusTierTrack(source, bitrate)
+            self._relays[tier] = MediaRelay()
+
+    def subscribe(self, tier):
+        return self._relays[tier].subscribe(self._tracks[tier])
+
+    def stop(self):
+        for track in self._tracks.values():
+            track.stop()
+
+
+def next_tier(tier, step):
+    """Return the tier step places worse (+1) or better (-1), clamped."""
+    tiers = list(QUALITY_TIERS)
+    index = min(max(tiers.index(tier) + step, 0), len(tiers) - 1)
+    return tiers[index]
+
+
+class ListenerQualityController:
+    """
+    Watches RTCP receiver reports for one listener and moves them between
+    quality tiers. A congested listener drops to a lower bitrate instead of
+    stalling, and is moved back up once reports stay clean for a while.
+    """
+    def __init__(self, sender, tiers, tier=DEFAULT_TIER):
+        self.sender = sender
+        self.tiers = tiers
+        self.tier = tier
+        self._congested_reports = 0
+        self._clean_reports = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+            try:
+                stats = await self.sender.getStats()
+            except Exception as e:
+                logging.warning(f"Could not read listener stats: {e}")
+                continue
+            report = next((s for s in stats.values() if s.type == 'remote-inbound-rtp'), None)
+            if report is not None:
+                self.observe(report.fractionLost / 256.0, report.jitter / SAMPLE_RATE)
+
+    def observe(self, loss, jitter):
+        """Feed one receiver report (loss fraction, jitter in seconds)."""
+        if loss > DOWNGRADE_LOSS or jitter > DOWNGRADE_JITTER:
+            self._congested_reports += 1
+            self._clean_reports = 0
+        elif loss < UPGRADE_LOSS and jitter < UPGRADE_JITTER:
+            self._clean_reports += 1
+            self._congested_reports = 0
+        else:
+            self._congested_reports = 0
+            self._clean_reports = 0
+
+        if self._congested_reports >= DOWNGRADE_AFTER:
+            self._switch(next_tier(self.tier, 1))
+        elif self._clean_reports >= UPGRADE_AFTER:
+            self._switch(next_tier(self.tier, -1))
+
+    def _switch(self, tier):
+        self._congested_reports = 0
+        self._clean_reports = 0
+        if tier == self.tier:
+            return
+        logging.info(f"Switching listener from {self.tier} to {tier} quality")
+        old_track = self.sender.track
+        self.sender.replaceTrack(self.tiers.subscribe(tier))
+        if old_track is not None:
+            # The sender may still be awaiting one packet from the old tier;
+            # stopping it right away would end the sender's RTP loop.
+            asyncio.get_event_loop().call_later(1.0, old_track.stop)
+        self.tier = tier
@@ -1,7 +1,8 @@
 import asyncio
 import json
 import logging
-from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
+from aiortc import RTCPeerConnection, RTCRtpSender, RTCSessionDescription, MediaStreamTrack
+from audio_quality import DEFAULT_TIER, ListenerQualityController
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,8 +13,10 @@ class AudioStreaming:
     """
     Manages a WebRTC peer connection for a single audio streaming client in Baraza.
     """
-    def __init__(self, audio_track: MediaStreamTrack):
+    def __init__(self, audio_track: MediaStreamTrack, quality_tiers=None):
         self.audio_track = audio_track
+        self.quality_tiers = quality_tiers
+        self.quality_controller = None
         self.pc = RTCPeerConnection()
         self.pc.on("connectionstatechange", self.on_connection_state_change)
 
@@ -31,7 +34,14 @@ class AudioStreaming:
         await self.pc.setRemoteDescription(offer)
 
         # Add the audio track to the connection
-        if self.audio_track:
+        if self.quality_tiers:
+            # Listeners get a pre-encoded Opus tier and are moved between
+            # tiers based on their RTCP receiver reports.
+            sender = self.pc.addTrack(self.quality_tiers.subscribe(DEFAULT_TIER))
+            self._prefer_opus(sender)
+            self.quality_controller = ListenerQualityController(sender, self.quality_tiers)
+            self.quality_controller.start()
+        elif self.audio_track:
             self.pc.addTrack(self.audio_track)
 
         # Create and return answer
@@ -40,6 +50,16 @@ class AudioStreaming:
 
         return {"sdp": self.pc.localDescription.sdp, "type": self.pc.localDescription.type}
 
+    def _prefer_opus(self, sender):
+        """Pre-encoded tiers are Opus, so only negotiate Opus for this sender."""
+        opus = [codec for codec in RTCRtpSender.getCapabilities("audio").codecs
+                if codec.mimeType.lower() == "audio/opus"]
+        for transceiver in self.pc.getTransceivers():
+            if transceiver.sender is sender:
+                transceiver.setCodecPreferences(opus)
+
     async def stop_stream(self):
         logging.info("Closing audio peer connection")
+        if self.quality_controller:
+            self.quality_controller.stop()
         await self.pc.close()
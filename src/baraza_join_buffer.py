@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from baraza_presence import presence_tracker
+from database.models import BarazaSpace, BarazaParticipant
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_MS = int(os.getenv('BARAZA_JOIN_FLUSH_MS', '250'))
+MAX_BATCH_SIZE = int(os.getenv('BARAZA_JOIN_MAX_BATCH', '500'))
+SPACE_CACHE_TTL_SECONDS = int(os.getenv('BARAZA_SPACE_CACHE_TTL', '5'))
+
+
+class JoinBuffer:
+    """
+    Buffers Baraza participant joins and writes them in bulk.
+
+    Joins are validated against a short-lived cache of live spaces and kept
+    in memory keyed by (space, user), so repeated joins from the same user
+    collapse into one pending row. A background thread flushes the buffer
+    every FLUSH_INTERVAL_MS, inserting only users without an open
+    participant row, so a rejoin after leaving gets a fresh row while a
+    duplicate join does not. A space ended by the WebSocket server is seen
+    through the shared presence backend before its cache entry expires. A
+    chunk that violates a constraint is retried row by row, and the rows
+    that still fail are dropped instead of blocking the rest.
+    """
+    def __init__(self, flush_interval_ms=FLUSH_INTERVAL_MS, max_batch_size=MAX_BATCH_SIZE,
+                 space_cache_ttl=SPACE_CACHE_TTL_SECONDS):
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.space_cache_ttl = space_cache_ttl
+
+        self._pending = {}
+        self._spaces = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._app = None
+        self._db = None
+        self._thread = None
+
+    def init_app(self, app, db):
+        self._app = app
+        self._db = db
+
+    def get_live_space(self, space_id):
+        """Return the primary key of a live space, or None if it is not live"""
+        cached = self._spaces.get(space_id)
+        if cached and cached[1] > time.monotonic():
+            if not presence_tracker.has_ended(space_id):
+                return cached[0]
+            self._spaces.pop(space_id, None)
+            return None
+
+        space = BarazaSpace.query.filter_by(space_id=space_id, is_live=True).first()
+        if not space:
+            self._spaces.pop(space_id, None)
+            return None
+        self.cache_space(space_id, space.id)
+        return space.id
+
+    def cache_space(self, space_id, space_pk):
+        self._spaces[space_id] = (space_pk, time.monotonic() + self.space_cache_ttl)
+
+    def add(self, space_pk, user_id, role):
+        """Queue a join; a repeated join before the next flush is a no-op"""
+        with self._lock:
+            self._pending.setdefault((space_pk, user_id), {
+                'space_id': space_pk,
+                'user_id': user_id,
+                'role': role,
+                'joined_at': datetime.utcnow()
+            })
+            pending_count = len(self._pending)
+
+        self._ensure_flusher()
+        if pending_count >= self.max_batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write all pending joins. Must be called inside an app context."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+
+            rows = list(batch.values())
+            written = 0
+            for start in range(0, len(rows), self.max_batch_size):
+                chunk = rows[start:start + self.max_batch_size]
+                try:
+                    written += self._insert_chunk(chunk)
+                except IntegrityError as e:
+                    self._db.session.rollback()
+                    logger.warning(f"Retrying {len(chunk)} Baraza joins one by one: {e}")
+                    written += self._insert_rows(chunk)
+                except Exception as e:
+                    self._db.session.rollback()
+                    logger.error(f"Failed to flush {len(chunk)} Baraza joins: {e}")
+                    self._requeue(chunk)
+            return written
+
+    def _insert_rows(self, rows):
+        """Insert rows one at a time, dropping those that violate a constraint"""
+        written = 0
+        for row in rows:
+            try:
+                written += self._insert_chunk([row])
+            except IntegrityError as e:
+                self._db.session.rollback()
+                logger.error(f"Dropping Baraza join of {row['user_id']} to space {row['space_id']}: {e}")
+            except Exception as e:
+                self._db.session.rollback()
+                logger.error(f"Failed to flush Baraza join of {row['user_id']}: {e}")
+                self._requeue([row])
+        return written
+
+    def _insert_chunk(self, rows):
+        space_pks = {row['space_id'] for row in rows}
+        user_ids = {row['user_id'] for row in rows}
+        open_rows = set(self._db.session.query(BarazaParticipant.space_id, BarazaParticipant.user_id).filter(
+            BarazaParticipant.space_id.in_(space_pks),
+            BarazaParticipant.user_id.in_(user_ids),
+            BarazaParticipant.left_at.is_(None)
+        ).all())
+
+        new_rows = [row for row in rows if (row['space_id'], row['user_id']) not in open_rows]
+        if new_rows:
+            self._db.session.bulk_insert_mappings(BarazaParticipant, new_rows)
+        self._db.session.commit()
+        return len(new_rows)
+
+    def _requeue(self, rows):
+        with self._lock:
+            for row in rows:
+                self._pending.setdefault((row['space_id'], row['user_id']), row)
+
+    def _ensure_flusher(self):
+        if self._thread is None and self._app is not None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='baraza-join-flusher', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Baraza join flusher error: {e}")
+
+
+# Initialize join buffer
+join_buffer = JoinBuffer()
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = int(os.getenv('BARAZA_PRESENCE_RECONCILE_SECONDS', '60'))
+DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
+# Long enough to outlast any process's cached live state of the space
+ENDED_MARKER_SECONDS = int(os.getenv('BARAZA_ENDED_MARKER_SECONDS', '3600'))
+
+
+class InMemoryPresenceBackend:
+    """
+    Per-process presence sets, keyed by public space_id. Only correct when
+    one process handles every join and leave; the WebSocket server (app.py)
+    refuses to start with it outside development.
+    """
+    def __init__(self):
+        self._members = {}
+        self._ended = {}
+        self._lock = threading.Lock()
+
+    def add(self, space_id, user_id):
+        with self._lock:
+            self._members.setdefault(space_id, set()).add(user_id)
+
+    def remove(self, space_id, user_id):
+        with self._lock:
+            members = self._members.get(space_id)
+            if members is not None:
+                members.discard(user_id)
+
+    def clear(self, space_id):
+        with self._lock:
+            self._members.pop(space_id, None)
+
+    def mark_ended(self, space_id, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._ended = {ended: expiry for ended, expiry in self._ended.items() if expiry > now}
+            self._ended[space_id] = now + ttl
+
+    def has_ended(self, space_id):
+        with self._lock:
+            return self._ended.get(space_id, 0) > time.monotonic()
+
+    def counts(self, space_ids):
+        with self._lock:
+            return {space_id: len(self._members.get(space_id, ())) for space_id in space_ids}
+
+    def replace(self, members_by_space):
+        with self._lock:
+            self._members = {space_id: set(users) for space_id, users in members_by_space.items()}
+
+
+class RedisPresenceBackend:
+    """Presence sets shared between processes (API and WebSocket servers)."""
+    KEY_PREFIX = 'baraza:presence:'
+    ENDED_PREFIX = 'baraza:ended:'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def _key(self, space_id):
+        return f"{self.KEY_PREFIX}{space_id}"
+
+    def add(self, space_id, user_id):
+        self._redis.sadd(self._key(space_id), user_id)
+
+    def remove(self, space_id, user_id):
+        self._redis.srem(self._key(space_id), user_id)
+
+    def clear(self, space_id):
+        self._redis.delete(self._key(space_id))
+
+    def mark_ended(self, space_id, ttl):
+        self._redis.set(f"{self.ENDED_PREFIX}{space_id}", 1, ex=ttl)
+
+    def has_ended(self, space_id):
+        return bool(self._redis.exists(f"{self.ENDED_PREFIX}{space_id}"))
+
+    def counts(self, space_ids):
+        pipe = self._redis.pipeline(transaction=False)
+        for space_id in space_ids:
+            pipe.scard(self._key(space_id))
+        return dict(zip(space_ids, pipe.execute()))
+
+    def replace(self, members_by_space):
+        pipe = self._redis.pipeline()
+        for key in self._redis.scan_iter(f"{self.KEY_PREFIX}*"):
+            pipe.delete(key)
+        for space_id, users in members_by_space.items():
+            if users:
+                pipe.sadd(self._key(space_id), *users)
+        pipe.execute()
+
+
+class PresenceTracker:
+    """
+    Tracks who is currently in each live Baraza space.
+
+    Join, leave and WebSocket disconnect keep the counters up to date, so
+    listing live spaces only needs O(1) lookups. The cache is periodically
+    reconciled against BarazaParticipant rows that have not left yet.
+    """
+    def __init__(self, backend=None, reconcile_interval=RECONCILE_INTERVAL_SECONDS):
+        self.backend = backend or self._create_backend()
+        self.reconcile_interval = reconcile_interval
+        self._last_reconcile = 0.0
+
+    def _create_backend(self):
+        redis_url = os.getenv('REDIS_URL')
+        if redis_url:
+            try:
+                return RedisPresenceBackend(redis_url)
+            except ImportError:
+                raise RuntimeError("REDIS_URL is set but the redis package is not installed")
+        return InMemoryPresenceBackend()
+
+    def require_shared(self, debug=DEBUG):
+        """
+        Fail unless presence is shared between processes. Called when the
+        WebSocket server starts, since the HTTP API must see its
+        disconnects. In development (DEBUG=true) it only warns.
+        """
+        if isinstance(self.backend, InMemoryPresenceBackend):
+            if debug:
+                logger.warning("Baraza presence is per process without REDIS_URL; "
+                               "listener counts will miss WebSocket disconnects")
+                return
+            raise RuntimeError("Baraza presence needs REDIS_URL when the WebSocket server (app.py) "
+                               "runs alongside the HTTP API")
+
+    def join(self, space_id, user_id):
+        self.backend.add(space_id, user_id)
+
+    def leave(self, space_id, user_id):
+        self.backend.remove(space_id, user_id)
+
+    def end_space(self, space_id):
+        """Drop a space's presence and mark it ended for every process"""
+        self.backend.clear(space_id)
+        self.backend.mark_ended(space_id, ENDED_MARKER_SECONDS)
+
+    def has_ended(self, space_id):
+        return self.backend.has_ended(space_id)
+
+    def counts(self, space_ids):
+        """Return {space_id: participant_count} for the given spaces."""
+        return self.backend.counts(list(space_ids))
+
+    def reconcile_due(self):
+        return time.monotonic() - self._last_reconcile >= self.reconcile_interval
+
+    def reconcile(self, active_participants):
+        """
+        Rebuild the cache from (space_id, user_id) pairs of participants in
+        live spaces whose left_at is still unset.
+        """
+        members_by_space = {}
+        for space_id, user_id in active_participants:
+            members_by_space.setdefault(space_id, set()).add(user_id)
+        self.backend.replace(members_by_space)
+        self._last_reconcile = time.monotonic()
+        logger.info(f"Reconciled Baraza presence for {len(members_by_space)} live spaces")
+
+
+# Initialize presence tracker
+presence_tracker = PresenceTracker()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import os
+from fractions import Fraction
+
+import av
+from aiortc.mediastreams import MediaStreamError
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RECORDING_FOLDER = os.getenv('BARAZA_RECORDING_FOLDER', 'recordings')
+SEGMENT_SECONDS = int(os.getenv('BARAZA_SEGMENT_SECONDS', '60'))
+UPLOAD_ATTEMPTS = int(os.getenv('BARAZA_UPLOAD_ATTEMPTS', '4'))
+UPLOAD_RETRY_SECONDS = float(os.getenv('BARAZA_UPLOAD_RETRY_SECONDS', '2'))
+
+
+class BarazaRecorder:
+    """
+    Records a live Baraza space into Opus/OGG segments on disk.
+
+    Frames are pulled from a relay subscription and encoded straight into the
+    current segment file, so nothing accumulates in memory no matter how long
+    the space runs. Closed segments are uploaded in the background through the
+    storage layer and removed locally once uploaded. A segment that still
+    fails after upload_attempts tries (with doubling backoff) is kept on
+    disk and listed as missing, and the manifest and the recording are
+    marked incomplete rather than published as if nothing was lost.
+    """
+    def __init__(self, space_id, track, storage, segment_seconds=SEGMENT_SECONDS,
+                 output_dir=RECORDING_FOLDER, upload_attempts=UPLOAD_ATTEMPTS,
+                 upload_retry_seconds=UPLOAD_RETRY_SECONDS):
+        self.space_id = space_id
+        self.track = track
+        self.storage = storage
+        self.segment_seconds = segment_seconds
+        self.output_dir = os.path.join(output_dir, space_id)
+        self.upload_attempts = upload_attempts
+        self.upload_retry_seconds = upload_retry_seconds
+
+        self._container = None
+        self._stream = None
+        self._segment_index = 0
+        self._segment_samples = 0
+        self._total_samples = 0
+        self._sample_rate = 48000
+
+        self._segments = []
+        self._missing = []
+        self._total_bytes = 0
+        self._uploads = asyncio.Queue()
+        self._record_task = None
+        self._upload_task = None
+        self._stopped = False
+
+    def _segment_name(self, index):
+        return f"{self.space_id}/segment-{index:05d}.ogg"
+
+    def _open_segment(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"segment-{self._segment_index:05d}.ogg")
+        self._container = av.open(path, mode='w', format='ogg')
+        self._stream = self._container.add_stream('libopus', rate=self._sample_rate)
+        self._segment_samples = 0
+        return path
+
+    def _close_segment(self):
+        """Flush the encoder, close the segment file and queue it for upload."""
+        if self._container is None:
+            return
+        for packet in self._stream.encode(None):
+            self._container.mux(packet)
+        path = self._container.name
+        self._container.close()
+        self._container = None
+        self._stream = None
+
+        if self._segment_samples:
+            self._uploads.put_nowait((self._segment_index, path))
+            self._segment_index += 1
+        else:
+            os.remove(path)
+
+    def _write_frame(self, frame):
+        if self._container is None:
+            self._sample_rate = frame.sample_rate
+            self._open_segment()
+
+        # Relay subscribers share frame objects with the listeners, so encode a
+        # copy restamped onto this segment's own timeline.
+        copy = av.AudioFrame(format=frame.format.name, layout=frame.layout.name,
+                             samples=frame.samples)
+        for source, target in zip(frame.planes, copy.planes):
+            target.update(bytes(source))
+        copy.sample_rate = frame.sample_rate
+        copy.pts = self._segment_samples
+        copy.time_base = Fraction(1, frame.sample_rate)
+
+        for packet in self._stream.encode(copy):
+            self._container.mux(packet)
+
+        self._segment_samples += frame.samples
+        self._total_samples += frame.samples
+        if self._segment_samples >= self.segment_seconds * frame.sample_rate:
+            self._close_segment()
+
+    async def _record(self):
+        while True:
+            try:
+                frame = await self.track.recv()
+            except MediaStreamError:
+                logging.info(f"Recording source for space {self.space_id} ended")
+                return
+            self._write_frame(frame)
+
+    async def _upload(self, path, remote_name):
+        """Upload one file, retrying with backoff. Returns False once the attempts are used up."""
+        loop = asyncio.get_event_loop()
+        delay = self.upload_retry_seconds
+        for attempt in range(1, self.upload_attempts + 1):
+            try:
+                await loop.run_in_executor(None, self.storage.upload_video, path, remote_name)
+                return True
+            except Exception as e:
+                logging.warning(f"Upload of recording segment {path} failed "
+                                f"(attempt {attempt}/{self.upload_attempts}): {e}")
+                if attempt < self.upload_attempts:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        return False
+
+    async def _upload_segments(self):
+        while True:
+            index, path = await self._uploads.get()
+            try:
+                if index is None:
+                    return
+                remote_name = self._segment_name(index)
+                size = os.path.getsize(path)
+                if await self._upload(path, remote_name):
+                    self._segments.append({
+                        'index': index,
+                        'path': remote_name,
+                        'size_bytes': size
+                    })
+                    self._total_bytes += size
+                    os.remove(path)
+                else:
+                    # Keep the local file so it can be re-uploaded by hand
+                    logging.error(f"Giving up on recording segment {path}; recording is incomplete")
+                    self._missing.append(index)
+            finally:
+                self._uploads.task_done()
+
+    async def start(self):
+        """Start recording the space."""
+        if self._record_task is None:
+            logging.info(f"Starting recording for Baraza space {self.space_id}")
+            self._record_task = asyncio.ensure_future(self._record())
+            self._upload_task = asyncio.ensure_future(self._upload_segments())
+
+    async def stop(self):
+        """
+        Stop recording, wait for pending uploads and publish a manifest.
+        Returns the recording summary used to create the BarazaRecording row.
+        If publishing the manifest fails it raises, and calling stop() again
+        retries the manifest.
+        """
+        if self._record_task is not None:
+            self._record_task.cancel()
+            try:
+                await self._record_task
+            except asyncio.CancelledError:
+                pass
+            self._record_task = None
+            self.track.stop()
+
+            self._close_segment()
+            self._uploads.put_nowait((None, None))
+            await self._upload_task
+            self._upload_task = None
+            self._stopped = True
+        elif not self._stopped:
+            return None
+
+        if not self._segments and not self._missing:
+            logging.warning(f"No audio was recorded for Baraza space {self.space_id}")
+            return None
+
+        duration_seconds = int(self._total_samples / self._sample_rate)
+        is_complete = not self._missing
+        manifest_name = f"{self.space_id}/manifest.json"
+        manifest_path = os.path.join(self.output_dir, 'manifest.json')
+        with open(manifest_path, 'w') as f:
+            json.dump({
+                'space_id': self.space_id,
+                'format': 'ogg/opus',
+                'duration_seconds': duration_seconds,
+                'complete': is_complete,
+                'missing_segments': sorted(self._missing),
+                'segments': sorted(self._segments, key=lambda s: s['index'])
+            }, f)
+
+        if not await self._upload(manifest_path, manifest_name):
+            raise RuntimeError(f"Could not upload the recording manifest for Baraza space {self.space_id}")
+        os.remove(manifest_path)
+        recording_url = self.storage.get_video_url(manifest_name)
+
+        logging.log(logging.INFO if is_complete else logging.ERROR,
+                    f"Recording for Baraza space {self.space_id} finished: {len(self._segments)} segments, "
+                    f"{len(self._missing)} missing, {duration_seconds}s")
+        return {
+            'recording_url': recording_url,
+            'duration_seconds': duration_seconds,
+            'file_size_bytes': self._total_bytes,
+            'is_complete': is_complete
+        }
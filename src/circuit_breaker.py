@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any, List, Optional
+
+WINDOW_SECONDS = float(os.getenv('NGO_BREAKER_WINDOW_SECONDS', '60'))
+MIN_REQUESTS = int(os.getenv('NGO_BREAKER_MIN_REQUESTS', '5'))
+ERROR_RATE_THRESHOLD = float(os.getenv('NGO_BREAKER_ERROR_RATE', '0.5'))
+CONSECUTIVE_FAILURES = int(os.getenv('NGO_BREAKER_CONSECUTIVE_FAILURES', '5'))
+OPEN_SECONDS = float(os.getenv('NGO_BREAKER_OPEN_SECONDS', '30'))
+HALF_OPEN_PROBES = int(os.getenv('NGO_BREAKER_HALF_OPEN_PROBES', '1'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker over a rolling time window.
+
+    Every call outcome is recorded with its latency. The breaker opens
+    when the window holds at least min_requests calls and the error rate
+    reaches error_rate_threshold, or after consecutive_failures failures in
+    a row. While open, allow() refuses calls until open_seconds have
+    passed; it then lets half_open_probes calls through, and closes on
+    their success or reopens on a failure.
+    """
+
+    def __init__(self, window_seconds: float = WINDOW_SECONDS, min_requests: int = MIN_REQUESTS,
+                 error_rate_threshold: float = ERROR_RATE_THRESHOLD,
+                 consecutive_failures: int = CONSECUTIVE_FAILURES, open_seconds: float = OPEN_SECONDS,
+                 half_open_probes: int = HALF_OPEN_PROBES, clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.consecutive_failures = consecutive_failures
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.clock = clock
+
+        self.state = CLOSED
+        self._calls = deque()  # (timestamp, ok, latency_seconds)
+        self._failures_in_row = 0
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """Whether a call may be made now; half-open probes are counted as taken"""
+        with self._lock:
+            now = self.clock()
+            if self.state == OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    return False
+                self._probes += 1
+            return True
+
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (self.clock() - self._opened_at))
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            now = self.clock()
+            self._calls.append((now, ok, latency))
+            self._trim(now)
+            self._failures_in_row = 0 if ok else self._failures_in_row + 1
+
+            if self.state == HALF_OPEN:
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    self._calls.append((now, ok, latency))
+                else:
+                    self._open(now)
+                return
+
+            if self.state == CLOSED and not ok:
+                failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+                if self._failures_in_row >= self.consecutive_failures or (
+                        len(self._calls) >= self.min_requests
+                        and failures / len(self._calls) >= self.error_rate_threshold):
+                    self._open(now)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self.clock()
+            self._trim(now)
+            latencies = sorted(latency for _, _, latency in self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            return {
+                'state': self.state,
+                'requests': len(self._calls),
+                'error_rate': round(failures / len(self._calls), 3) if self._calls else 0.0,
+                'consecutive_failures': self._failures_in_row,
+                'latency_ms': {
+                    'p50': _percentile_ms(latencies, 0.5),
+                    'p95': _percentile_ms(latencies, 0.95),
+                    'max': _percentile_ms(latencies, 1.0)
+                },
+                'retry_in_seconds': round(max(0.0, self.open_seconds - (now - self._opened_at)), 1)
+                if self.state == OPEN else None
+            }
+
+
+def _percentile_ms(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return round(sorted_values[index] * 1000, 1)
+
+
+class CircuitBreakerRegistry:
+    """One breaker per key (an NGO partner), created on first use with shared settings"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(**self.settings))
+        return breaker
+
+    def open_keys(self) -> List[str]:
+        """Keys whose breaker is open and not yet due for a probe"""
+        return [key for key, breaker in list(self._breakers.items()) if breaker.retry_in() > 0]
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        return {key: breaker.get_status() for key, breaker in sorted(self._breakers.items())}
@@ -0,0 +1,6 @@
+-- Migration: Hash-chained audit log
+-- Each admin_audit_logs row records the hash of the chained line in
+-- logs/audit.log that wrote it, so a row can be checked against the
+-- tamper-evident log.
+
+ALTER TABLE admin_audit_logs ADD COLUMN IF NOT EXISTS entry_hash varchar(64);
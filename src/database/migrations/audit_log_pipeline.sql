@@ -0,0 +1,6 @@
+-- Migration: Batched admin audit records
+-- The audit writer inserts every admin action into admin_audit_logs, not
+-- only report actions, and admin IDs are not always numeric.
+
+ALTER TABLE admin_audit_logs ALTER COLUMN report_id DROP NOT NULL;
+ALTER TABLE admin_audit_logs ALTER COLUMN admin_id TYPE varchar(64) USING admin_id::varchar;
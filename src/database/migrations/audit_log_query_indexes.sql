@@ -0,0 +1,15 @@
+-- Migration: Indexed admin audit queries
+-- Errors are flagged when written instead of found with a leading-wildcard
+-- LIKE on action, and investigation filters (admin, report, action, time)
+-- each lead a (column, timestamp, id) index used for keyset pagination.
+
+ALTER TABLE admin_audit_logs ADD COLUMN IF NOT EXISTS severity varchar(10) NOT NULL DEFAULT 'info';
+ALTER TABLE admin_audit_logs ADD COLUMN IF NOT EXISTS is_error boolean NOT NULL DEFAULT false;
+
+UPDATE admin_audit_logs SET is_error = true, severity = 'error' WHERE action ILIKE '%error%' AND NOT is_error;
+
+CREATE INDEX IF NOT EXISTS idx_admin_audit_logs_admin_time ON admin_audit_logs(admin_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_admin_audit_logs_report_time ON admin_audit_logs(report_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_admin_audit_logs_action_time ON admin_audit_logs(action, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_admin_audit_logs_time ON admin_audit_logs(timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_admin_audit_logs_errors ON admin_audit_logs(is_error, timestamp);
@@ -0,0 +1,5 @@
+-- Migration: Incomplete Baraza recordings
+-- A recording whose segments could not all be uploaded is stored with
+-- is_complete = false; its manifest lists the missing segments.
+
+ALTER TABLE baraza_recordings ADD COLUMN IF NOT EXISTS is_complete boolean NOT NULL DEFAULT true;
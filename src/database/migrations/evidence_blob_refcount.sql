@@ -0,0 +1,15 @@
+-- Migration: Reference-count evidence blobs
+-- A reference is taken before a blob is stored or deduplicated, and a
+-- blob is deleted by the transaction that drops its last reference, so
+-- a concurrent upload of the same file cannot end up pointing at a
+-- deleted blob. Existing blobs are counted from evidence_files.
+
+CREATE TABLE IF NOT EXISTS evidence_blobs (
+    blob_key varchar(128) PRIMARY KEY,
+    ref_count integer NOT NULL DEFAULT 0,
+    created_at timestamp DEFAULT now()
+);
+
+INSERT INTO evidence_blobs (blob_key, ref_count)
+SELECT blob_key, count(*) FROM evidence_files WHERE blob_key IS NOT NULL GROUP BY blob_key
+ON CONFLICT (blob_key) DO NOTHING;
@@ -0,0 +1,10 @@
+-- Migration: Move evidence file bytes out of the database
+-- Evidence is stored in the content-addressed encrypted blob store and
+-- evidence_files keeps only the blob key. Existing rows are moved in
+-- batches with: python src/evidence_store.py migrate
+
+ALTER TABLE evidence_files ADD COLUMN IF NOT EXISTS blob_key varchar(128);
+ALTER TABLE evidence_files ALTER COLUMN encrypted_file DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_evidence_files_blob_key ON evidence_files(blob_key);
+CREATE INDEX IF NOT EXISTS idx_evidence_files_file_hash ON evidence_files(file_hash);
@@ -0,0 +1,6 @@
+-- Migration: Record evidence uploads before they are processed
+-- Each evidence file gets a 'queued' row when its report is acknowledged,
+-- which the ingest pipeline marks 'stored' or 'failed'. Existing rows
+-- were all written after storing their file.
+
+ALTER TABLE evidence_files ADD COLUMN IF NOT EXISTS status varchar(20) NOT NULL DEFAULT 'stored';
@@ -0,0 +1,22 @@
+-- Migration: Transactional outbox for NGO escalation notifications
+-- Rows are written in the same transaction as the report and delivered
+-- by the notification dispatcher; failed rows are retried with backoff
+-- and end up with status 'dead' (the dead-letter queue).
+
+CREATE TABLE IF NOT EXISTS ngo_notifications (
+    id SERIAL PRIMARY KEY,
+    report_id VARCHAR(64) NOT NULL,
+    ngo_key VARCHAR(64) NOT NULL,
+    payload JSON NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claim_token VARCHAR(32),
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    delivered_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ngo_notifications_due ON ngo_notifications(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_ngo_notifications_report_id ON ngo_notifications(report_id);
+CREATE INDEX IF NOT EXISTS idx_ngo_notifications_claim_token ON ngo_notifications(claim_token);
@@ -0,0 +1,6 @@
+-- Migration: Separate signing secret for NGO digest payloads
+-- X-WanaIQ-Signature is computed with this secret instead of the API key,
+-- which is sent as the bearer token on every request. Partners without a
+-- secret have their digests dead-lettered until one is set.
+
+ALTER TABLE ngo_partners ADD COLUMN IF NOT EXISTS signing_secret_encrypted bytea;
@@ -0,0 +1,26 @@
+-- Migration: NGO partner risk-score thresholds and category backfill
+-- escalation_threshold is compared with the raw 0-10 risk score. Tables
+-- created from the models before this held an integer risk level (1-5),
+-- which is converted to the lowest score of that level. Partners without
+-- categories get those of the built-in partner for their tier; any left
+-- without receive no escalations, and the built-in partners keep
+-- handling categories no stored partner covers.
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'ngo_partners' AND column_name = 'escalation_threshold') = 'integer' THEN
+        ALTER TABLE ngo_partners ALTER COLUMN escalation_threshold TYPE numeric(4,2)
+            USING CASE WHEN escalation_threshold <= 1 THEN 0
+                       ELSE (escalation_threshold - 1) * 2 + 0.01 END;
+    ELSE
+        ALTER TABLE ngo_partners ALTER COLUMN escalation_threshold TYPE numeric(4,2);
+    END IF;
+END $$;
+
+UPDATE ngo_partners SET escalation_threshold = 8.0 WHERE escalation_threshold IS NULL;
+
+UPDATE ngo_partners SET categories = '["human_rights", "police_brutality", "tribalism"]'::json
+WHERE categories IS NULL AND tier = 1;
+UPDATE ngo_partners SET categories = '["corruption", "mismanagement", "electoral"]'::json
+WHERE categories IS NULL AND tier = 2;
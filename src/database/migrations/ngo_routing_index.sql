@@ -0,0 +1,9 @@
+-- Migration: NGO partner routing metadata
+-- The escalation manager indexes active partners by category and reloads
+-- the index when the row count or latest updated_at changes.
+
+ALTER TABLE ngo_partners ADD COLUMN IF NOT EXISTS slug varchar(64);
+ALTER TABLE ngo_partners ADD COLUMN IF NOT EXISTS categories json;
+ALTER TABLE ngo_partners ADD COLUMN IF NOT EXISTS updated_at timestamp DEFAULT CURRENT_TIMESTAMP;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ngo_partners_slug ON ngo_partners(slug);
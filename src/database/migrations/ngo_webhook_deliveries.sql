@@ -0,0 +1,15 @@
+-- Migration: Idempotent NGO callback ingestion
+-- Each processed callback's delivery ID is recorded per partner, so a
+-- callback redelivered after a partner outage is acknowledged but not
+-- applied twice. Responses are matched to escalation_workflows by
+-- (report_id, ngo_id).
+
+CREATE TABLE IF NOT EXISTS ngo_webhook_deliveries (
+    id SERIAL PRIMARY KEY,
+    ngo_key VARCHAR(64) NOT NULL,
+    delivery_id VARCHAR(128) NOT NULL,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_ngo_webhook_deliveries_delivery UNIQUE (ngo_key, delivery_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_escalation_workflows_report_ngo ON escalation_workflows(report_id, ngo_id);
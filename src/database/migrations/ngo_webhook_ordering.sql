@@ -0,0 +1,6 @@
+-- Migration: Order NGO callbacks per escalation
+-- A callback only updates an escalation if its sent_at is not older than
+-- the one already applied, so redelivered or reordered callbacks cannot
+-- roll a status back.
+
+ALTER TABLE escalation_workflows ADD COLUMN IF NOT EXISTS response_sent_at timestamp;
@@ -0,0 +1,6 @@
+-- Migration: Index pseudonymized analytics columns
+-- ip_hash and anonymous_id hold keyed HMAC pseudonyms that are stable for
+-- a rotation window (one UTC day), so they are used for equality lookups.
+
+CREATE INDEX IF NOT EXISTS idx_sensitive_reports_ip_hash ON sensitive_reports(ip_hash);
+CREATE INDEX IF NOT EXISTS idx_sensitive_reports_anonymous_id ON sensitive_reports(anonymous_id);
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, LargeBinary
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, LargeBinary, Index, UniqueConstraint, Numeric
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, deferred
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 import json
@@ -21,8 +21,8 @@ class SensitiveReport(Base):
     risk_level = Column(Integer, nullable=False, default=1)  # 1-5 scale
     category = Column(String(50), nullable=False)  # corruption, human_rights, etc.
     status = Column(String(20), default='pending')  # pending, investigating, escalated, resolved
-    anonymous_id = Column(String(128), nullable=True)  # Session-based anonymous tracking
-    ip_hash = Column(String(128), nullable=True)  # Hashed IP for analytics
+    anonymous_id = Column(String(128), nullable=True, index=True)  # Session-based anonymous tracking
+    ip_hash = Column(String(128), nullable=True, index=True)  # Daily pseudonym of the IP for analytics; unlinkable once its salt is destroyed
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -48,16 +48,26 @@ class EvidenceFile(Base):
     id = Column(Integer, primary_key=True)
     report_id = Column(Integer, ForeignKey('sensitive_reports.id'), nullable=False)
     filename = Column(String(255), nullable=False)
-    encrypted_file = Column(LargeBinary, nullable=False)
-    file_hash = Column(String(128), nullable=False)
+    encrypted_file = deferred(Column(LargeBinary, nullable=True))  # Legacy inline bytes, moved to the blob store
+    blob_key = Column(String(128), nullable=True, index=True)  # Keyed content hash (HMAC-SHA256) in the evidence blob store
+    file_hash = Column(String(128), nullable=False)  # Same keyed hash as blob_key, not a plain SHA-256
     file_type = Column(String(50), nullable=False)
     file_size = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default='stored')  # queued, stored, failed
     ipfs_hash = Column(String(128), nullable=True)  # IPFS hash for tamper-proof storage
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     report = relationship("SensitiveReport", back_populates="evidence_files")
 
+class EvidenceBlob(Base):
+    """Reference count of a deduplicated blob in the evidence blob store"""
+    __tablename__ = 'evidence_blobs'
+
+    blob_key = Column(String(128), primary_key=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class NGOPartner(Base):
     __tablename__ = 'ngo_partners'
 
@@ -66,11 +76,15 @@ class NGOPartner(Base):
     description = Column(Text)
     api_endpoint = Column(String(500), nullable=False)
     api_key_encrypted = Column(LargeBinary, nullable=False)
+    signing_secret_encrypted = Column(LargeBinary, nullable=True)  # Digest signing key, never sent to the partner
     tier = Column(Integer, nullable=False, default=1)  # 1=Human Rights, 2=Anti-Corruption, 3=Legal
     is_active = Column(Boolean, default=True)
     contact_email = Column(String(255))
-    escalation_threshold = Column(Integer, default=3)  # Risk level threshold for escalation
+    escalation_threshold = Column(Numeric(4, 2, asdecimal=False), default=8.0)  # Minimum risk score (0-10) for escalation
+    slug = Column(String(64), unique=True, nullable=True)  # Partner key used for routing and the outbox
+    categories = Column(JSON, default=list)  # Report categories this partner handles
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
     escalations = relationship("EscalationWorkflow", back_populates="ngo", cascade="all, delete-orphan")
@@ -84,27 +98,96 @@ class EscalationWorkflow(Base):
     status = Column(String(20), default='pending')  # pending, sent, acknowledged, resolved
     escalated_at = Column(DateTime, default=datetime.utcnow)
     response_received = Column(DateTime, nullable=True)
+    response_sent_at = Column(DateTime, nullable=True)  # Partner's sent_at of the applied callback
     ngo_response = Column(Text, nullable=True)
 
     # Relationships
     report = relationship("SensitiveReport", back_populates="escalations")
     ngo = relationship("NGOPartner", back_populates="escalations")
 
+    __table_args__ = (
+        Index('idx_escalation_workflows_report_ngo', 'report_id', 'ngo_id'),
+    )
+
+class NGONotification(Base):
+    """Transactional outbox: an escalation notification waiting for delivery to a partner"""
+    __tablename__ = 'ngo_notifications'
+
+    id = Column(Integer, primary_key=True)
+    report_id = Column(String(64), nullable=False, index=True)  # Public report ID
+    ngo_key = Column(String(64), nullable=False)  # NGOPartner.slug
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default='pending')  # pending, sending, delivered, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = Column(String(32), nullable=True, index=True)  # Set while a dispatcher holds the row
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_ngo_notifications_due', 'status', 'next_attempt_at'),
+    )
+
+class NGOWebhookDelivery(Base):
+    """Delivery IDs of processed NGO callbacks, so redelivered callbacks are applied once"""
+    __tablename__ = 'ngo_webhook_deliveries'
+
+    id = Column(Integer, primary_key=True)
+    ngo_key = Column(String(64), nullable=False)  # NGOPartner.slug of the sender
+    delivery_id = Column(String(128), nullable=False)
+    received_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('ngo_key', 'delivery_id', name='uq_ngo_webhook_deliveries_delivery'),
+    )
+
 class AdminAuditLog(Base):
     __tablename__ = 'admin_audit_logs'
 
     id = Column(Integer, primary_key=True)
-    report_id = Column(Integer, ForeignKey('sensitive_reports.id'), nullable=False)
-    admin_id = Column(Integer, nullable=False)  # Admin user ID
+    report_id = Column(Integer, ForeignKey('sensitive_reports.id'), nullable=True)  # Set for report actions
+    admin_id = Column(String(64), nullable=False)  # Admin user ID
     action = Column(String(100), nullable=False)  # view, decrypt, escalate, etc.
     details = Column(Text, nullable=True)
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(String(500), nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    entry_hash = Column(String(64), nullable=True)  # Hash of the chained audit log line for this action
+    severity = Column(String(10), nullable=False, default='info')  # info, warning, error, critical
+    is_error = Column(Boolean, nullable=False, default=False)
 
     # Relationships
     report = relationship("SensitiveReport", back_populates="audit_logs")
 
+    # Investigation queries filter by one of these and page by (timestamp, id)
+    __table_args__ = (
+        Index('idx_admin_audit_logs_admin_time', 'admin_id', 'timestamp', 'id'),
+        Index('idx_admin_audit_logs_report_time', 'report_id', 'timestamp', 'id'),
+        Index('idx_admin_audit_logs_action_time', 'action', 'timestamp', 'id'),
+        Index('idx_admin_audit_logs_time', 'timestamp', 'id'),
+        Index('idx_admin_audit_logs_errors', 'is_error', 'timestamp'),
+    )
+
+    def to_dict(self):
+        try:
+            details = json.loads(self.details) if self.details else None
+        except ValueError:
+            details = self.details
+        return {
+            'id': self.id,
+            'report_pk': self.report_id,
+            'admin_id': self.admin_id,
+            'action': self.action,
+            'severity': self.severity,
+            'is_error': self.is_error,
+            'details': details,
+            'ip_address': self.ip_address,
+            'user_agent': self.user_agent,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'entry_hash': self.entry_hash
+        }
+
 class DecryptionAuditLog(Base):
     __tablename__ = 'decryption_audit_logs'
 
@@ -159,7 +242,10 @@ class BarazaRecording(Base):
 
     id = Column(Integer, primary_key=True)
     space_id = Column(Integer, ForeignKey('baraza_spaces.id'), nullable=False)
-    recording_url = Column(String(500), nullable=False)
+    recording_url = Column(String(500), nullable=False)  # Manifest listing the uploaded OGG/Opus segments
+    duration_seconds = Column(Integer, nullable=True)
+    file_size_bytes = Column(Integer, nullable=True)
+    is_complete = Column(Boolean, nullable=False, default=True)  # False when a segment failed to upload
     created_at = Column(DateTime, default=datetime.utcnow)
 
     space = relationship("BarazaSpace", back_populates="recordings")
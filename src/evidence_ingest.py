@@ -0,0 +1,315 @@
+import base64
+import logging
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv('EVIDENCE_INGEST_WORKERS', str(min(8, (os.cpu_count() or 1) * 2))))
+PROGRESS_TTL_SECONDS = int(os.getenv('EVIDENCE_PROGRESS_TTL_SECONDS', '3600'))
+# Files accepted but not yet processed, whose bytes are held in memory
+MAX_PENDING_FILES = int(os.getenv('EVIDENCE_INGEST_MAX_PENDING', '200'))
+# A row still queued this long after upload belonged to a process that stopped
+QUEUED_TIMEOUT_SECONDS = int(os.getenv('EVIDENCE_QUEUED_TIMEOUT_SECONDS', '3600'))
+SWEEP_INTERVAL_SECONDS = int(os.getenv('EVIDENCE_SWEEP_INTERVAL_SECONDS', '300'))
+
+JPEG_SOI = b'\xff\xd8'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# JPEG segments kept when stripping: JFIF/JFXX (APP0), ICC profiles (APP2)
+# and Adobe colour transform (APP14). EXIF/XMP (APP1), IPTC (APP13), the
+# other APPn segments and comments are dropped.
+JPEG_KEEP_APP = {0xE0, 0xEE}
+JPEG_COMMENT = 0xFE
+PNG_METADATA_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'}
+
+
+def _strip_jpeg(data: bytes) -> bytes:
+    out = [JPEG_SOI]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Malformed JPEG segment")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0xDA:
+            # Start of scan: the rest is entropy-coded image data
+            out.append(data[pos:])
+            return b''.join(out)
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos:pos + 2 + length]
+        is_app = 0xE0 <= marker <= 0xEF
+        keep_icc = marker == 0xE2 and segment[4:16] == b'ICC_PROFILE\x00'
+        if not (is_app and marker not in JPEG_KEEP_APP and not keep_icc) and marker != JPEG_COMMENT:
+            out.append(segment)
+        pos += 2 + length
+    raise ValueError("JPEG has no image data")
+
+
+def _strip_png(data: bytes) -> bytes:
+    out = [PNG_SIGNATURE]
+    pos = len(PNG_SIGNATURE)
+    while pos + 12 <= len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        if chunk_type not in PNG_METADATA_CHUNKS:
+            out.append(data[pos:end])
+        pos = end
+        if chunk_type == b'IEND':
+            return b''.join(out)
+    raise ValueError("PNG has no IEND chunk")
+
+
+def strip_metadata(data: bytes) -> Tuple[bytes, bool]:
+    """
+    Remove identifying metadata (EXIF, GPS, XMP, IPTC, text chunks) from
+    JPEG and PNG evidence without re-encoding the image.
+
+    Returns (data, stripped). The file type is taken from its magic bytes,
+    never from the client-supplied content type; other formats are passed
+    through unchanged with stripped=False.
+    """
+    if data.startswith(JPEG_SOI):
+        return _strip_jpeg(data), True
+    if data.startswith(PNG_SIGNATURE):
+        return _strip_png(data), True
+    return data, False
+
+
+class EvidenceIngestPipeline:
+    """
+    Processes evidence files after a report has been acknowledged.
+
+    Every file gets a 'queued' EvidenceFile row committed with the report.
+    Each file is then decoded, stripped of metadata, hashed, encrypted and
+    written to the evidence blob store on a worker pool, and its row is
+    marked 'stored' or 'failed'. Per-file progress is kept in memory for
+    get_report_status; finished entries expire after PROGRESS_TTL_SECONDS,
+    after which the EvidenceFile rows are the record.
+
+    File bytes only live in memory until processed, so at most max_pending
+    files are accepted at a time (see reserve()), and rows left 'queued' by
+    a process that stopped are marked 'failed' once they are older than
+    queued_timeout, on the first sweep after startup and periodically after.
+    """
+    def __init__(self, store=None, workers: int = INGEST_WORKERS,
+                 progress_ttl: int = PROGRESS_TTL_SECONDS, max_pending: int = MAX_PENDING_FILES,
+                 queued_timeout: int = QUEUED_TIMEOUT_SECONDS, sweep_interval: int = SWEEP_INTERVAL_SECONDS):
+        self.store = store
+        self.workers = workers
+        self.progress_ttl = progress_ttl
+        self.max_pending = max_pending
+        self.queued_timeout = queued_timeout
+        self.sweep_interval = sweep_interval
+        self._pending = 0
+        self._last_sweep = None
+
+        self._progress: Dict[str, List[Dict[str, Any]]] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._app = None
+        self._db = None
+
+    def init_app(self, app, db):
+        self._app = app
+        self._db = db
+
+    def _get_store(self):
+        if self.store is None:
+            from evidence_store import evidence_store
+            self.store = evidence_store
+        return self.store
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='evidence-ingest')
+        return self._executor
+
+    def reserve(self, count: int) -> bool:
+        """
+        Claim room for count files before accepting them. Returns False when
+        the pipeline is full; otherwise submit() or cancel() must follow.
+        """
+        with self._lock:
+            if self._pending + count > self.max_pending:
+                return False
+            self._pending += count
+            return True
+
+    def cancel(self, count: int):
+        """Give back a reservation whose files were not submitted"""
+        with self._lock:
+            self._pending -= count
+
+    def queue(self, report, files: List[Dict[str, Any]]) -> list:
+        """
+        Attach a 'queued' EvidenceFile row per file to a report that has
+        not been committed yet, so the upload is on record before it is
+        acknowledged
+        """
+        from database.models import EvidenceFile
+
+        rows = []
+        for index, file_data in enumerate(files):
+            row = EvidenceFile(
+                filename=os.path.basename(file_data.get('filename') or f'evidence-{index}'),
+                file_hash='',
+                file_type=(file_data.get('content_type') or 'application/octet-stream')[:50],
+                file_size=0,
+                status='queued'
+            )
+            report.evidence_files.append(row)
+            rows.append(row)
+        return rows
+
+    def submit(self, report_id: str, rows: list, files: List[Dict[str, Any]]):
+        """Process the committed rows from queue(), reserved with reserve(), and return immediately"""
+        self._expire_progress()
+        entries = []
+        for index, row in enumerate(rows):
+            entries.append({
+                'index': index,
+                'filename': row.filename,
+                'state': 'queued',
+                'size': None,
+                'metadata_stripped': None,
+                'error': None
+            })
+        with self._lock:
+            self._progress[report_id] = entries
+
+        executor = self._get_executor()
+        for entry, row, file_data in zip(entries, rows, files):
+            executor.submit(self._process, row.id, report_id, entry, file_data)
+
+    def _set(self, report_id: str, entry: Dict[str, Any], **changes):
+        with self._lock:
+            entry.update(changes)
+            if changes.get('state') in ('stored', 'failed') and all(
+                    e['state'] in ('stored', 'failed') for e in self._progress.get(report_id, ())):
+                self._finished_at[report_id] = time.monotonic()
+
+    def _process(self, evidence_pk: int, report_id: str, entry: Dict[str, Any], file_data: Dict[str, Any]):
+        try:
+            self._ingest(evidence_pk, report_id, entry, file_data)
+        finally:
+            self.cancel(1)
+
+    def _ingest(self, evidence_pk: int, report_id: str, entry: Dict[str, Any], file_data: Dict[str, Any]):
+        try:
+            self._set(report_id, entry, state='stripping')
+            data = base64.b64decode(file_data.get('data') or '', validate=True)
+            if not data:
+                raise ValueError("Empty evidence file")
+            data, stripped = strip_metadata(data)
+
+            self._set(report_id, entry, state='encrypting', metadata_stripped=stripped)
+            store = self._get_store()
+            blob_key = store.blob_key(data)
+            # The reference is on record before the blob is stored or deduplicated
+            self._record(evidence_pk, acquire=True, blob_key=blob_key, file_hash=blob_key)
+            _, size, _ = store.put(BytesIO(data), blob_key)
+
+            self._record(evidence_pk, status='stored', file_size=size)
+            self._set(report_id, entry, state='stored', size=size)
+        except Exception as e:
+            logger.error(f"Failed to ingest evidence file {entry['index']} for report {report_id}: {e}")
+            try:
+                self._record(evidence_pk, status='failed')
+            except Exception as record_error:
+                logger.error(f"Failed to mark evidence file {evidence_pk} as failed: {record_error}")
+            self._set(report_id, entry, state='failed', error='Evidence file could not be processed')
+
+    def _record(self, evidence_pk: int, acquire: bool = False, **values):
+        """
+        Update a queued evidence row. With acquire=True the row's new
+        blob_key is referenced in the same transaction; a row marked
+        'failed' drops its blob reference. Raises if the row is no longer
+        queued, e.g. because a sweep has marked it failed.
+        """
+        from database.models import EvidenceFile
+
+        with self._app.app_context():
+            session = self._db.session
+            try:
+                if acquire:
+                    self._get_store().acquire(self._db, values['blob_key'])
+                row = session.query(EvidenceFile).filter_by(id=evidence_pk, status='queued')
+                released = None
+                if values.get('status') == 'failed':
+                    released = row.with_entities(EvidenceFile.blob_key).scalar()
+                    values['blob_key'] = None
+                if not row.update(values, synchronize_session=False):
+                    raise RuntimeError(f"Evidence file {evidence_pk} is no longer queued")
+                if released:
+                    # Commits the update too
+                    self._get_store().release(self._db, released)
+                else:
+                    session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+    def sweep_if_due(self) -> int:
+        """
+        Mark rows queued longer than queued_timeout as failed. Runs at most
+        every sweep_interval; must be called inside an app context.
+        Returns the number of rows marked.
+        """
+        from database.models import EvidenceFile
+
+        now = time.monotonic()
+        with self._lock:
+            if self._last_sweep is not None and now - self._last_sweep < self.sweep_interval:
+                return 0
+            self._last_sweep = now
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.queued_timeout)
+        stale = [row.id for row in self._db.session.query(EvidenceFile.id).filter(
+            EvidenceFile.status == 'queued', EvidenceFile.uploaded_at < cutoff)]
+        marked = 0
+        for evidence_pk in stale:
+            try:
+                self._record(evidence_pk, status='failed')
+                marked += 1
+            except Exception as e:
+                logger.error(f"Failed to mark stale evidence file {evidence_pk} as failed: {e}")
+        if marked:
+            logger.warning(f"Marked {marked} evidence files failed that were left queued by a stopped process")
+        return marked
+
+    def progress(self, report_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Per-file progress for a report, or None if it is not tracked here"""
+        with self._lock:
+            entries = self._progress.get(report_id)
+            return [dict(entry) for entry in entries] if entries is not None else None
+
+    def _expire_progress(self):
+        cutoff = time.monotonic() - self.progress_ttl
+        with self._lock:
+            for report_id, finished_at in list(self._finished_at.items()):
+                if finished_at < cutoff:
+                    self._progress.pop(report_id, None)
+                    del self._finished_at[report_id]
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+# Initialize evidence ingest pipeline
+evidence_pipeline = EvidenceIngestPipeline()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Content-addressed, encrypted blob store for evidence files.
+
+Evidence is encrypted with the streaming evidence cipher and stored once
+per HMAC-SHA256 of its plaintext under the keyring's evidence_index key,
+so re-submitted files are deduplicated and EvidenceFile rows only keep
+the blob key (also in file_hash). Keying the hash means someone who can
+list the store cannot confirm which known files it holds. Blobs are
+reference-counted in evidence_blobs: a reference is taken before a blob
+is stored or deduplicated, and the blob is deleted by the transaction
+that drops its last reference. Blobs live on local disk by
+default; set EVIDENCE_STORE_BACKEND=supabase to keep them in a Supabase
+Storage bucket instead.
+
+Move legacy rows that still hold encrypted_file bytes inline with:
+
+    python src/evidence_store.py migrate --batch-size 50
+"""
+
+import argparse
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+from io import BytesIO
+from typing import BinaryIO, Dict, Any, Optional, Tuple
+
+from sqlalchemy import exc
+
+logger = logging.getLogger(__name__)
+
+EVIDENCE_STORE_BACKEND = os.getenv('EVIDENCE_STORE_BACKEND', 'local')
+EVIDENCE_STORE_PATH = os.getenv('EVIDENCE_STORE_PATH', 'evidence_store')
+EVIDENCE_STORE_BUCKET = os.getenv('EVIDENCE_STORE_BUCKET', 'evidence')
+# Blob keys are derived from version 1 of this purpose only, so rotating
+# it would not change them
+BLOB_KEY_PURPOSE = 'evidence_index'
+
+
+class LocalBlobBackend:
+    """Stores blobs under root/ab/cd/<key> on local disk."""
+
+    def __init__(self, root: str = EVIDENCE_STORE_PATH):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, path: str):
+        """Move a finished temp file into place atomically"""
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), 'rb')
+
+    def delete(self, key: str):
+        if self.exists(key):
+            os.remove(self._path(key))
+
+
+class SupabaseBlobBackend:
+    """Stores blobs in a Supabase Storage bucket."""
+
+    def __init__(self, bucket_name: str = EVIDENCE_STORE_BUCKET):
+        from supabase import create_client
+
+        self.bucket_name = bucket_name
+        self.client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+        self.tmp_dir = tempfile.gettempdir()
+
+    def _bucket(self):
+        return self.client.storage.from_(self.bucket_name)
+
+    def _path(self, key: str) -> str:
+        return f"{key[:2]}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return bool(self._bucket().list(key[:2], {'search': key}))
+
+    def put(self, key: str, path: str):
+        with open(path, 'rb') as f:
+            # Upsert so re-encrypted blobs replace the previous object
+            self._bucket().upload(self._path(key), f, file_options={'upsert': 'true'})
+        os.remove(path)
+
+    def open(self, key: str) -> BinaryIO:
+        return BytesIO(self._bucket().download(self._path(key)))
+
+    def delete(self, key: str):
+        self._bucket().remove([self._path(key)])
+
+
+class _HashingReader:
+    """Wraps a stream and computes the blob key of everything read through it."""
+
+    def __init__(self, src: BinaryIO, key: bytes):
+        self.src = src
+        self.mac = hmac.new(key, digestmod=hashlib.sha256)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.src.read(size)
+        self.mac.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self.mac.hexdigest()
+
+
+class _ChunkReader:
+    """File-like view over an iterator of plaintext chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class IntegrityError(Exception):
+    """Raised when stored evidence does not match its expected hash"""
+
+
+class EvidenceBlobStore:
+    def __init__(self, backend, cipher):
+        self.backend = backend
+        self.cipher = cipher
+
+    def _blob_key_secret(self) -> bytes:
+        from security.keyring import LEGACY_KEY_ID
+
+        self.cipher.keyring.ensure(BLOB_KEY_PURPOSE)
+        return self.cipher.keyring.get(BLOB_KEY_PURPOSE, LEGACY_KEY_ID)
+
+    def blob_key(self, data: bytes) -> str:
+        """Blob key of a plaintext held in memory"""
+        return hmac.new(self._blob_key_secret(), data, hashlib.sha256).hexdigest()
+
+    def put(self, src: BinaryIO, file_hash: Optional[str] = None) -> Tuple[str, int, bool]:
+        """
+        Encrypt and store a plaintext stream.
+
+        Returns (blob_key, plaintext_size, deduplicated). The key is the
+        HMAC-SHA256 of the plaintext under the evidence_index key; if
+        file_hash is given it must be that key. Take a reference with
+        acquire() first, or a concurrent release() may delete the blob
+        this deduplicates against.
+        """
+        if file_hash and self.backend.exists(file_hash):
+            # Still consume the stream so callers see consistent behaviour
+            return file_hash, self._drain(src, file_hash), True
+
+        reader = _HashingReader(src, self._blob_key_secret())
+        os.makedirs(self.backend.tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.backend.tmp_dir, suffix='.blob')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                size = self.cipher.encrypt_stream(reader, tmp)
+            blob_key = reader.hexdigest()
+            if file_hash and file_hash != blob_key:
+                raise IntegrityError(f"Evidence hash mismatch: expected {file_hash}, got {blob_key}")
+
+            if self.backend.exists(blob_key):
+                os.remove(tmp_path)
+                return blob_key, size, True
+            self.backend.put(blob_key, tmp_path)
+            return blob_key, size, False
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _drain(self, src: BinaryIO, file_hash: str) -> int:
+        reader = _HashingReader(src, self._blob_key_secret())
+        size = 0
+        while True:
+            chunk = reader.read(self.cipher.chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+        if reader.hexdigest() != file_hash:
+            raise IntegrityError(f"Evidence hash mismatch for {file_hash}")
+        return size
+
+    def read_to(self, blob_key: str, dst: BinaryIO) -> int:
+        """Decrypt a blob into dst with constant memory"""
+        with self.backend.open(blob_key) as src:
+            return self.cipher.decrypt_stream(src, dst)
+
+    def read_range(self, blob_key: str, offset: int, length: int) -> bytes:
+        """Decrypt a plaintext byte range of a blob"""
+        with self.backend.open(blob_key) as src:
+            return self.cipher.decrypt_range(src, offset, length)
+
+    def key_id(self, blob_key: str) -> int:
+        """Evidence key version a blob is encrypted under"""
+        with self.backend.open(blob_key) as src:
+            return self.cipher.key_id(src)
+
+    def reencrypt(self, blob_key: str) -> bool:
+        """
+        Re-encrypt a blob under the active evidence key, replacing it in
+        place. Returns False if it already is.
+        """
+        active_id, _ = self.cipher.keyring.active(self.cipher.purpose)
+        if self.key_id(blob_key) == active_id:
+            return False
+
+        # Decrypted chunks go straight into the new encryption, so the
+        # plaintext never reaches disk
+        os.makedirs(self.backend.tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.backend.tmp_dir, suffix='.blob')
+        try:
+            with self.backend.open(blob_key) as src, os.fdopen(fd, 'wb') as tmp:
+                reader = _HashingReader(_ChunkReader(self.cipher.decrypt_chunks(src)), self._blob_key_secret())
+                self.cipher.encrypt_stream(reader, tmp)
+            if reader.hexdigest() != blob_key:
+                raise IntegrityError(f"Evidence blob {blob_key} does not match its key")
+            self.backend.put(blob_key, tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def acquire(self, db, blob_key: str):
+        """
+        Count one more reference to a blob in the caller's transaction.
+        Waits for a release() of the same blob that is in progress.
+        """
+        from database.models import EvidenceBlob
+
+        blobs = EvidenceBlob.__table__
+        increment = blobs.update().where(blobs.c.blob_key == blob_key).values(ref_count=blobs.c.ref_count + 1)
+        if db.session.execute(increment).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(blobs.insert().values(blob_key=blob_key, ref_count=1))
+        except exc.IntegrityError:
+            # Registered by a concurrent acquire()
+            db.session.execute(increment)
+
+    def release(self, db, blob_key: str) -> bool:
+        """
+        Drop a reference taken with acquire() and commit, deleting the
+        blob with its last reference. The count stays locked until the
+        blob is gone, so an acquire() of the same blob either keeps it or
+        stores it again. Returns True if the blob was deleted.
+        """
+        from database.models import EvidenceBlob
+
+        blobs = EvidenceBlob.__table__
+        try:
+            db.session.execute(blobs.update().where(blobs.c.blob_key == blob_key)
+                               .values(ref_count=blobs.c.ref_count - 1))
+            remaining = db.session.execute(
+                blobs.select().with_only_columns(blobs.c.ref_count).where(blobs.c.blob_key == blob_key)
+            ).scalar()
+            if remaining is None or remaining > 0:
+                if remaining is None:
+                    logger.warning(f"Evidence blob {blob_key} has no reference count; keeping it")
+                db.session.commit()
+                return False
+        except Exception:
+            db.session.rollback()
+            raise
+
+        try:
+            self.backend.delete(blob_key)
+        except Exception:
+            # Keep the count at zero; the next acquire() reuses or replaces the blob
+            db.session.commit()
+            raise
+        db.session.execute(blobs.delete().where(blobs.c.blob_key == blob_key, blobs.c.ref_count <= 0))
+        db.session.commit()
+        return True
+
+
+def create_backend(name: str = EVIDENCE_STORE_BACKEND):
+    if name == 'supabase':
+        return SupabaseBlobBackend()
+    return LocalBlobBackend()
+
+
+def migrate_inline_evidence(db, store: EvidenceBlobStore, legacy_fernet, batch_size: int = 50) -> Dict[str, Any]:
+    """
+    Move evidence_files.encrypted_file bytes into the blob store in batches.
+
+    Legacy blobs are Fernet tokens under the evidence key. Each batch is
+    committed on its own, so the migration can be stopped and rerun.
+    """
+    from database.models import EvidenceFile
+
+    stats = {'migrated': 0, 'deduplicated': 0, 'failed': 0}
+    failed_ids = set()
+    while True:
+        query = db.session.query(EvidenceFile.id).filter(
+            EvidenceFile.blob_key.is_(None),
+            EvidenceFile.encrypted_file.isnot(None)
+        )
+        if failed_ids:
+            query = query.filter(EvidenceFile.id.notin_(failed_ids))
+        ids = [row.id for row in query.order_by(EvidenceFile.id).limit(batch_size).all()]
+        if not ids:
+            break
+
+        for evidence_id in ids:
+            # Load one inline blob at a time to keep memory bounded
+            evidence = db.session.get(EvidenceFile, evidence_id)
+            try:
+                plaintext = legacy_fernet.decrypt(evidence.encrypted_file)
+                blob_key = store.blob_key(plaintext)
+                with db.session.begin_nested():
+                    store.acquire(db, blob_key)
+                    _, _, deduplicated = store.put(BytesIO(plaintext), blob_key)
+            except Exception as e:
+                logger.error(f"Failed to migrate evidence file {evidence_id}: {e}")
+                failed_ids.add(evidence_id)
+                stats['failed'] += 1
+                db.session.expunge(evidence)
+                continue
+
+            evidence.blob_key = blob_key
+            evidence.encrypted_file = None
+            db.session.flush()
+            stats['migrated'] += 1
+            stats['deduplicated'] += int(deduplicated)
+            db.session.expunge(evidence)
+
+        db.session.commit()
+        logger.info(f"Evidence migration progress: {stats}")
+
+    return stats
+
+
+def _create_default_store() -> EvidenceBlobStore:
+    from security.security_config import security_manager
+    return EvidenceBlobStore(create_backend(), security_manager.evidence_cipher)
+
+
+# Initialize evidence store
+evidence_store = _create_default_store()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evidence blob store maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='Move inline evidence bytes into the blob store')
+    migrate_parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from cryptography.fernet import Fernet
+    from main import app, db
+    from security.keyring import LEGACY_KEY_ID, keyring
+
+    with app.app_context():
+        result = migrate_inline_evidence(
+            db, evidence_store, Fernet(keyring.get('evidence', LEGACY_KEY_ID)), args.batch_size
+        )
+        logger.info(f"Evidence migration finished: {result}")
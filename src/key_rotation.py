@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Online re-encryption after a key rotation.
+
+EncryptionManager.rotate_encryption_keys makes new master and evidence key
+versions active and starts this worker in the background. It can also be
+run (or resumed) by hand:
+
+    python src/key_rotation.py --batch-size 100 --pause 0.5 --retire
+
+The worker walks SensitiveReport content, evidence blobs and NGO partner
+API keys in primary-key order, rewriting anything not under the active
+key versions in small batches with a pause between them, so the service
+keeps serving while it runs. Progress is checkpointed after every batch;
+a checkpoint is only resumed while the active key versions it was written
+for are still active.
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Callable, List, Optional
+
+from cryptography.fernet import Fernet
+from sqlalchemy import and_, bindparam
+
+from security.keyring import LEGACY_KEY_ID, UnknownKeyError
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = os.getenv('REENCRYPTION_CHECKPOINT_FILE', 'logs/reencryption_checkpoint.json')
+BATCH_SIZE = int(os.getenv('REENCRYPTION_BATCH_SIZE', '100'))
+PAUSE_SECONDS = float(os.getenv('REENCRYPTION_PAUSE_SECONDS', '0.5'))
+
+TABLES = ('sensitive_reports', 'evidence_files', 'ngo_partners', 'ngo_partner_signing_secrets')
+
+
+class ReencryptionWorker:
+    def __init__(self, security=None, encryption=None, store=None,
+                 checkpoint_file: str = CHECKPOINT_FILE, batch_size: int = BATCH_SIZE,
+                 pause_seconds: float = PAUSE_SECONDS):
+        self.security = security
+        self.encryption = encryption
+        self.store = store
+        self.checkpoint_file = checkpoint_file
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+        self._app = None
+        self._db = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self._app = app
+        self._db = db
+
+    def _components(self):
+        if self.security is None:
+            from security.security_config import security_manager
+            self.security = security_manager
+        if self.encryption is None:
+            from security.encryption_manager import encryption_manager
+            self.encryption = encryption_manager
+        if self.store is None:
+            from evidence_store import evidence_store
+            self.store = evidence_store
+
+    def _targets(self) -> Dict[str, int]:
+        keyring = self.security.keyring
+        return {purpose: keyring.active(purpose)[0] for purpose in ('master', 'evidence')}
+
+    def _load_checkpoint(self, targets: Dict[str, int]) -> Dict[str, Any]:
+        fresh = {'targets': targets, 'last_ids': {table: 0 for table in TABLES},
+                 'scanned': 0, 'reencrypted': 0, 'failed': 0}
+        if not os.path.exists(self.checkpoint_file):
+            return fresh
+        with open(self.checkpoint_file, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('completed') or checkpoint.get('targets') != targets:
+            return fresh
+        for table in TABLES:
+            # Checkpoints written before a table was added start it from the beginning
+            checkpoint['last_ids'].setdefault(table, 0)
+        logger.info(f"Resuming re-encryption from {checkpoint['last_ids']}")
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        directory = os.path.dirname(self.checkpoint_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def start(self) -> bool:
+        """Run in a background thread. Returns False if no app is attached."""
+        if self._app is None:
+            return False
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return True
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_in_app, name='key-reencryption', daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run_in_app(self):
+        try:
+            with self._app.app_context():
+                result = self.run()
+            logger.info(f"Re-encryption finished: {result}")
+        except Exception as e:
+            logger.error(f"Re-encryption worker error: {e}")
+
+    def run(self) -> Dict[str, Any]:
+        """Re-encrypt everything not under the active keys. Must run inside an app context."""
+        self._components()
+        targets = self._targets()
+        checkpoint = self._load_checkpoint(targets)
+
+        self._migrate_inline_evidence(checkpoint)
+        walkers = {
+            'sensitive_reports': self._reencrypt_reports,
+            'evidence_files': self._reencrypt_evidence,
+            'ngo_partners': self._reencrypt_partner_keys,
+            'ngo_partner_signing_secrets': self._reencrypt_partner_signing_secrets,
+        }
+        for table in TABLES:
+            while not self._stop.is_set():
+                rows = walkers[table](checkpoint, targets)
+                if rows is None:
+                    break
+                self._save_checkpoint(checkpoint)
+                logger.info(f"Re-encryption progress: {table} after id {checkpoint['last_ids'][table]}, "
+                            f"{checkpoint['reencrypted']} rewritten")
+                if self.pause_seconds:
+                    self._stop.wait(self.pause_seconds)
+            if self._stop.is_set():
+                return checkpoint
+
+        checkpoint['completed'] = True
+        self._save_checkpoint(checkpoint)
+        return checkpoint
+
+    def _fetch(self, columns: List, model, after_id: int, *filters):
+        return self._db.session.query(model.id, *columns).filter(
+            model.id > after_id, *filters
+        ).order_by(model.id).limit(self.batch_size).all()
+
+    def _update_batch(self, model, column, updates: List[Dict[str, Any]]):
+        """Write new ciphertext only where the row still holds what was read"""
+        if updates:
+            table = model.__table__
+            statement = table.update().where(and_(
+                table.c.id == bindparam('b_id'),
+                table.c[column] == bindparam('b_old')
+            )).values({column: bindparam('b_new')})
+            self._db.session.execute(statement, updates)
+        self._db.session.commit()
+
+    def _walk(self, checkpoint: Dict[str, Any], table: str, model, column: str,
+              reencrypt: Callable[[bytes], Optional[bytes]], *filters) -> Optional[int]:
+        rows = self._fetch([getattr(model, column)], model, checkpoint['last_ids'][table], *filters)
+        if not rows:
+            return None
+
+        updates = []
+        for row_id, value in rows:
+            try:
+                new_value = reencrypt(value)
+            except Exception as e:
+                logger.error(f"Failed to re-encrypt {table} row {row_id}: {e}")
+                checkpoint['failed'] += 1
+                continue
+            if new_value is not None:
+                updates.append({'b_id': row_id, 'b_old': value, 'b_new': new_value})
+
+        self._update_batch(model, column, updates)
+        checkpoint['last_ids'][table] = rows[-1][0]
+        checkpoint['scanned'] += len(rows)
+        checkpoint['reencrypted'] += len(updates)
+        return len(rows)
+
+    def _reencrypt_reports(self, checkpoint, targets) -> Optional[int]:
+        from database.models import SensitiveReport
+
+        envelope = self.security.envelope
+
+        def reencrypt(value: bytes) -> Optional[bytes]:
+            token = value.decode()
+            if envelope.is_envelope(token):
+                if envelope.key_id(token) == targets['master']:
+                    return None
+                return envelope.reencrypt(token).encode()
+            # Legacy Fernet content; military_grade was a token inside a token
+            data = self.security.fernet.decrypt(value)
+            level = 'standard'
+            if data.startswith(b'gAAAAA'):
+                data = self.security.fernet.decrypt(data)
+                level = 'high'
+            return envelope.encrypt(data, level).encode()
+
+        return self._walk(checkpoint, 'sensitive_reports', SensitiveReport, 'encrypted_content', reencrypt)
+
+    def _reencrypt_evidence(self, checkpoint, targets) -> Optional[int]:
+        from database.models import EvidenceFile
+
+        rows = self._fetch([EvidenceFile.blob_key], EvidenceFile, checkpoint['last_ids']['evidence_files'],
+                           EvidenceFile.blob_key.isnot(None))
+        if not rows:
+            return None
+
+        # Blobs are shared between rows with identical content
+        for blob_key in {row.blob_key for row in rows}:
+            try:
+                if self.store.reencrypt(blob_key):
+                    checkpoint['reencrypted'] += 1
+            except Exception as e:
+                logger.error(f"Failed to re-encrypt evidence blob {blob_key}: {e}")
+                checkpoint['failed'] += 1
+        checkpoint['last_ids']['evidence_files'] = rows[-1].id
+        checkpoint['scanned'] += len(rows)
+        return len(rows)
+
+    def _migrate_inline_evidence(self, checkpoint: Dict[str, Any]):
+        """Legacy inline evidence is re-encrypted by moving it into the blob store"""
+        from evidence_store import migrate_inline_evidence
+
+        try:
+            legacy_fernet = Fernet(self.security.keyring.get('evidence', LEGACY_KEY_ID))
+        except UnknownKeyError:
+            return
+        stats = migrate_inline_evidence(self._db, self.store, legacy_fernet, self.batch_size)
+        checkpoint['reencrypted'] += stats['migrated']
+        checkpoint['failed'] += stats['failed']
+
+    def _master_reencrypt(self, targets) -> Callable[[bytes], Optional[bytes]]:
+        def reencrypt(value: bytes) -> Optional[bytes]:
+            encrypted = value.decode()
+            if self.encryption.software_key_id(encrypted) == targets['master']:
+                return None
+            return self.encryption._software_encrypt(self.encryption._software_decrypt(encrypted)).encode()
+
+        return reencrypt
+
+    def _reencrypt_partner_keys(self, checkpoint, targets) -> Optional[int]:
+        from database.models import NGOPartner
+
+        return self._walk(checkpoint, 'ngo_partners', NGOPartner, 'api_key_encrypted', self._master_reencrypt(targets))
+
+    def _reencrypt_partner_signing_secrets(self, checkpoint, targets) -> Optional[int]:
+        from database.models import NGOPartner
+
+        return self._walk(checkpoint, 'ngo_partner_signing_secrets', NGOPartner, 'signing_secret_encrypted',
+                          self._master_reencrypt(targets), NGOPartner.signing_secret_encrypted.isnot(None))
+
+    def retire_old_versions(self, checkpoint: Dict[str, Any]) -> List[str]:
+        """Retire every non-active key version once a run finished without failures"""
+        if not checkpoint.get('completed') or checkpoint['failed']:
+            raise RuntimeError("Re-encryption has not completed cleanly; keeping old key versions")
+        keyring = self.security.keyring
+        retired = []
+        for purpose, active_id in checkpoint['targets'].items():
+            for key_id in keyring.decryptable_versions(purpose):
+                if key_id != active_id:
+                    keyring.retire(purpose, key_id)
+                    retired.append(f"{purpose}/{key_id}")
+        return retired
+
+
+# Initialize re-encryption worker
+reencryption_worker = ReencryptionWorker()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-encrypt stored data under the active key versions')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=PAUSE_SECONDS, help='Seconds to sleep between batches')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    parser.add_argument('--retire', action='store_true', help='Retire old key versions after a clean run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from main import app, db
+
+    worker = ReencryptionWorker(checkpoint_file=args.checkpoint, batch_size=args.batch_size,
+                                pause_seconds=args.pause)
+    worker.init_app(app, db)
+    with app.app_context():
+        result = worker.run()
+        logger.info(f"Re-encryption finished: {result}")
+        if args.retire:
+            logger.info(f"Retired key versions: {worker.retire_old_versions(result)}")
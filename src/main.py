@@ -5,6 +5,7 @@ Phase 1: Security Foundation & Sensitive Content System
 """
 
 import os
+import secrets
 from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
@@ -47,8 +48,10 @@ from security.audit_logger import audit_logger
 from security.privacy_manager import privacy_manager
 
 from api.anonymous_reporting import anonymous_bp
-from api.ngo_escalation import ngo_bp
+from api.ngo_escalation import ngo_bp, ngo_manager
+from ngo_outbox import notification_dispatcher
 from api.posts import posts_bp
+from api.audit import audit_bp
 
 # Conditionally import and register Baraza blueprint for modularity
 baraza_enabled = os.getenv('BARAZA_ENABLED', 'true').lower() == 'true'
@@ -68,6 +71,14 @@ else:
 app.register_blueprint(anonymous_bp)
 app.register_blueprint(ngo_bp, url_prefix='/api/ngo')
 app.register_blueprint(posts_bp, url_prefix='/api/posts')
+app.register_blueprint(audit_bp, url_prefix='/api/admin/audit')
+
+# Background re-encryption after key rotation
+from key_rotation import reencryption_worker
+reencryption_worker.init_app(app, db)
+
+# Audit records are batched into AdminAuditLog by the audit writer thread
+audit_logger.init_app(app, db)
 
 def init_database():
     """Initialize database and create tables"""
@@ -80,30 +91,37 @@ def init_database():
             default_ngos = [
                 {
                     'name': 'Human Rights Watch',
+                    'slug': 'hrw',
+                    'categories': ['human_rights', 'police_brutality', 'tribalism'],
                     'description': 'International human rights organization',
                     'api_endpoint': 'https://api.hrw.org/escalation',
                     'tier': 1,
-                    'escalation_threshold': 3
+                    'escalation_threshold': 8.0
                 },
                 {
                     'name': 'Transparency International',
+                    'slug': 'transparency_intl',
+                    'categories': ['corruption', 'mismanagement', 'electoral'],
                     'description': 'Anti-corruption organization',
                     'api_endpoint': 'https://api.transparency.org/escalation',
                     'tier': 2,
-                    'escalation_threshold': 4
+                    'escalation_threshold': 7.5
                 },
                 {
                     'name': 'Legal Aid Foundation',
+                    'slug': 'legal_aid',
+                    'categories': ['legal', 'human_rights', 'police_brutality'],
                     'description': 'Legal assistance for citizens',
                     'api_endpoint': 'https://api.legalaid.org/escalation',
                     'tier': 3,
-                    'escalation_threshold': 5
+                    'escalation_threshold': 8.5
                 }
             ]
 
             for ngo_data in default_ngos:
                 ngo = NGOPartner(**ngo_data)
                 ngo.api_key_encrypted = encryption_manager._software_encrypt('default-api-key').encode()
+                ngo.signing_secret_encrypted = encryption_manager._software_encrypt(secrets.token_urlsafe(32)).encode()
                 db.session.add(ngo)
 
             db.session.commit()
@@ -140,10 +158,11 @@ def health_check():
     # Get recent error logs
     try:
         recent_errors = AdminAuditLog.query.filter(
-            AdminAuditLog.action.like('%error%')
+            AdminAuditLog.is_error.is_(True)
         ).order_by(AdminAuditLog.timestamp.desc()).limit(5).all()
         error_logs = [{
             'action': log.action,
+            'severity': log.severity,
             'timestamp': log.timestamp.isoformat(),
             'details': log.details
         } for log in recent_errors]
@@ -210,10 +229,11 @@ def system_status():
     # Get recent error logs
     try:
         recent_errors = AdminAuditLog.query.filter(
-            AdminAuditLog.action.like('%error%')
+            AdminAuditLog.is_error.is_(True)
         ).order_by(AdminAuditLog.timestamp.desc()).limit(5).all()
         error_logs = [{
             'action': log.action,
+            'severity': log.severity,
             'timestamp': log.timestamp.isoformat(),
             'details': log.details
         } for log in recent_errors]
@@ -309,7 +329,10 @@ def get_system_status():
                 'component': record.component,
                 'status': record.status,
                 'last_check': record.last_check.isoformat()
-            } for record in health_records]
+            } for record in health_records],
+            # Breaker state is kept per process by this process's dispatcher
+            'ngo_partners': ngo_manager.get_partner_health(),
+            'ngo_outbox': notification_dispatcher.get_status()
         }
 
         return jsonify({'success': True, 'data': status_data})
@@ -345,6 +368,9 @@ if __name__ == '__main__':
     # Initialize database
     init_database()
 
+    # Deliver NGO notifications left in the outbox by a previous run
+    notification_dispatcher.start()
+
     # Start the application
     app.run(
         host=os.getenv('HOST', '0.0.0.0'),
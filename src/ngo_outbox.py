@@ -0,0 +1,422 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func
+
+from circuit_breaker import CircuitBreakerRegistry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv('NGO_DISPATCH_BATCH_SIZE', '100'))
+PER_PARTNER_CONCURRENCY = int(os.getenv('NGO_DISPATCH_PER_PARTNER_CONCURRENCY', '4'))
+MAX_ATTEMPTS = int(os.getenv('NGO_DISPATCH_MAX_ATTEMPTS', '8'))
+BASE_BACKOFF_SECONDS = float(os.getenv('NGO_DISPATCH_BASE_BACKOFF_SECONDS', '5'))
+MAX_BACKOFF_SECONDS = float(os.getenv('NGO_DISPATCH_MAX_BACKOFF_SECONDS', '3600'))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('NGO_DISPATCH_TIMEOUT_SECONDS', '10'))
+POLL_INTERVAL_SECONDS = float(os.getenv('NGO_DISPATCH_POLL_SECONDS', '5'))
+
+DIGEST_MAX_ITEMS = int(os.getenv('NGO_DIGEST_MAX_ITEMS', '200'))
+
+# Client errors that will not succeed on retry go straight to the dead-letter queue
+RETRYABLE_CLIENT_ERRORS = {408, 425, 429}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def parse_digest_windows(value: str) -> Dict[int, int]:
+    """Parse 'tier:minutes' pairs, e.g. '2:15,3:60', into {tier: window seconds}"""
+    windows = {}
+    for pair in filter(None, (part.strip() for part in value.split(','))):
+        tier, minutes = pair.split(':')
+        windows[int(tier)] = int(float(minutes) * 60)
+    return windows
+
+
+# Tier 1 partners are notified immediately; lower tiers get one digest per window
+DIGEST_WINDOWS = parse_digest_windows(os.getenv('NGO_DIGEST_WINDOWS', '2:15,3:60'))
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """
+    Signature sent in X-WanaIQ-Signature with digest payloads.
+
+    secret is the partner's signing secret, which is shared with the
+    partner once and never sent in a request, unlike the API key that goes
+    out as the bearer token. Partners verify the signature by computing
+    HMAC-SHA256 over "<timestamp>.<body>" with it and rejecting stale
+    timestamps.
+    """
+    return 'sha256=' + hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+
+
+class NotificationDispatcher:
+    """
+    Delivers queued NGONotification rows to partner endpoints.
+
+    Notifications are written to the outbox in the same transaction as the
+    report, so an escalation is never lost and never blocks the request.
+    The dispatcher claims due rows in batches and sends them concurrently
+    over one pooled async HTTP client, at most per_partner_concurrency
+    requests in flight per partner, so a slow partner only delays its own
+    notifications. Failures are retried with exponential backoff and
+    jitter; after max_attempts, or on a permanent client error, a row is
+    marked 'dead' and stays there until requeued.
+
+    Each partner has a circuit breaker fed with the outcome and latency of
+    every request. Rows for a partner whose breaker is open are not
+    claimed, and rows that reach a half-open partner beyond its probe
+    allowance are put back without using an attempt, so a partner that is
+    down costs one probe per cool-down instead of a timeout per
+    notification.
+
+    Partners in a tier listed in digest_windows are not sent one request
+    per escalation: their notifications are queued until the end of the
+    tier's window and sent together as one signed digest.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, per_partner_concurrency: int = PER_PARTNER_CONCURRENCY,
+                 max_attempts: int = MAX_ATTEMPTS, base_backoff: float = BASE_BACKOFF_SECONDS,
+                 max_backoff: float = MAX_BACKOFF_SECONDS, timeout: float = REQUEST_TIMEOUT_SECONDS,
+                 poll_interval: float = POLL_INTERVAL_SECONDS,
+                 breakers: Optional[CircuitBreakerRegistry] = None,
+                 digest_windows: Optional[Dict[int, int]] = None, digest_max_items: int = DIGEST_MAX_ITEMS):
+        self.batch_size = batch_size
+        self.per_partner_concurrency = per_partner_concurrency
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.breakers = breakers or CircuitBreakerRegistry()
+        self.digest_windows = DIGEST_WINDOWS if digest_windows is None else digest_windows
+        self.digest_max_items = digest_max_items
+
+        self._app = None
+        self._db = None
+        self._partners: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None
+        self._thread = None
+        self._loop = None
+        self._wake_event = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db, partners: Callable[[str], Optional[Dict[str, Any]]]):
+        """partners resolves a partner key to its config (api_endpoint, api_key, name)"""
+        self._app = app
+        self._db = db
+        self._partners = partners
+
+    def start(self) -> bool:
+        """Run the dispatch loop in a background thread"""
+        if self._app is None:
+            return False
+        if httpx is None:
+            logger.warning("httpx is not installed; NGO notifications stay queued in the outbox")
+            return False
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return True
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_in_app, name='ngo-dispatcher', daemon=True)
+            self._thread.start()
+        return True
+
+    def wake(self):
+        """Deliver newly committed notifications now instead of at the next poll"""
+        if self._thread is None or not self._thread.is_alive():
+            # Tests drive the dispatcher explicitly
+            if self._app is None or self._app.testing or not self.start():
+                return
+        self._signal()
+
+    def _signal(self):
+        loop, event = self._loop, self._wake_event
+        if loop is not None and event is not None:
+            loop.call_soon_threadsafe(event.set)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._signal()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run_in_app(self):
+        try:
+            with self._app.app_context():
+                asyncio.run(self._serve())
+        except Exception as e:
+            logger.error(f"NGO notification dispatcher error: {e}")
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake_event = asyncio.Event()
+        limits = {}
+        async with self._client() as client:
+            while not self._stop.is_set():
+                try:
+                    processed = sum((await self._dispatch_batch(client, limits)).values())
+                except Exception as e:
+                    logger.error(f"NGO notification batch failed: {e}")
+                    self._db.session.rollback()
+                    processed = 0
+                if processed == self.batch_size:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake_event.clear()
+        self._loop = None
+
+    def _client(self) -> 'httpx.AsyncClient':
+        if httpx is None:
+            raise RuntimeError("httpx is required to deliver NGO notifications")
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+
+    def dispatch_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Deliver one batch of due notifications. Must run inside an app context."""
+        async def run():
+            async with self._client() as client:
+                return await self._dispatch_batch(client, {}, now)
+
+        return asyncio.run(run())
+
+    def _claim(self, now: datetime) -> List:
+        """Take due rows for this dispatcher; 'sending' rows whose lease expired are taken over"""
+        from database.models import NGONotification
+
+        session = self._db.session
+        due = and_(NGONotification.status.in_(('pending', 'sending')), NGONotification.next_attempt_at <= now)
+        open_keys = self.breakers.open_keys()
+        if open_keys:
+            due = and_(due, NGONotification.ngo_key.notin_(open_keys))
+        due_rows = (session.query(NGONotification.id, NGONotification.ngo_key).filter(due)
+                    .order_by(NGONotification.next_attempt_at).limit(self.batch_size).all())
+        if not due_rows:
+            return []
+        ids = [row.id for row in due_rows]
+        token = secrets.token_hex(16)
+        lease = now + timedelta(seconds=self._lease_seconds([row.ngo_key for row in due_rows]))
+        session.query(NGONotification).filter(NGONotification.id.in_(ids), due).update(
+            {'status': 'sending', 'claim_token': token, 'next_attempt_at': lease},
+            synchronize_session=False
+        )
+        session.commit()
+        return session.query(NGONotification.id, NGONotification.ngo_key, NGONotification.payload,
+                             NGONotification.attempts, NGONotification.claim_token).filter_by(claim_token=token).all()
+
+    def _lease_seconds(self, ngo_keys: List[str]) -> float:
+        """
+        How long a batch may take: the partner with the most requests sends
+        them per_partner_concurrency at a time, each up to the timeout,
+        plus one timeout to record the results
+        """
+        rounds = 0
+        for ngo_key, count in Counter(ngo_keys).items():
+            ngo = self._partners(ngo_key) if self._partners else None
+            if ngo is not None and ngo['tier'] in self.digest_windows:
+                count = math.ceil(count / self.digest_max_items)
+            rounds = max(rounds, math.ceil(count / self.per_partner_concurrency))
+        return (rounds + 1) * self.timeout + self.poll_interval
+
+    async def _dispatch_batch(self, client, limits: Dict[str, asyncio.Semaphore],
+                              now: Optional[datetime] = None) -> Dict[str, int]:
+        rows = self._claim(now or datetime.utcnow())
+        if not rows:
+            return {'delivered': 0, 'retry': 0, 'deferred': 0, 'dead': 0}
+        deliveries = self._group(rows)
+        outcomes = await asyncio.gather(*(self._deliver(client, limits, ngo_key, ngo, group)
+                                          for ngo_key, ngo, group in deliveries))
+        return self._record([group for _, _, group in deliveries], outcomes)
+
+    def _group(self, rows: List) -> List[Tuple[str, Optional[Dict[str, Any]], List]]:
+        """One delivery per notification for immediate tiers, one per partner (chunked) for digest tiers"""
+        partners = {}
+        deliveries = []
+        digests = {}
+        for row in rows:
+            if row.ngo_key not in partners:
+                partners[row.ngo_key] = self._partners(row.ngo_key) if self._partners else None
+            ngo = partners[row.ngo_key]
+            if ngo is not None and ngo['tier'] in self.digest_windows:
+                digests.setdefault(row.ngo_key, []).append(row)
+            else:
+                deliveries.append((row.ngo_key, ngo, [row]))
+        for ngo_key, group in digests.items():
+            for i in range(0, len(group), self.digest_max_items):
+                deliveries.append((ngo_key, partners[ngo_key], group[i:i + self.digest_max_items]))
+        return deliveries
+
+    def digest_due_at(self, tier: int, now: Optional[datetime] = None) -> datetime:
+        """When a notification for a partner of this tier should be sent: now, or the end of its digest window"""
+        now = now or datetime.utcnow()
+        window = self.digest_windows.get(tier)
+        if not window:
+            return now
+        elapsed = (now - EPOCH).total_seconds()
+        return EPOCH + timedelta(seconds=(elapsed // window + 1) * window)
+
+    def _digest_payload(self, ngo_key: str, rows: List) -> Dict[str, Any]:
+        return {
+            'type': 'escalation_digest',
+            'ngo_id': ngo_key,
+            'generated_at': datetime.utcnow().isoformat(),
+            'count': len(rows),
+            'notifications': [{'notification_id': row.id, **row.payload} for row in rows]
+        }
+
+    async def _deliver(self, client, limits: Dict[str, asyncio.Semaphore], ngo_key: str,
+                       ngo: Optional[Dict[str, Any]], rows: List) -> Optional[Tuple[str, Optional[bool]]]:
+        """
+        Send one notification or digest. Returns None on success, else (error, retryable);
+        retryable is None when the request was not made because the circuit is open.
+        """
+        if ngo is None:
+            return f"Unknown partner {ngo_key}", False
+
+        headers = {'Authorization': f"Bearer {ngo['api_key']}"}
+        if ngo['tier'] in self.digest_windows:
+            if not ngo.get('signing_secret'):
+                return f"No signing secret for partner {ngo_key}", False
+            body = json.dumps(self._digest_payload(ngo_key, rows), separators=(',', ':'), sort_keys=True).encode()
+            timestamp = str(int(time.time()))
+            ids = ','.join(str(row.id) for row in rows)
+            headers.update({
+                'Content-Type': 'application/json',
+                'Idempotency-Key': f"wanaiq-digest-{hashlib.sha256(ids.encode()).hexdigest()[:32]}",
+                'X-WanaIQ-Timestamp': timestamp,
+                'X-WanaIQ-Signature': sign_payload(ngo['signing_secret'], timestamp, body)
+            })
+            request = {'content': body}
+        else:
+            headers['Idempotency-Key'] = f"wanaiq-notification-{rows[0].id}"
+            request = {'json': rows[0].payload}
+
+        breaker = self.breakers.get(ngo_key)
+        semaphore = limits.get(ngo_key)
+        if semaphore is None:
+            semaphore = limits[ngo_key] = asyncio.Semaphore(self.per_partner_concurrency)
+        async with semaphore:
+            if not breaker.allow():
+                return f"Circuit open for {ngo_key}", None
+            started = time.perf_counter()
+            try:
+                response = await client.post(ngo['api_endpoint'], headers=headers, **request)
+            except Exception as e:
+                breaker.record(False, time.perf_counter() - started)
+                return f"{type(e).__name__}: {e}", True
+
+        # Permanent client errors mean the partner is up; they do not trip the breaker
+        retryable = response.status_code >= 500 or response.status_code in RETRYABLE_CLIENT_ERRORS
+        breaker.record(not retryable, time.perf_counter() - started)
+        if 200 <= response.status_code < 300:
+            logger.info(f"Notified {ngo['name']} about {len(rows)} escalation(s)")
+            return None
+        return f"HTTP {response.status_code}", retryable
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record(self, groups: List[List], outcomes: List) -> Dict[str, int]:
+        """
+        Write all delivery results for a batch in one statement and one
+        commit. A row whose lease expired and was claimed again by another
+        dispatcher is left to that dispatcher.
+        """
+        from database.models import NGONotification
+
+        now = datetime.utcnow()
+        updates = []
+        results = {'delivered': 0, 'retry': 0, 'deferred': 0, 'dead': 0}
+        for rows, outcome in zip(groups, outcomes):
+            if outcome is not None and outcome[1] is None:
+                # Not sent: wait for the breaker without using an attempt
+                retry_in = max(1.0, self.breakers.get(rows[0].ngo_key).retry_in())
+                retry_at = now + timedelta(seconds=retry_in * random.uniform(1.0, 1.2))
+            else:
+                # Rows of one digest share a retry time so they stay together
+                retry_at = now + timedelta(seconds=self._backoff(max(row.attempts for row in rows) + 1))
+            for row in rows:
+                attempts = row.attempts + 1
+                update = {'b_id': row.id, 'b_token': row.claim_token, 'b_attempts': attempts, 'b_error': None,
+                          'b_next': now, 'b_delivered': None}
+                if outcome is None:
+                    update['b_status'] = 'delivered'
+                    update['b_delivered'] = now
+                elif outcome[1] is None:
+                    update.update(b_status='pending', b_attempts=row.attempts, b_error=outcome[0], b_next=retry_at)
+                    results['deferred'] += 1
+                    updates.append(update)
+                    continue
+                else:
+                    error, retryable = outcome
+                    update['b_error'] = error[:1000]
+                    if retryable and attempts < self.max_attempts:
+                        update['b_status'] = 'pending'
+                        update['b_next'] = retry_at
+                    else:
+                        update['b_status'] = 'dead'
+                        logger.error(f"NGO notification {row.id} to {row.ngo_key} moved to dead-letter queue: {error}")
+                results['retry' if update['b_status'] == 'pending' else update['b_status']] += 1
+                updates.append(update)
+
+        table = NGONotification.__table__
+        statement = table.update().where(
+            and_(table.c.id == bindparam('b_id'), table.c.claim_token == bindparam('b_token'))
+        ).values(
+            status=bindparam('b_status'), attempts=bindparam('b_attempts'),
+            last_error=bindparam('b_error'), next_attempt_at=bindparam('b_next'),
+            delivered_at=bindparam('b_delivered'), claim_token=None
+        )
+        result = self._db.session.execute(statement, updates)
+        self._db.session.commit()
+        if 0 <= result.rowcount < len(updates):
+            logger.warning(f"{len(updates) - result.rowcount} NGO notifications were claimed again before "
+                           f"their results were recorded")
+        return results
+
+    def requeue_dead(self, ids: Optional[List[int]] = None) -> int:
+        """Move dead-lettered notifications back to pending with a fresh attempt budget"""
+        from database.models import NGONotification
+
+        query = self._db.session.query(NGONotification).filter_by(status='dead')
+        if ids is not None:
+            query = query.filter(NGONotification.id.in_(ids))
+        count = query.update({'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+                             synchronize_session=False)
+        self._db.session.commit()
+        self.wake()
+        return count
+
+    def get_status(self) -> Dict[str, int]:
+        """Outbox row counts by status"""
+        from database.models import NGONotification
+
+        counts = dict(self._db.session.query(NGONotification.status, func.count(NGONotification.id))
+                      .group_by(NGONotification.status).all())
+        return {status: counts.get(status, 0) for status in ('pending', 'sending', 'delivered', 'dead')}
+
+
+# Initialize notification dispatcher
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Batch re-triage of SensitiveReport risk levels.
+
+Run after risk keyword lists or thresholds change:
+
+    python src/report_rescoring.py --status pending --chunk-size 500 --workers 4
+
+Reports are streamed in primary-key order, decrypted and scored in a
+process pool, and changed risk levels are written with one bulk update per
+chunk. Progress is checkpointed after every committed chunk, so a crashed
+run picks up where it stopped when started again.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from cryptography.fernet import Fernet
+
+from security.envelope_encryption import TOKEN_PREFIX, EnvelopeCipher
+from security.keyring import Keyring
+from risk_scoring import RISK_KEYWORDS_FILE, RiskScorer, risk_score_to_level
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = os.getenv('RESCORE_CHECKPOINT_FILE', 'logs/rescore_checkpoint.json')
+
+# Per-process state for pool workers
+_worker_fernet = None
+_worker_envelope = None
+_worker_scorer = None
+
+
+def _init_worker(data_key: bytes, master_keys: Optional[Dict[int, bytes]], keywords_file: str):
+    global _worker_fernet, _worker_envelope, _worker_scorer
+    _worker_fernet = Fernet(data_key)
+    _worker_envelope = EnvelopeCipher(Keyring.from_keys({'master': master_keys})) if master_keys else None
+    _worker_scorer = RiskScorer(keywords_file)
+
+
+def _decrypt(encrypted_content: bytes) -> str:
+    if _worker_envelope is not None and encrypted_content.startswith(TOKEN_PREFIX.encode()):
+        return _worker_envelope.decrypt(encrypted_content.decode()).decode()
+    data = _worker_fernet.decrypt(encrypted_content)
+    # military_grade content is a Fernet token wrapped in a second token
+    if data.startswith(b'gAAAAA'):
+        data = _worker_fernet.decrypt(data)
+    return data.decode()
+
+
+def _score_chunk(rows: List[Tuple[int, bytes, str]]) -> List[Tuple[int, Optional[int]]]:
+    """Decrypt and score a chunk of (id, encrypted_content, category) rows"""
+    results = []
+    for report_pk, encrypted_content, category in rows:
+        try:
+            content = _decrypt(encrypted_content)
+        except Exception:
+            results.append((report_pk, None))
+            continue
+        score = _worker_scorer.score(content, category)['score']
+        results.append((report_pk, risk_score_to_level(score)))
+    return results
+
+
+class ReportRescoringJob:
+    def __init__(self, db, data_key: bytes, keywords_file: str = RISK_KEYWORDS_FILE,
+                 checkpoint_file: str = CHECKPOINT_FILE, chunk_size: int = 500,
+                 workers: int = None, status: Optional[str] = 'pending',
+                 master_keys: Optional[Dict[int, bytes]] = None):
+        self.db = db
+        self.data_key = data_key
+        self.master_keys = master_keys
+        self.keywords_file = keywords_file
+        self.checkpoint_file = checkpoint_file
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        self.status = status
+        self.keywords_digest = self._digest(keywords_file)
+
+    def _digest(self, path: str) -> str:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        """Resume only if the checkpoint was written for the same keyword config"""
+        fresh = {'last_id': 0, 'scanned': 0, 'updated': 0, 'failed': 0,
+                 'keywords_digest': self.keywords_digest, 'status': self.status}
+        if not os.path.exists(self.checkpoint_file):
+            return fresh
+        with open(self.checkpoint_file, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('completed'):
+            return fresh
+        if checkpoint.get('keywords_digest') != self.keywords_digest or checkpoint.get('status') != self.status:
+            logger.info("Risk keywords changed since the last checkpoint, starting from the beginning")
+            return fresh
+        logger.info(f"Resuming rescoring after report id {checkpoint['last_id']}")
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        directory = os.path.dirname(self.checkpoint_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def _fetch_chunk(self, after_id: int):
+        from database.models import SensitiveReport
+
+        query = self.db.session.query(
+            SensitiveReport.id, SensitiveReport.encrypted_content,
+            SensitiveReport.category, SensitiveReport.risk_level
+        ).filter(SensitiveReport.id > after_id)
+        if self.status:
+            query = query.filter(SensitiveReport.status == self.status)
+        return query.order_by(SensitiveReport.id).limit(self.chunk_size).all()
+
+    def run(self) -> Dict[str, Any]:
+        """Rescore all matching reports and return the final counters"""
+        from database.models import SensitiveReport
+
+        checkpoint = self._load_checkpoint()
+        sub_chunk = max(1, self.chunk_size // self.workers)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.data_key, self.master_keys, self.keywords_file)) as pool:
+            while True:
+                rows = self._fetch_chunk(checkpoint['last_id'])
+                if not rows:
+                    break
+
+                current_levels = {row.id: row.risk_level for row in rows}
+                work = [(row.id, row.encrypted_content, row.category) for row in rows]
+                batches = [work[i:i + sub_chunk] for i in range(0, len(work), sub_chunk)]
+
+                updates = []
+                for results in pool.map(_score_chunk, batches):
+                    for report_pk, risk_level in results:
+                        if risk_level is None:
+                            checkpoint['failed'] += 1
+                        elif risk_level != current_levels[report_pk]:
+                            updates.append({'id': report_pk, 'risk_level': risk_level})
+
+                if updates:
+                    self.db.session.bulk_update_mappings(SensitiveReport, updates)
+                self.db.session.commit()
+
+                checkpoint['last_id'] = rows[-1].id
+                checkpoint['scanned'] += len(rows)
+                checkpoint['updated'] += len(updates)
+                self._save_checkpoint(checkpoint)
+                logger.info(f"Rescored {checkpoint['scanned']} reports, {checkpoint['updated']} updated")
+
+        checkpoint['completed'] = True
+        self._save_checkpoint(checkpoint)
+        return checkpoint
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rescore SensitiveReport risk levels in bulk')
+    parser.add_argument('--status', default='pending', help="Report status to rescore, or 'all'")
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from main import app, db
+    from security.keyring import LEGACY_KEY_ID, keyring
+
+    with app.app_context():
+        job = ReportRescoringJob(
+            db,
+            keyring.get('data', LEGACY_KEY_ID),
+            checkpoint_file=args.checkpoint,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            status=None if args.status == 'all' else args.status,
+            master_keys=keyring.decryptable_versions('master')
+        )
+        result = job.run()
+        logger.info(f"Rescoring finished: {result}")
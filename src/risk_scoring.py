@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+from typing import Dict, Any, Iterable, List, Set, Tuple
+
+try:
+    import ahocorasick  # pyahocorasick, optional C implementation
+except ImportError:
+    ahocorasick = None
+
+RISK_KEYWORDS_FILE = os.getenv(
+    'RISK_KEYWORDS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'risk_keywords.json')
+)
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over lowercased keywords.
+
+    Built once, then finds every (category, keyword) occurrence in a single
+    pass over the text, including overlapping matches, with pyahocorasick.
+    Without it each keyword is checked with a substring search of the
+    lowercased text, which for a keyword list this size is faster in
+    CPython than an automaton walked character by character in Python.
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, str]]):
+        outputs: Dict[str, List[Tuple[str, str]]] = {}
+        for category, keyword in keywords:
+            keyword = keyword.lower()
+            if keyword:
+                outputs.setdefault(keyword, []).append((category, keyword))
+
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, matches in outputs.items():
+                self._automaton.add_word(keyword, tuple(matches))
+            self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            self._keywords = [(keyword, tuple(matches)) for keyword, matches in outputs.items()]
+
+    def find(self, text: str) -> Dict[str, Set[str]]:
+        """Return {category: {matched keywords}} for lowercased text."""
+        hits: Dict[str, Set[str]] = {}
+        if self._automaton is not None:
+            for _, matches in self._automaton.iter(text):
+                for category, keyword in matches:
+                    hits.setdefault(category, set()).add(keyword)
+            return hits
+
+        for keyword, matches in self._keywords:
+            if keyword in text:
+                for category, _ in matches:
+                    hits.setdefault(category, set()).add(keyword)
+        return hits
+
+
+class RiskScorer:
+    def __init__(self, config_file: str = RISK_KEYWORDS_FILE):
+        self.logger = logging.getLogger(__name__)
+        self.config = self._load_config(config_file)
+        self.base_risk: Dict[str, float] = self.config['base_risk']
+        self.default_base_risk: float = self.config.get('default_base_risk', 5.0)
+        self.keyword_weight: float = self.config.get('keyword_weight', 0.5)
+        self.max_keyword_bonus: float = self.config.get('max_keyword_bonus', 2.0)
+        self.automaton = KeywordAutomaton(
+            (category, keyword)
+            for category, languages in self.config['keywords'].items()
+            for keywords in languages.values()
+            for keyword in keywords
+        )
+
+    def _load_config(self, config_file: str) -> Dict[str, Any]:
+        """Load risk keyword lists (English, Swahili and Sheng) and weights"""
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.logger.info(f"Loaded risk keywords for {len(config['keywords'])} categories from {config_file}")
+        return config
+
+    def score(self, content: str, category: str) -> Dict[str, Any]:
+        """
+        Score content for its submitted category, from that category's base
+        risk and keyword hits. Keywords are plain substrings (so "hate"
+        also matches "whatever"), which is why hits of other categories are
+        only reported, in category_hits, and never raise the score.
+        """
+        hits = self.automaton.find(content.lower())
+        base = self.base_risk.get(category, self.default_base_risk)
+        bonus = min(len(hits.get(category, ())) * self.keyword_weight, self.max_keyword_bonus)
+        return {
+            'score': min(base + bonus, 10.0),
+            'category_hits': {cat: sorted(keywords) for cat, keywords in hits.items()}
+        }
+
+
+def risk_score_to_level(score: float) -> int:
+    """Map a 0-10 risk score onto SensitiveReport.risk_level (1-5)"""
+    return min(max(int(-(-score // 2)), 1), 5)
+
+
+# Initialize risk scorer
+risk_scorer = RiskScorer()
@@ -0,0 +1,296 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from security.audit_chain import AuditChainError, check_checkpoints, load_checkpoints, parse_line, verify_entries
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_MAX_BYTES = int(os.getenv('AUDIT_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+SEGMENT_MAX_SECONDS = float(os.getenv('AUDIT_SEGMENT_MAX_SECONDS', '86400'))
+ZSTD_LEVEL = int(os.getenv('AUDIT_ZSTD_LEVEL', '10'))
+# Defaults to the audit_logs policy in PrivacyManager
+RETENTION_DAYS = os.getenv('AUDIT_RETENTION_DAYS')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+CODEC_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+
+internal_logger = logging.getLogger(__name__)
+
+
+def archive_dir_for(log_file: str) -> str:
+    return os.getenv('AUDIT_ARCHIVE_DIR') or os.path.join(os.path.dirname(log_file), 'archive')
+
+
+def default_retention_days() -> Optional[int]:
+    if RETENTION_DAYS:
+        return int(RETENTION_DAYS)
+    from security.privacy_manager import privacy_manager
+    return privacy_manager.retention_policies['audit_logs']['retention_period_days']
+
+
+def compress(data: bytes, level: int = ZSTD_LEVEL) -> Tuple[bytes, str]:
+    """zstd when the zstandard package is installed, gzip otherwise"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(data), 'zstd'
+    return gzip.compress(data, compresslevel=6), 'gzip'
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if zstandard is None:
+        raise RuntimeError("Reading zstd audit segments requires the zstandard package")
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def parse_entry(line: bytes) -> Optional[Dict[str, Any]]:
+    """Fields of an audit log line; None for a line that is not an audit record"""
+    try:
+        body, seq, digest = parse_line(line)
+    except AuditChainError:
+        # Written before the log was chained
+        body, seq, digest = line.decode('utf-8').rstrip('\n'), None, None
+    parts = body.split(' | ', 2)
+    if len(parts) != 3 or ': ' not in parts[2]:
+        return None
+    try:
+        created = datetime.strptime(parts[0], TIME_FORMAT)
+    except ValueError:
+        return None
+    event, _, data = parts[2].partition(': ')
+    return {'time': created, 'level': parts[1], 'event': event, 'data': json.loads(data),
+            'seq': seq, 'hash': digest}
+
+
+def _line_time(line: bytes) -> Optional[datetime]:
+    try:
+        return datetime.strptime(line[:19].decode(), TIME_FORMAT)
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+def _verify_segment(args: Tuple[str, str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    path, codec, checkpoints = args
+    try:
+        with open(path, 'rb') as f:
+            data = decompress(f.read(), codec)
+    except Exception as e:
+        return {'entries': 0, 'errors': [f"{os.path.basename(path)}: cannot be read ({e})"]}
+    entries, errors = 0, []
+    for start, end in zip(checkpoints, checkpoints[1:]):
+        outcome = verify_entries(data[start['offset']:end['offset']], start, end)
+        entries += outcome['entries']
+        if outcome['error']:
+            errors.append(outcome['error'])
+    if len(data) != checkpoints[-1]['offset']:
+        errors.append(f"checkpoint {checkpoints[-1]['seq']}: segment has data after its last checkpoint")
+    return {'entries': entries, 'errors': errors}
+
+
+class AuditArchive:
+    """
+    Sealed audit log segments, compressed and read-only, with a manifest.
+
+    The audit writer rotates logs/audit.log into a segment once it reaches
+    SEGMENT_MAX_BYTES or SEGMENT_MAX_SECONDS. A segment keeps its hash
+    chain checkpoints next to it, and the chain continues into the next
+    segment, so archived history verifies the same way as the live log.
+    manifest.json lists each segment's sequence and time range, so a time
+    range read only decompresses the segments that overlap it. Segments
+    older than the retention period are deleted oldest first.
+
+    Times are the log lines' own local timestamps.
+    """
+
+    def __init__(self, directory: str, retention_days: Optional[int] = None, zstd_level: int = ZSTD_LEVEL):
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, 'manifest.json')
+        self.retention_days = retention_days if retention_days is not None else default_retention_days()
+        self.zstd_level = zstd_level
+
+    def load_manifest(self) -> Dict[str, Any]:
+        if not os.path.exists(self.manifest_file):
+            return {'segments': [], 'pruned_through_seq': None}
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+
+    def _write_immutable(self, path: str, data: bytes):
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_file, 0o444)
+        os.replace(tmp_file, path)
+
+    def last_segment(self) -> Optional[Dict[str, Any]]:
+        segments = self.load_manifest()['segments']
+        return segments[-1] if segments else None
+
+    def add_segment(self, log_file: str, checkpoint_file: str) -> Dict[str, Any]:
+        """Compress a sealed log file and its checkpoints into the archive"""
+        with open(log_file, 'rb') as f:
+            data = f.read()
+        checkpoints = load_checkpoints(checkpoint_file)
+        first, last = checkpoints[0], checkpoints[-1]
+        times = [t for t in (_line_time(line) for line in data[first['offset']:].splitlines()) if t]
+
+        compressed, codec = compress(data, self.zstd_level)
+        name = f"audit-{first['seq']:012d}-{last['seq']:012d}"
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_immutable(os.path.join(self.directory, name + '.log' + CODEC_SUFFIXES[codec]), compressed)
+        with open(checkpoint_file, 'rb') as f:
+            self._write_immutable(os.path.join(self.directory, name + '.checkpoints'), f.read())
+
+        segment = {
+            'name': name,
+            'file': name + '.log' + CODEC_SUFFIXES[codec],
+            'checkpoints': name + '.checkpoints',
+            'codec': codec,
+            'seq_start': first['seq'],
+            'seq_end': last['seq'],
+            'chain_start': first['chain_hash'],
+            'chain_end': last['chain_hash'],
+            'first_signature': first['signature'],
+            'first_time': min(times).isoformat() if times else None,
+            'last_time': max(times).isoformat() if times else None,
+            'bytes': len(data),
+            'stored_bytes': len(compressed),
+            'sha256': hashlib.sha256(compressed).hexdigest(),
+            'archived_at': datetime.utcnow().isoformat()
+        }
+        manifest = self.load_manifest()
+        manifest['segments'].append(segment)
+        self._save_manifest(manifest)
+        return segment
+
+    def segments(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Segments with lines in [start, end)"""
+        return [
+            segment for segment in self.load_manifest()['segments']
+            if segment['first_time'] is not None
+            and (start is None or datetime.fromisoformat(segment['last_time']) >= start)
+            and (end is None or datetime.fromisoformat(segment['first_time']) < end)
+        ]
+
+    def read_segment(self, segment: Dict[str, Any]) -> bytes:
+        with open(os.path.join(self.directory, segment['file']), 'rb') as f:
+            return decompress(f.read(), segment['codec'])
+
+    def enforce_retention(self, now: Optional[datetime] = None) -> int:
+        """Delete segments whose newest line is past the retention period. Returns the number deleted."""
+        if not self.retention_days:
+            return 0
+        cutoff = (now or datetime.now()) - timedelta(days=self.retention_days)
+        manifest = self.load_manifest()
+        expired = 0
+        for segment in manifest['segments']:
+            if segment['last_time'] is None or datetime.fromisoformat(segment['last_time']) >= cutoff:
+                break
+            expired += 1
+        if not expired:
+            return 0
+
+        removed, manifest['segments'] = manifest['segments'][:expired], manifest['segments'][expired:]
+        manifest['pruned_through_seq'] = removed[-1]['seq_end']
+        # The manifest goes first, so a crash leaves unlisted files rather than listed missing ones
+        self._save_manifest(manifest)
+        for segment in removed:
+            for name in (segment['file'], segment['checkpoints']):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+        internal_logger.info(f"Deleted {expired} audit segments past {self.retention_days} days retention")
+        return expired
+
+    def verify(self, keyring, workers: int = 1, incremental: bool = False) -> Dict[str, Any]:
+        """
+        Verify archived segments: file checksums, checkpoint signatures,
+        chain continuity between segments, and every entry's hash. With
+        incremental=True segments verified by an earlier run are only
+        checked against their manifest checksum.
+        """
+        state_file = os.path.join(self.directory, 'verified.json')
+        verified = set()
+        if incremental and os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                verified = set(json.load(f)['segments'])
+
+        segments = self.load_manifest()['segments']
+        result = {'ok': True, 'segments': len(segments), 'entries': 0, 'errors': []}
+        tasks = []
+        previous = None
+        for segment in segments:
+            path = os.path.join(self.directory, segment['file'])
+            with open(path, 'rb') as f:
+                intact = hashlib.sha256(f.read()).hexdigest() == segment['sha256']
+            if not intact:
+                result['errors'].append(f"segment {segment['name']}: checksum mismatch")
+            if previous is not None and (segment['seq_start'], segment['chain_start']) != (
+                    previous['seq_end'], previous['chain_end']):
+                result['errors'].append(f"segment {segment['name']}: does not continue {previous['name']}")
+            previous = segment
+
+            checkpoints = load_checkpoints(os.path.join(self.directory, segment['checkpoints']))
+            errors = check_checkpoints(checkpoints, keyring)
+            if (checkpoints[0]['signature'], checkpoints[-1]['chain_hash']) != (
+                    segment['first_signature'], segment['chain_end']):
+                errors.append(f"segment {segment['name']}: checkpoints do not match the manifest")
+            result['errors'].extend(errors)
+            if intact and segment['name'] not in verified:
+                tasks.append((path, segment['codec'], checkpoints))
+
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                outcomes = list(pool.map(_verify_segment, tasks))
+        else:
+            outcomes = [_verify_segment(task) for task in tasks]
+        for outcome in outcomes:
+            result['entries'] += outcome['entries']
+            result['errors'].extend(outcome['errors'])
+
+        result['ok'] = not result['errors']
+        if result['ok'] and segments:
+            with open(state_file, 'w') as f:
+                json.dump({'segments': [segment['name'] for segment in segments],
+                           'verified_at': datetime.utcnow().isoformat()}, f)
+        return result
+
+    def get_status(self) -> Dict[str, Any]:
+        manifest = self.load_manifest()
+        segments = manifest['segments']
+        return {
+            'segments': len(segments),
+            'bytes': sum(segment['bytes'] for segment in segments),
+            'stored_bytes': sum(segment['stored_bytes'] for segment in segments),
+            'oldest': segments[0]['first_time'] if segments else None,
+            'pruned_through_seq': manifest['pruned_through_seq'],
+            'retention_days': self.retention_days
+        }
+
+
+def filter_entries(lines: Iterable[bytes], start: Optional[datetime], end: Optional[datetime]) -> Iterator[Dict[str, Any]]:
+    for line in lines:
+        entry = parse_entry(line)
+        if entry is None:
+            continue
+        if (start is None or entry['time'] >= start) and (end is None or entry['time'] < end):
+            yield entry
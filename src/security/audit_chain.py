@@ -0,0 +1,304 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+CHECKPOINT_INTERVAL = int(os.getenv('AUDIT_CHECKPOINT_INTERVAL', '1000'))
+GENESIS_HASH = '0' * 64
+EMPTY_ROOT = hashlib.sha256(b'').hexdigest()
+KEY_PURPOSE = 'audit'
+
+internal_logger = logging.getLogger(__name__)
+
+
+class AuditChainError(ValueError):
+    """Raised when an audit log or its checkpoints do not verify"""
+
+
+def entry_hash(prev_hash: str, seq: int, body: str) -> str:
+    return hashlib.sha256(f"{prev_hash}|{seq}|{body}".encode('utf-8')).hexdigest()
+
+
+def merkle_root(leaves: List[str]) -> str:
+    """Root of a binary SHA-256 tree over entry hashes; an odd node is paired with itself"""
+    if not leaves:
+        return EMPTY_ROOT
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def parse_line(line: bytes) -> Tuple[str, int, str]:
+    """Split a chained line into (body, seq, hash)"""
+    body, _, chain = line.decode('utf-8').rstrip('\n').rpartition(' | ')
+    seq, _, digest = chain.partition(' ')
+    if not body or not seq.isdigit() or len(digest) != 64:
+        raise AuditChainError("Line is not a chained audit entry")
+    return body, int(seq), digest
+
+
+def sign_checkpoint(key: bytes, checkpoint: Dict[str, Any]) -> str:
+    fields = {name: value for name, value in checkpoint.items() if name != 'signature'}
+    return hmac.new(key, json.dumps(fields, sort_keys=True).encode(), hashlib.sha256).hexdigest()
+
+
+class AuditChain:
+    """
+    Hash chain over the lines of an append-only audit log.
+
+    Every line ends with " | <seq> <hash>", where hash covers the previous
+    line's hash, seq and the line body, so editing, removing or reordering
+    a line breaks every hash after it. Every interval entries a checkpoint
+    is appended to "<log_file>.checkpoints": the byte offset and chain hash
+    reached, plus the Merkle root of the interval's entry hashes, signed
+    with the keyring's audit key so the chain cannot simply be recomputed.
+    Checkpoints let a verifier check intervals independently and start
+    from the last verified one instead of the beginning of the log.
+    """
+
+    def __init__(self, log_file: str, keyring=None, checkpoint_interval: int = CHECKPOINT_INTERVAL):
+        if keyring is None:
+            from security.keyring import keyring
+        self.log_file = log_file
+        self.checkpoint_file = f"{log_file}.checkpoints"
+        self.keyring = keyring
+        self.checkpoint_interval = checkpoint_interval
+
+        self.seq = 0
+        self.head = GENESIS_HASH
+        self.started_at = None
+        self.start_seq = 0
+        self._leaves: List[str] = []
+        self._pending: List[str] = []
+
+    def resume(self, log, origin: Optional[Tuple[int, str]] = None) -> None:
+        """
+        Continue the chain of an open log file (binary append mode).
+
+        Only the entries after the last checkpoint are read. A new file
+        gets a first checkpoint that continues from origin, the (seq, hash)
+        reached by the previous segment; a log that predates chaining gets
+        it at its current end. A partly written last line from a crash is
+        cut off. A tail that does not verify raises AuditChainError, with
+        the chain left at the last entry that does.
+        """
+        checkpoints = load_checkpoints(self.checkpoint_file)
+        size = os.path.getsize(self.log_file)
+        self._pending = []
+        if not checkpoints:
+            self.seq, self.head = origin or (0, GENESIS_HASH)
+            self._leaves = []
+            self.started_at, self.start_seq = datetime.utcnow(), self.seq
+            self.checkpoint(size)
+            return
+
+        self.started_at = datetime.fromisoformat(checkpoints[0]['created'])
+        self.start_seq = checkpoints[0]['seq']
+        last = checkpoints[-1]
+        self.seq, self.head, self._leaves = last['seq'], last['chain_hash'], []
+        with open(self.log_file, 'rb') as f:
+            f.seek(last['offset'])
+            tail = f.read()
+        if tail and not tail.endswith(b'\n'):
+            internal_logger.warning(f"Discarding a partly written line at the end of {self.log_file}")
+            log.truncate(last['offset'] + tail.rfind(b'\n') + 1)
+            tail = tail[:tail.rfind(b'\n') + 1]
+        for line in tail.splitlines():
+            try:
+                body, seq, digest = parse_line(line)
+            except AuditChainError:
+                raise AuditChainError(f"Unparseable line after entry {self.seq} of {self.log_file}")
+            if seq != self.seq or entry_hash(self.head, seq, body) != digest:
+                raise AuditChainError(f"Audit chain of {self.log_file} does not verify at entry {self.seq}")
+            self.seq, self.head = seq + 1, digest
+            self._leaves.append(digest)
+
+    def link(self, body: str) -> Tuple[str, str]:
+        """
+        Return (line, hash) for the entry after the pending ones. The chain
+        itself only advances on commit(), once the lines are written.
+        """
+        seq = self.seq + len(self._pending)
+        digest = entry_hash(self._pending[-1] if self._pending else self.head, seq, body)
+        self._pending.append(digest)
+        return f"{body} | {seq} {digest}\n", digest
+
+    def commit(self):
+        """The pending lines have been written"""
+        if self._pending:
+            self.seq += len(self._pending)
+            self.head = self._pending[-1]
+            self._leaves.extend(self._pending)
+            self._pending = []
+
+    def rollback(self):
+        """The pending lines were not written"""
+        self._pending = []
+
+    @property
+    def checkpoint_due(self) -> bool:
+        return len(self._leaves) + len(self._pending) >= self.checkpoint_interval
+
+    @property
+    def unsealed(self) -> int:
+        """Entries written since the last checkpoint"""
+        return len(self._leaves)
+
+    def checkpoint(self, offset: int) -> Dict[str, Any]:
+        """Seal the committed entries since the last checkpoint; the log must be fsynced up to offset"""
+        self.keyring.ensure(KEY_PURPOSE)
+        key_id, key = self.keyring.active(KEY_PURPOSE)
+        checkpoint = {
+            'seq': self.seq,
+            'offset': offset,
+            'chain_hash': self.head,
+            'count': len(self._leaves),
+            'merkle_root': merkle_root(self._leaves),
+            'created': datetime.utcnow().isoformat(),
+            'key_id': key_id
+        }
+        checkpoint['signature'] = sign_checkpoint(key, checkpoint)
+        with open(self.checkpoint_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(checkpoint, sort_keys=True) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._leaves = []
+        return checkpoint
+
+
+def load_checkpoints(checkpoint_file: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(checkpoint_file):
+        return []
+    with open(checkpoint_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def verify_interval(log_file: str, start: Dict[str, Any], end: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Recompute the chain from checkpoint start up to checkpoint end, or to
+    the end of the file when end is None. Returns the entry count and the
+    first error found, if any.
+    """
+    with open(log_file, 'rb') as f:
+        f.seek(start['offset'])
+        data = f.read(end['offset'] - start['offset']) if end else f.read()
+    return verify_entries(data, start, end)
+
+
+def verify_entries(data: bytes, start: Dict[str, Any], end: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """verify_interval over the bytes between two checkpoints"""
+    seq, head, leaves = start['seq'], start['chain_hash'], []
+    for line in data.splitlines():
+        try:
+            body, line_seq, digest = parse_line(line)
+        except AuditChainError as e:
+            return {'entries': len(leaves), 'error': f"entry {seq}: {e}"}
+        if line_seq != seq:
+            return {'entries': len(leaves), 'error': f"entry {seq}: found sequence number {line_seq}"}
+        if entry_hash(head, seq, body) != digest:
+            return {'entries': len(leaves), 'error': f"entry {seq}: hash mismatch"}
+        seq, head = seq + 1, digest
+        leaves.append(digest)
+
+    if end is not None:
+        if seq != end['seq'] or head != end['chain_hash']:
+            return {'entries': len(leaves), 'error': f"checkpoint {end['seq']}: chain ends at entry {seq}"}
+        if merkle_root(leaves) != end['merkle_root']:
+            return {'entries': len(leaves), 'error': f"checkpoint {end['seq']}: Merkle root mismatch"}
+    return {'entries': len(leaves), 'error': None}
+
+
+def check_checkpoints(checkpoints: List[Dict[str, Any]], keyring) -> List[str]:
+    """Signature and sequence errors of a segment's checkpoints"""
+    errors = []
+    previous = None
+    for checkpoint in checkpoints:
+        try:
+            key = keyring.get(KEY_PURPOSE, checkpoint['key_id'])
+        except KeyError:
+            key = None
+        if key is None or not hmac.compare_digest(sign_checkpoint(key, checkpoint), checkpoint['signature']):
+            errors.append(f"checkpoint {checkpoint['seq']}: bad signature")
+        if previous is not None and (checkpoint['seq'] != previous['seq'] + checkpoint['count']
+                                     or checkpoint['offset'] < previous['offset']):
+            errors.append(f"checkpoint {checkpoint['seq']}: out of sequence")
+        previous = checkpoint
+    return errors
+
+
+def _verify_intervals(args: Tuple[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    log_file, intervals = args
+    return [verify_interval(log_file, start, end) for start, end in intervals]
+
+
+def verify_log(log_file: str, keyring=None, workers: int = 1, incremental: bool = False) -> Dict[str, Any]:
+    """
+    Verify an audit log against its checkpoints.
+
+    Checkpoint signatures and their sequence are checked first; the
+    intervals between checkpoints are then rehashed, in a process pool
+    when workers > 1. With incremental=True only intervals after the last
+    checkpoint a previous run verified are rehashed, and it is an error if
+    that checkpoint is no longer in the log. Entries after the last
+    checkpoint are chained but not yet sealed, and are checked too.
+    """
+    if keyring is None:
+        from security.keyring import keyring
+    state_file = f"{log_file}.verified"
+    checkpoints = load_checkpoints(f"{log_file}.checkpoints")
+    result = {'ok': True, 'entries': 0, 'checkpoints': len(checkpoints), 'unsealed': 0, 'errors': []}
+    if not checkpoints:
+        result.update(ok=False, errors=['no checkpoints; the log is not chained'])
+        return result
+
+    result['errors'].extend(check_checkpoints(checkpoints, keyring))
+
+    first = 0
+    if incremental and os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+        first = next((i for i, checkpoint in enumerate(checkpoints)
+                      if checkpoint['seq'] == state['seq'] and checkpoint['chain_hash'] == state['chain_hash']), None)
+        if first is None and state['seq'] < checkpoints[0]['seq']:
+            # Verified up to a checkpoint that has since been rotated into the archive
+            first = 0
+        elif first is None:
+            # Starting over from the beginning would pass a log cut back before what was already verified
+            result.update(ok=False, errors=result['errors'] + [
+                f"last verified checkpoint {state['seq']} is missing; the log or its checkpoints were truncated"])
+            return result
+    intervals = list(zip(checkpoints[first:], checkpoints[first + 1:]))
+
+    if workers > 1 and len(intervals) > 1:
+        per_task = max(1, len(intervals) // (workers * 4))
+        tasks = [(log_file, intervals[i:i + per_task]) for i in range(0, len(intervals), per_task)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = [outcome for chunk in pool.map(_verify_intervals, tasks) for outcome in chunk]
+    else:
+        outcomes = _verify_intervals((log_file, intervals))
+
+    for outcome in outcomes:
+        result['entries'] += outcome['entries']
+        if outcome['error']:
+            result['errors'].append(outcome['error'])
+
+    tail = verify_interval(log_file, checkpoints[-1], None)
+    result['unsealed'] = tail['entries']
+    if tail['error']:
+        result['errors'].append(tail['error'])
+
+    result['ok'] = not result['errors']
+    result['verified_from'] = checkpoints[first]['seq']
+    if result['ok']:
+        last = checkpoints[-1]
+        with open(state_file, 'w') as f:
+            json.dump({'seq': last['seq'], 'chain_hash': last['chain_hash'],
+                       'verified_at': datetime.utcnow().isoformat()}, f)
+    return result
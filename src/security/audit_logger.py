@@ -2,35 +2,44 @@ import json
 import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
-import psutil
-import socket
 from functools import wraps
 import traceback
 import os
 
+from security.audit_pipeline import AuditPipeline, AuditQueueHandler
+from security.system_metrics import SystemMetricsSampler, system_metrics
+
+SEVERITY_LEVELS = {
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL
+}
+
 class AuditLogger:
-    def __init__(self):
-        self.logger = logging.getLogger('audit')
+    def __init__(self, pipeline: Optional[AuditPipeline] = None, logger_name: str = 'audit',
+                 metrics: Optional[SystemMetricsSampler] = None):
+        self.logger = logging.getLogger(logger_name)
+        self.metrics = metrics or system_metrics
         self.logger.setLevel(logging.INFO)
 
-        # Create logs directory if it doesn't exist
-        os.makedirs('logs', exist_ok=True)
+        # Records are queued and written to logs/audit.log (and AdminAuditLog)
+        # by the pipeline's writer thread, off the request path
+        self.pipeline = pipeline or AuditPipeline()
+        self.logger.addHandler(AuditQueueHandler(self.pipeline))
 
-        # Create audit log file handler
-        audit_handler = logging.FileHandler('logs/audit.log')
-        audit_handler.setLevel(logging.INFO)
+    def init_app(self, app, db):
+        self.pipeline.init_app(app, db)
 
-        # Create formatter for structured logging
-        formatter = logging.Formatter(
-            '%(asctime)s | %(levelname)s | %(audit_data)s'
-        )
-        audit_handler.setFormatter(formatter)
-        self.logger.addHandler(audit_handler)
+    def _emit(self, level: int, event: str, data: Dict[str, Any]):
+        self.logger.log(level, event, extra={'audit_event': event, 'audit_data': data})
 
     def log_admin_action(self, admin_user_id: str, action: str,
                         target_resource: str, details: Dict[str, Any],
-                        justification: str = None):
-        """Log all admin actions with full context"""
+                        justification: str = None, severity: str = 'info'):
+        """Log all admin actions with full context; severity is info, warning, error or critical"""
+        if severity not in SEVERITY_LEVELS:
+            raise ValueError(f"Unknown audit severity {severity}")
 
         # Get system context
         system_context = self._get_system_context()
@@ -39,6 +48,7 @@ class AuditLogger:
             'timestamp': datetime.utcnow().isoformat(),
             'admin_user_id': admin_user_id,
             'action': action,
+            'severity': severity,
             'target_resource': target_resource,
             'target_details': details,
             'justification': justification,
@@ -51,10 +61,8 @@ class AuditLogger:
         if self._is_sensitive_action(action):
             audit_data['stack_trace'] = traceback.format_stack()
 
-        self.logger.info(f"ADMIN_ACTION: {json.dumps(audit_data)}")
-
-        # Store in database for querying
-        self._store_audit_record(audit_data)
+        # Written to the log file and AdminAuditLog in batches by the pipeline
+        self._emit(SEVERITY_LEVELS[severity], 'ADMIN_ACTION', audit_data)
 
     def log_data_access(self, user_id: str, resource_type: str,
                        resource_id: str, access_type: str):
@@ -70,7 +78,7 @@ class AuditLogger:
             'user_agent': self._get_user_agent()
         }
 
-        self.logger.info(f"DATA_ACCESS: {json.dumps(access_data)}")
+        self._emit(logging.INFO, 'DATA_ACCESS', access_data)
 
     def log_decryption_event(self, report_id: str, admin_user_id: str,
                            fields_accessed: list, reason: str):
@@ -86,18 +94,11 @@ class AuditLogger:
             'justification_required': True
         }
 
-        self.logger.warning(f"DECRYPTION_EVENT: {json.dumps(decryption_data)}")
+        self._emit(logging.WARNING, 'DECRYPTION_EVENT', decryption_data)
 
     def _get_system_context(self) -> Dict[str, Any]:
-        """Get current system context for audit trail"""
-        return {
-            'hostname': socket.gethostname(),
-            'ip_address': socket.gethostbyname(socket.gethostname()),
-            'cpu_usage': psutil.cpu_percent(),
-            'memory_usage': psutil.virtual_memory().percent,
-            'disk_usage': psutil.disk_usage('/').percent,
-            'process_id': os.getpid()
-        }
+        """Get current system context for audit trail (sampled every few seconds, not per call)"""
+        return self.metrics.snapshot()
 
     def _get_session_info(self) -> Dict[str, Any]:
         """Get session information"""
@@ -149,13 +150,5 @@ class AuditLogger:
         ]
         return action in sensitive_actions
 
-    def _store_audit_record(self, audit_data: Dict[str, Any]):
-        """Store audit record in database"""
-        # Implementation for database storage
-        # audit_record = AdminAuditLog(**audit_data)
-        # db.session.add(audit_record)
-        # db.session.commit()
-        pass
-
 # Initialize audit logger
 audit_logger = AuditLogger()
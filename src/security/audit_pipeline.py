@@ -0,0 +1,468 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from logging.handlers import QueueHandler
+from typing import Dict, Any, Iterator, List, Optional
+
+from security.audit_archive import (AuditArchive, SEGMENT_MAX_BYTES, SEGMENT_MAX_SECONDS, archive_dir_for,
+                                    filter_entries)
+from security.audit_chain import AuditChain, AuditChainError, CHECKPOINT_INTERVAL, load_checkpoints
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+AUDIT_LOG_FILE = os.getenv('AUDIT_LOG_FILE', 'logs/audit.log')
+QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '500'))
+FSYNC_INTERVAL_SECONDS = float(os.getenv('AUDIT_FSYNC_INTERVAL_SECONDS', '1'))
+# 'drop': a full queue drops the record and counts it; the count is written
+# as an AUDIT_OVERFLOW record once there is room, so the gap is visible.
+# 'block': wait up to AUDIT_BLOCK_SECONDS for room, then drop and count.
+OVERFLOW_POLICY = os.getenv('AUDIT_OVERFLOW_POLICY', 'drop')
+BLOCK_SECONDS = float(os.getenv('AUDIT_BLOCK_SECONDS', '0.01'))
+# A batch that cannot be written is retried this many times, backing off
+# from AUDIT_RETRY_SECONDS, then counted as dropped like an overflow
+WRITE_RETRIES = int(os.getenv('AUDIT_WRITE_RETRIES', '3'))
+RETRY_SECONDS = float(os.getenv('AUDIT_RETRY_SECONDS', '0.1'))
+ERROR_SEVERITIES = ('error', 'critical')
+
+internal_logger = logging.getLogger(__name__)
+
+
+class AuditQueueHandler(QueueHandler):
+    """Puts the raw record on the queue; formatting and JSON encoding happen on the writer thread"""
+
+    def __init__(self, pipeline: 'AuditPipeline'):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        self.pipeline.put(record)
+
+
+class AuditPipeline:
+    """
+    Bounded queue between audit callers and a background writer.
+
+    Callers only append a LogRecord to the queue. The writer thread drains
+    it in batches: each batch is JSON-encoded and appended to the audit
+    log file with one write, admin actions are inserted into AdminAuditLog
+    with one executemany, and the file is fsynced at most every
+    fsync_interval seconds. What happens when the queue is full is set by
+    overflow_policy; records are never lost silently. Lines are hash
+    chained and sealed by signed checkpoints (see AuditChain), and the
+    file is rotated into the AuditArchive once it reaches segment_max_bytes
+    or segment_max_seconds.
+
+    Every worker process has its own pipeline on the same file, so each
+    batch is written, and the file rotated, under an exclusive lock on
+    "<log_file>.lock". A writer that finds the file or its checkpoints
+    changed since its own last write first resumes the chain from them,
+    and one whose file was rotated away by another process reopens it, so
+    the processes extend one chain instead of interleaving several. A
+    failed write leaves the chain where it was; the file is reopened, the
+    chain resumed from it and the batch retried up to write_retries times
+    before its records are counted as dropped. A log whose chain does not
+    verify is moved aside to "<log_file>.broken-<time>" and the chain
+    continues in a new file from its last verified entry, starting with an
+    AUDIT_CHAIN_BREAK record.
+    """
+
+    def __init__(self, log_file: str = AUDIT_LOG_FILE, queue_size: int = QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE, fsync_interval: float = FSYNC_INTERVAL_SECONDS,
+                 overflow_policy: str = OVERFLOW_POLICY, block_seconds: float = BLOCK_SECONDS,
+                 keyring=None, checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                 archive: Optional[AuditArchive] = None, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 segment_max_seconds: float = SEGMENT_MAX_SECONDS, write_retries: int = WRITE_RETRIES,
+                 retry_seconds: float = RETRY_SECONDS):
+        if overflow_policy not in ('drop', 'block'):
+            raise ValueError(f"Unknown audit overflow policy {overflow_policy}")
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.overflow_policy = overflow_policy
+        self.block_seconds = block_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.chain = AuditChain(log_file, keyring, checkpoint_interval)
+        self.archive = archive or AuditArchive(archive_dir_for(log_file))
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.write_retries = write_retries
+        self.retry_seconds = retry_seconds
+
+        self.dropped = 0
+        self._unreported_drops = 0
+        self._breaks: List[Dict[str, Any]] = []
+        self._file = None
+        self._end = None
+        self._last_fsync = 0.0
+        self._app = None
+        self._db = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def init_app(self, app, db):
+        """Also insert admin actions into AdminAuditLog"""
+        self._app = app
+        self._db = db
+
+    def put(self, record: logging.LogRecord):
+        self._ensure_started()
+        try:
+            if self.overflow_policy == 'block':
+                self.queue.put(record, timeout=self.block_seconds)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported_drops += 1
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    if self._thread is None:
+                        atexit.register(self.close)
+                    self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                    self._thread.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Write out what is queued and fsync the log file"""
+        if self._thread is not None:
+            self.flush(timeout)
+        with self._file_lock, self._writer_lock():
+            if self._file is not None:
+                # A rotation by another process already sealed what this file holds
+                if not self._rotated():
+                    self._sync()
+                    os.fsync(self._file.fileno())
+                    if self.chain.unsealed:
+                        self.chain.checkpoint(self._size())
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                internal_logger.error(f"Audit writer gave up on {len(batch)} records: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _overflow_entry(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            dropped, self._unreported_drops = self._unreported_drops, 0
+        if not dropped:
+            return None
+        return {'event': 'AUDIT_OVERFLOW', 'level': 'ERROR', 'created': time.time(),
+                'data': {'timestamp': datetime.utcnow().isoformat(), 'dropped_records': dropped}}
+
+    @staticmethod
+    def _entry(record: logging.LogRecord) -> Dict[str, Any]:
+        return {
+            'event': getattr(record, 'audit_event', record.getMessage()),
+            'level': record.levelname,
+            'created': record.created,
+            'data': getattr(record, 'audit_data', None)
+        }
+
+    def _format(self, entry: Dict[str, Any]) -> str:
+        """Line body; the chain appends the sequence number and hash"""
+        asctime = datetime.fromtimestamp(entry['created']).strftime('%Y-%m-%d %H:%M:%S')
+        return f"{asctime} | {entry['level']} | {entry['event']}: {json.dumps(entry['data'], default=str)}"
+
+    def _write(self, records: List[logging.LogRecord]):
+        entries = [self._entry(record) for record in records]
+        overflow = self._overflow_entry()
+        if overflow is not None:
+            entries.append(overflow)
+
+        try:
+            self._retry(self._write_file, entries)
+        except Exception:
+            # Reported in the next batch that is written, like an overflow
+            lost = sum(1 for entry in entries if entry is not overflow and not entry.get('written'))
+            unreported = overflow['data']['dropped_records'] if overflow and not overflow.get('written') else 0
+            with self._lock:
+                self.dropped += lost
+                self._unreported_drops += lost + unreported
+            raise
+        if self._app is not None:
+            self._retry(self._store, entries)
+
+    def _retry(self, step, entries: List[Dict[str, Any]]):
+        for attempt in range(self.write_retries + 1):
+            try:
+                return step(entries)
+            except Exception as e:
+                if attempt == self.write_retries:
+                    raise
+                internal_logger.warning(f"Audit writer retrying {step.__name__}: {e}")
+                time.sleep(self.retry_seconds * 2 ** attempt)
+
+    def _break_entry(self, error: str, moved_to: str, seq: int) -> Dict[str, Any]:
+        return {'event': 'AUDIT_CHAIN_BREAK', 'level': 'ERROR', 'created': time.time(),
+                'data': {'timestamp': datetime.utcnow().isoformat(), 'error': error,
+                         'moved_to': os.path.basename(moved_to), 'resumed_at_seq': seq}}
+
+    @contextmanager
+    def _writer_lock(self):
+        """Exclusive lock shared by every process writing this log file"""
+        directory = os.path.dirname(self.log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.log_file}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _size(self) -> int:
+        # tell() of an append mode file does not see other processes' writes
+        return os.fstat(self._file.fileno()).st_size
+
+    def _position(self):
+        checkpoint_file = self.chain.checkpoint_file
+        return self._size(), os.path.getsize(checkpoint_file) if os.path.exists(checkpoint_file) else 0
+
+    def _rotated(self) -> bool:
+        """Whether another process moved the open log file into the archive"""
+        try:
+            return os.stat(self.log_file).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _sync(self):
+        """Pick up entries and checkpoints other processes wrote since our last write"""
+        if self._position() != self._end:
+            self._resume()
+
+    def _resume(self, origin=None):
+        try:
+            self.chain.resume(self._file, origin)
+        except AuditChainError as e:
+            self._set_aside(str(e))
+        self._end = self._position()
+
+    def _set_aside(self, error: str):
+        """Move a log that does not verify aside and continue its chain from the last verified entry"""
+        origin = (self.chain.seq, self.chain.head)
+        moved_to = f"{self.log_file}.broken-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}"
+        internal_logger.error(f"{error}; moved the log to {moved_to}")
+        self._file.close()
+        os.replace(self.log_file, moved_to)
+        if os.path.exists(self.chain.checkpoint_file):
+            os.replace(self.chain.checkpoint_file, f"{moved_to}.checkpoints")
+        self._file = open(self.log_file, 'ab')
+        self.chain.resume(self._file, origin)
+        self._breaks.append(self._break_entry(error, moved_to, origin[0]))
+
+    def _write_file(self, entries: List[Dict[str, Any]]):
+        with self._file_lock, self._writer_lock():
+            if self._file is not None and self._rotated():
+                self._file.close()
+                self._file = None
+            if self._file is None:
+                self._open()
+            self._sync()
+            breaks, self._breaks = self._breaks, []
+            entries = breaks + entries
+
+            try:
+                # Entries a failed attempt already sealed are not written again
+                lines, linked = [], []
+                for entry in entries:
+                    if entry.get('written'):
+                        continue
+                    line, entry['hash'] = self.chain.link(self._format(entry))
+                    lines.append(line)
+                    linked.append(entry)
+                    if self.chain.checkpoint_due:
+                        self._seal(lines)
+                        for written in linked:
+                            written['written'] = True
+                        lines, linked = [], []
+                if lines:
+                    self._append(lines)
+            except Exception:
+                # Resume from what actually reached the file on the next write
+                self._breaks = [entry for entry in breaks if not entry.get('written')] + self._breaks
+                self.chain.rollback()
+                self._file.close()
+                self._file = None
+                raise
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            if self._rotation_due():
+                self._rotate()
+
+    def _append(self, lines: List[str]):
+        self._file.write(''.join(lines).encode('utf-8'))
+        self._file.flush()
+        self.chain.commit()
+        self._end = self._position()
+
+    def _open(self):
+        """Open the log file, continuing the chain from the last archived segment"""
+        directory = os.path.dirname(self.log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        origin = None
+        segment = self.archive.last_segment()
+        if segment is not None:
+            checkpoints = load_checkpoints(self.chain.checkpoint_file)
+            if checkpoints and checkpoints[0]['signature'] == segment['first_signature']:
+                # A rotation was interrupted after archiving this file
+                for path in (self.log_file, self.chain.checkpoint_file):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            origin = (segment['seq_end'], segment['chain_end'])
+        self._file = open(self.log_file, 'ab')
+        self._resume(origin)
+
+    def _rotation_due(self) -> bool:
+        if self.chain.seq == self.chain.start_seq:
+            return False
+        return (self._size() >= self.segment_max_bytes
+                or datetime.utcnow() - self.chain.started_at >= timedelta(seconds=self.segment_max_seconds))
+
+    def _rotate(self):
+        """Seal the log file, move it into the archive and start the next segment on the next write"""
+        os.fsync(self._file.fileno())
+        if self.chain.unsealed:
+            self.chain.checkpoint(self._size())
+        self._file.close()
+        self._file = None
+        self.archive.add_segment(self.log_file, self.chain.checkpoint_file)
+        os.remove(self.log_file)
+        os.remove(self.chain.checkpoint_file)
+        try:
+            self.archive.enforce_retention()
+        except Exception as e:
+            internal_logger.error(f"Audit retention failed: {e}")
+
+    def read(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """Entries with start <= time < end from the archive and the live log, oldest first"""
+        # Taken together so a rotation cannot move entries between the two;
+        # the open live file stays readable if it is rotated away afterwards
+        with self._file_lock, self._writer_lock():
+            segments = self.archive.segments(start, end)
+            live = open(self.log_file, 'rb') if os.path.exists(self.log_file) else None
+            if live is not None:
+                size = os.fstat(live.fileno()).st_size
+                offset = self._read_offset(start)
+        for segment in segments:
+            yield from filter_entries(self.archive.read_segment(segment).splitlines(), start, end)
+        if live is not None:
+            with live:
+                live.seek(offset)
+                yield from filter_entries(self._lines(live, size - offset), start, end)
+
+    def _read_offset(self, start: Optional[datetime]) -> int:
+        """
+        Offset of the last checkpoint sealed before start; every entry
+        before it was created before the checkpoint, so none can match.
+        """
+        if start is None:
+            return 0
+        since = time.mktime(start.timetuple())
+        offset = 0
+        for checkpoint in load_checkpoints(self.chain.checkpoint_file):
+            if datetime.fromisoformat(checkpoint['created']).replace(tzinfo=timezone.utc).timestamp() >= since:
+                break
+            offset = checkpoint['offset']
+        return offset
+
+    @staticmethod
+    def _lines(f, length: int) -> Iterator[bytes]:
+        """Complete lines in the next length bytes of f, read one at a time"""
+        for line in f:
+            if len(line) > length or not line.endswith(b'\n'):
+                return
+            length -= len(line)
+            yield line
+
+    def _seal(self, lines: List[str]):
+        """Write lines, make them durable and checkpoint the chain after them"""
+        self._append(lines)
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+        self.chain.checkpoint(self._size())
+        self._end = self._position()
+
+    def _store(self, entries: List[Dict[str, Any]]):
+        """Insert the batch's admin actions into AdminAuditLog with one statement"""
+        from database.models import AdminAuditLog
+
+        rows = [dict(admin_audit_row(entry['data']), entry_hash=entry.get('hash'))
+                for entry in entries if entry['event'] == 'ADMIN_ACTION']
+        if not rows:
+            return
+        with self._app.app_context():
+            try:
+                self._db.session.execute(AdminAuditLog.__table__.insert(), rows)
+                self._db.session.commit()
+            except Exception:
+                self._db.session.rollback()
+                raise
+
+
+def admin_audit_row(audit_data: Dict[str, Any]) -> Dict[str, Any]:
+    """AdminAuditLog columns for an ADMIN_ACTION record"""
+    details = audit_data.get('target_details') or {}
+    action = str(audit_data.get('action'))[:100]
+    severity = audit_data.get('severity', 'info')
+    return {
+        'report_id': details.get('report_pk'),
+        'admin_id': str(audit_data.get('admin_user_id'))[:64],
+        'action': action,
+        'severity': severity,
+        # Actions named *error* were found with a LIKE scan before severity existed
+        'is_error': severity in ERROR_SEVERITIES or 'error' in action.lower(),
+        'details': json.dumps({
+            'target_resource': audit_data.get('target_resource'),
+            'target_details': details,
+            'justification': audit_data.get('justification'),
+            'risk_level': audit_data.get('risk_level')
+        }, default=str),
+        'ip_address': details.get('ip_address'),
+        'user_agent': (details.get('user_agent') or '')[:500] or None,
+        'timestamp': datetime.fromisoformat(audit_data['timestamp'])
+    }
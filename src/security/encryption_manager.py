@@ -2,53 +2,92 @@ import os
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
 import secrets
-from typing import Dict, Any, Tuple
+import threading
+from typing import Dict, Any, List, Tuple
 import logging
 
+from security.keyring import KEYS_REQUIRE_INIT, LEGACY_KEY_ID, UnknownKeyError, keyring as default_keyring
+
+PRIVATE_KEY_FILE = os.getenv('PRIVATE_KEY_FILE', 'keys/private.pem')
+PUBLIC_KEY_FILE = os.getenv('PUBLIC_KEY_FILE', 'keys/public.pem')
+RSA_KEY_SIZE = int(os.getenv('RSA_KEY_SIZE', '4096'))
+
+# Prefix of software-encrypted values naming the master key version,
+# e.g. "k2.gAAAAA...". Values without it were written under version 1.
+KEY_ID_PREFIX = 'k'
+
+# Private keys replaced by rotate_encryption_keys are kept next to the
+# current one as <private_key_file>.<n>, so values encrypted for them can
+# still be read.
+
+# Hybrid asymmetric format: "h1." + base64(wrapped_key | nonce(12) | ciphertext + tag)
+# The AES-256-GCM key is RSA-OAEP wrapped; the wrapped key is bound as
+# associated data. Values without the prefix are direct RSA-OAEP ciphertext.
+HYBRID_PREFIX = 'h1.'
+HYBRID_NONCE_SIZE = 12
+
 class EncryptionManager:
-    def __init__(self):
+    def __init__(self, keyring=None, private_key_file: str = PRIVATE_KEY_FILE,
+                 public_key_file: str = PUBLIC_KEY_FILE, rsa_key_size: int = RSA_KEY_SIZE):
         self.logger = logging.getLogger(__name__)
-        self.keys = self._initialize_keys()
+        self.keyring = keyring or default_keyring
+        self.private_key_file = private_key_file
+        self.public_key_file = public_key_file
+        self.rsa_key_size = rsa_key_size
+        self._keys = None
+        self._keys_lock = threading.Lock()
         self.hsm_available = self._check_hsm_availability()
 
-    def _initialize_keys(self) -> Dict[str, Any]:
+    @property
+    def keys(self) -> Dict[str, Any]:
+        """Encryption keys, loaded on first use rather than at import"""
+        if self._keys is None:
+            with self._keys_lock:
+                if self._keys is None:
+                    self._keys = self._initialize_keys()
+        return self._keys
+
+    def _initialize_keys(self, create: bool = not KEYS_REQUIRE_INIT) -> Dict[str, Any]:
         """Initialize encryption keys"""
         keys = {}
 
-        # Generate or load master key
-        master_key_file = os.getenv('MASTER_KEY_FILE', 'keys/master.key')
-        if os.path.exists(master_key_file):
-            with open(master_key_file, 'rb') as f:
-                keys['master'] = f.read()
-        else:
-            keys['master'] = Fernet.generate_key()
-            os.makedirs('keys', exist_ok=True)
-            with open(master_key_file, 'wb') as f:
-                f.write(keys['master'])
-
-        # Generate RSA key pair for asymmetric encryption
-        private_key_file = os.getenv('PRIVATE_KEY_FILE', 'keys/private.pem')
-        public_key_file = os.getenv('PUBLIC_KEY_FILE', 'keys/public.pem')
+        # Active master key version from the keyring
+        keys['master'] = self.keyring.active('master')[1]
 
-        if os.path.exists(private_key_file) and os.path.exists(public_key_file):
-            with open(private_key_file, 'rb') as f:
+        # Load or generate RSA key pair for asymmetric encryption
+        if os.path.exists(self.private_key_file) and os.path.exists(self.public_key_file):
+            with open(self.private_key_file, 'rb') as f:
                 keys['private'] = serialization.load_pem_private_key(f.read(), password=None)
-            with open(public_key_file, 'rb') as f:
+            with open(self.public_key_file, 'rb') as f:
                 keys['public'] = serialization.load_pem_public_key(f.read())
-        else:
+            keys['retired'] = self._load_retired_keys()
+        elif create:
+            self.logger.warning("No RSA key pair found, generating one; run 'python src/wanaiq.py keys init' ahead of time")
             keys['private'], keys['public'] = self._generate_rsa_keypair()
             self._save_rsa_keys(keys['private'], keys['public'])
+            keys['retired'] = []
+        else:
+            raise UnknownKeyError("RSA key pair is missing; run 'python src/wanaiq.py keys init'")
 
         return keys
 
+    def init_keys(self) -> Dict[str, bool]:
+        """Create any missing keys now. Returns which ones were created."""
+        created = {'keyring': self.keyring.init()}
+        created['rsa'] = not (os.path.exists(self.private_key_file) and os.path.exists(self.public_key_file))
+        with self._keys_lock:
+            self._keys = self._initialize_keys(create=True)
+        return created
+
     def _generate_rsa_keypair(self) -> Tuple[rsa.RSAPrivateKey, rsa.RSAPublicKey]:
         """Generate RSA key pair for asymmetric encryption"""
         private_key = rsa.generate_private_key(
             public_exponent=65537,
-            key_size=4096,
+            key_size=self.rsa_key_size,
         )
         public_key = private_key.public_key()
         return private_key, public_key
@@ -65,11 +104,41 @@ class EncryptionManager:
             format=serialization.PublicFormat.SubjectPublicKeyInfo
         )
 
-        with open('keys/private.pem', 'wb') as f:
+        for path in (self.private_key_file, self.public_key_file):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.private_key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
             f.write(pem_private)
-        with open('keys/public.pem', 'wb') as f:
+        with open(self.public_key_file, 'wb') as f:
             f.write(pem_public)
 
+    def _retired_key_numbers(self) -> List[int]:
+        directory = os.path.dirname(self.private_key_file) or '.'
+        prefix = os.path.basename(self.private_key_file) + '.'
+        if not os.path.isdir(directory):
+            return []
+        return sorted((int(name[len(prefix):]) for name in os.listdir(directory)
+                       if name.startswith(prefix) and name[len(prefix):].isdigit()), reverse=True)
+
+    def _load_retired_keys(self) -> List[rsa.RSAPrivateKey]:
+        """Previous private keys, newest first"""
+        retired = []
+        for number in self._retired_key_numbers():
+            with open(f"{self.private_key_file}.{number}", 'rb') as f:
+                retired.append(serialization.load_pem_private_key(f.read(), password=None))
+        return retired
+
+    def _retire_private_key(self):
+        """Keep a copy of the current private key before it is replaced"""
+        number = max(self._retired_key_numbers(), default=0) + 1
+        with open(self.private_key_file, 'rb') as f:
+            pem_private = f.read()
+        fd = os.open(f"{self.private_key_file}.{number}", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem_private)
+
     def _check_hsm_availability(self) -> bool:
         """Check if Hardware Security Module is available"""
         # In production, this would check for actual HSM integration
@@ -91,34 +160,72 @@ class EncryptionManager:
         return self._software_encrypt(data)  # Placeholder
 
     def _software_encrypt(self, data: str) -> str:
-        """Software-based encryption using Fernet"""
-        fernet = Fernet(self.keys['master'])
-        return fernet.encrypt(data.encode()).decode()
-
-    def encrypt_asymmetric(self, data: str) -> str:
-        """Encrypt data using RSA public key"""
-        encrypted = self.keys['public'].encrypt(
-            data.encode(),
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
+        """Software-based encryption using Fernet under the active master key"""
+        key_id, key = self.keyring.active('master')
+        return f"{KEY_ID_PREFIX}{key_id}.{Fernet(key).encrypt(data.encode()).decode()}"
+
+    @staticmethod
+    def software_key_id(encrypted_data: str) -> int:
+        """Master key version a software-encrypted value was written under"""
+        if encrypted_data.startswith(KEY_ID_PREFIX):
+            return int(encrypted_data[len(KEY_ID_PREFIX):encrypted_data.index('.')])
+        return LEGACY_KEY_ID
+
+    def _software_decrypt(self, encrypted_data: str) -> str:
+        """Decrypt a value from _software_encrypt under whichever key version wrote it"""
+        key_id = self.software_key_id(encrypted_data)
+        token = encrypted_data.split('.', 1)[1] if encrypted_data.startswith(KEY_ID_PREFIX) else encrypted_data
+        return Fernet(self.keyring.get('master', key_id)).decrypt(token.encode()).decode()
+
+    @staticmethod
+    def _oaep() -> padding.OAEP:
+        return padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
         )
+
+    def encrypt_asymmetric(self, data: str, hybrid: bool = True) -> str:
+        """
+        Encrypt data for the RSA key pair.
+
+        Hybrid mode (the default) wraps a fresh AES-GCM key with RSA and
+        encrypts the payload with it, so there is no size limit. Direct
+        RSA-OAEP is limited to 446 bytes with a 4096-bit key.
+        """
+        if hybrid:
+            data_key = AESGCM.generate_key(bit_length=256)
+            wrapped = self.keys['public'].encrypt(data_key, self._oaep())
+            nonce = os.urandom(HYBRID_NONCE_SIZE)
+            sealed = wrapped + nonce + AESGCM(data_key).encrypt(nonce, data.encode(), wrapped)
+            return HYBRID_PREFIX + base64.b64encode(sealed).decode()
+        encrypted = self.keys['public'].encrypt(data.encode(), self._oaep())
         return base64.b64encode(encrypted).decode()
 
     def decrypt_asymmetric(self, encrypted_data: str) -> str:
         """Decrypt data using RSA private key"""
-        encrypted_bytes = base64.b64decode(encrypted_data)
-        decrypted = self.keys['private'].decrypt(
-            encrypted_bytes,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        return decrypted.decode()
+        private_keys = [self.keys['private']] + self.keys.get('retired', [])
+        if not encrypted_data.startswith(HYBRID_PREFIX):
+            ciphertext = base64.b64decode(encrypted_data)
+            return self._rsa_decrypt(private_keys, lambda key: ciphertext)[1].decode()
+
+        sealed = base64.b64decode(encrypted_data[len(HYBRID_PREFIX):])
+        private_key, data_key = self._rsa_decrypt(private_keys, lambda key: sealed[:key.key_size // 8])
+        key_size = private_key.key_size // 8
+        nonce = sealed[key_size:key_size + HYBRID_NONCE_SIZE]
+        return AESGCM(data_key).decrypt(nonce, sealed[key_size + HYBRID_NONCE_SIZE:], sealed[:key_size]).decode()
+
+    def _rsa_decrypt(self, private_keys: List, ciphertext_for) -> Tuple[Any, bytes]:
+        """
+        Decrypt with the current private key, falling back to retired ones.
+        ciphertext_for(key) picks the RSA block for that key's size.
+        """
+        for private_key in private_keys:
+            try:
+                return private_key, private_key.decrypt(ciphertext_for(private_key), self._oaep())
+            except ValueError:
+                continue
+        raise ValueError("No RSA private key can decrypt this value")
 
     def generate_secure_hash(self, data: str, salt: str = None) -> str:
         """Generate secure hash for sensitive data"""
@@ -134,34 +241,40 @@ class EncryptionManager:
         key = base64.urlsafe_b64encode(kdf.derive(data.encode()))
         return key.decode()
 
-    def rotate_encryption_keys(self):
-        """Rotate encryption keys for security"""
-        self.logger.warning("Rotating encryption keys - this will re-encrypt all data")
+    def rotate_encryption_keys(self) -> Dict[str, int]:
+        """
+        Rotate encryption keys for security.
 
-        # Generate new keys
-        new_master_key = Fernet.generate_key()
-        new_private_key, new_public_key = self._generate_rsa_keypair()
+        New master and evidence key versions become active immediately;
+        previous versions stay in the keyring for decryption until the
+        re-encryption worker has moved all data onto the new ones.
+        """
+        self.logger.warning("Rotating encryption keys - existing data will be re-encrypted in the background")
 
-        # Store old keys for data migration
-        old_keys = self.keys.copy()
+        new_versions = {purpose: self.keyring.rotate(purpose) for purpose in ('master', 'evidence')}
+        self.keys['master'] = self.keyring.active('master')[1]
 
-        # Update current keys
-        self.keys['master'] = new_master_key
+        # New values are encrypted for a fresh RSA key pair; the old
+        # private key is kept so stored values encrypted for it still decrypt
+        self._retire_private_key()
+        new_private_key, new_public_key = self._generate_rsa_keypair()
+        self.keys['retired'] = [self.keys['private']] + self.keys.get('retired', [])
         self.keys['private'] = new_private_key
         self.keys['public'] = new_public_key
-
-        # Save new keys
-        with open('keys/master.key', 'wb') as f:
-            f.write(new_master_key)
         self._save_rsa_keys(new_private_key, new_public_key)
 
         # Trigger background job to re-encrypt existing data
-        self._schedule_data_reencryption(old_keys)
+        self._schedule_data_reencryption(new_versions)
+        return new_versions
 
-    def _schedule_data_reencryption(self, old_keys: Dict[str, Any]):
+    def _schedule_data_reencryption(self, new_versions: Dict[str, int]):
         """Schedule background re-encryption of existing data"""
-        # Implementation for background job scheduling
-        self.logger.info("Scheduled data re-encryption job")
+        from key_rotation import reencryption_worker
+
+        if reencryption_worker.start():
+            self.logger.info(f"Scheduled data re-encryption job for key versions {new_versions}")
+        else:
+            self.logger.warning("Re-encryption worker is not attached to an app; run 'python src/key_rotation.py'")
 
 # Initialize encryption manager
 encryption_manager = EncryptionManager()
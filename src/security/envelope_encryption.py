@@ -0,0 +1,168 @@
+import base64
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.keywrap import aes_key_unwrap, aes_key_wrap
+
+from security.keyring import LEGACY_KEY_ID
+
+# Envelope token format (URL-safe base64 after the prefix, no padding)
+#
+#   version(1) | level(1) | key_id(4) | wrapped_data_key(40) | nonce(12) | ciphertext + tag(16)
+#
+# Every token carries its own AES-256-GCM data key, wrapped (RFC 3394) by a
+# key-encryption key derived from master key version key_id for the
+# token's level. Levels use separate key-encryption keys, so unwrapping
+# "high" data keys needs a key that never touches "standard" data. The
+# header is authenticated as associated data. Version 1 tokens have no
+# key_id and were written under master key version 1.
+
+TOKEN_PREFIX = 'wenv1:'
+VERSION = 2
+LEVELS = {'standard': 1, 'high': 2}
+LEVEL_ALIASES = {'military_grade': 'high'}
+HEADER = struct.Struct('>BBI')
+HEADER_V1 = struct.Struct('>BB')
+WRAPPED_KEY_SIZE = 40
+NONCE_SIZE = 12
+DATA_KEY_CACHE_SIZE = int(os.getenv('DATA_KEY_CACHE_SIZE', '256'))
+
+
+class EnvelopeDecryptionError(Exception):
+    """Raised when an envelope token is malformed or fails authentication"""
+
+
+class EnvelopeCipher:
+    """
+    Envelope encryption for report content.
+
+    A fresh data key is generated per encrypted value and stored wrapped
+    alongside the ciphertext. Unwrapped data keys are kept in a small LRU
+    so repeated reads of the same report skip the unwrap.
+    """
+
+    def __init__(self, keyring, purpose: str = 'master', cache_size: int = DATA_KEY_CACHE_SIZE):
+        self.keyring = keyring
+        self.purpose = purpose
+        self.cache_size = cache_size
+        self._kek: Dict[Tuple[int, int], bytes] = {}
+        self._cache: 'OrderedDict[bytes, AESGCM]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_kek(self, key_id: int, level_id: int) -> bytes:
+        kek = self._kek.get((key_id, level_id))
+        if kek is None:
+            level = next(name for name, value in LEVELS.items() if value == level_id)
+            kek = HKDF(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=None,
+                info=f'wanaiq-report-kek-{level}'.encode(),
+            ).derive(self.keyring.get(self.purpose, key_id))
+            self._kek[(key_id, level_id)] = kek
+        return kek
+
+    @staticmethod
+    def is_envelope(token: str) -> bool:
+        return token.startswith(TOKEN_PREFIX)
+
+    @staticmethod
+    def level_id(level: str) -> int:
+        level = LEVEL_ALIASES.get(level, level)
+        if level not in LEVELS:
+            raise ValueError(f"Unsupported security level: {level}")
+        return LEVELS[level]
+
+    def encrypt(self, plaintext: bytes, level: str = 'standard') -> str:
+        level_id = self.level_id(level)
+        key_id, _ = self.keyring.active(self.purpose)
+        data_key = AESGCM.generate_key(bit_length=256)
+        wrapped = aes_key_wrap(self._get_kek(key_id, level_id), data_key)
+        header = HEADER.pack(VERSION, level_id, key_id)
+        nonce = os.urandom(NONCE_SIZE)
+        aead = AESGCM(data_key)
+        # Content is usually read back soon after it is written (moderation)
+        self._store(header + wrapped, aead)
+
+        token = header + wrapped + nonce + aead.encrypt(nonce, plaintext, header)
+        return TOKEN_PREFIX + base64.urlsafe_b64encode(token).rstrip(b'=').decode()
+
+    def _parse(self, token: str) -> Tuple[bytes, int, int, bytes, bytes, bytes]:
+        if not self.is_envelope(token):
+            raise EnvelopeDecryptionError("Not an envelope token")
+        body = token[len(TOKEN_PREFIX):]
+        try:
+            raw = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+        except Exception:
+            raise EnvelopeDecryptionError("Malformed envelope token")
+
+        header_struct = {VERSION: HEADER, 1: HEADER_V1}.get(raw[0] if raw else None)
+        if header_struct is None:
+            raise EnvelopeDecryptionError("Unsupported envelope token")
+        if len(raw) < header_struct.size + WRAPPED_KEY_SIZE + NONCE_SIZE + 16:
+            raise EnvelopeDecryptionError("Truncated envelope token")
+        header = raw[:header_struct.size]
+        fields = header_struct.unpack(header)
+        level_id = fields[1]
+        key_id = fields[2] if header_struct is HEADER else LEGACY_KEY_ID
+        if level_id not in LEVELS.values():
+            raise EnvelopeDecryptionError("Unsupported envelope token")
+
+        wrapped = raw[len(header):len(header) + WRAPPED_KEY_SIZE]
+        nonce_start = len(header) + WRAPPED_KEY_SIZE
+        nonce = raw[nonce_start:nonce_start + NONCE_SIZE]
+        return header, level_id, key_id, wrapped, nonce, raw[nonce_start + NONCE_SIZE:]
+
+    def key_id(self, token: str) -> int:
+        """Master key version a token was written under"""
+        return self._parse(token)[2]
+
+    def reencrypt(self, token: str) -> str:
+        """Re-encrypt a token at its own level under the active master key"""
+        level_id = self._parse(token)[1]
+        level = next(name for name, value in LEVELS.items() if value == level_id)
+        return self.encrypt(self.decrypt(token), level)
+
+    def decrypt(self, token: str) -> bytes:
+        header, level_id, key_id, wrapped, nonce, ciphertext = self._parse(token)
+        aead = self._unwrap(header, level_id, key_id, wrapped)
+        try:
+            return aead.decrypt(nonce, ciphertext, header)
+        except Exception:
+            raise EnvelopeDecryptionError("Envelope token failed authentication")
+
+    def _unwrap(self, header: bytes, level_id: int, key_id: int, wrapped: bytes) -> AESGCM:
+        # The cache key includes the header so a wrapped key cannot be
+        # replayed under a different level or key version
+        cache_key = header + wrapped
+        with self._lock:
+            aead = self._cache.get(cache_key)
+            if aead is not None:
+                self._cache.move_to_end(cache_key)
+                return aead
+        kek = self._get_kek(key_id, level_id)
+        try:
+            aead = AESGCM(aes_key_unwrap(kek, wrapped))
+        except Exception:
+            raise EnvelopeDecryptionError("Envelope token failed authentication")
+        self._store(cache_key, aead)
+        return aead
+
+    def _store(self, cache_key: bytes, aead: AESGCM):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[cache_key] = aead
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._cache), 'max_size': self.cache_size}
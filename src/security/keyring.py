@@ -0,0 +1,303 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+from cryptography.fernet import Fernet
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+KEYRING_FILE = os.getenv('KEYRING_FILE', 'keys/keyring.json')
+RELOAD_INTERVAL_SECONDS = float(os.getenv('KEYRING_RELOAD_SECONDS', '1'))
+# Keys are only created on first use in development (DEBUG=true); a
+# production process must find them made by 'keys init'
+DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
+KEYS_REQUIRE_INIT = os.getenv('KEYS_REQUIRE_INIT', 'false' if DEBUG else 'true').lower() == 'true'
+
+# Key files written before the keyring existed. On first load they are
+# imported as version 1 of their purpose, so existing ciphertext (which
+# carries no key ID) keeps decrypting.
+LEGACY_KEY_FILES = {
+    'master': os.getenv('MASTER_KEY_FILE', 'keys/master.key'),
+    'evidence': os.getenv('EVIDENCE_KEY_FILE', 'keys/evidence.key'),
+    'data': os.getenv('DATA_KEY_FILE', 'keys/data.key'),
+}
+LEGACY_KEY_ID = 1
+
+
+class UnknownKeyError(KeyError):
+    """Raised when a ciphertext names a key version the keyring does not hold"""
+
+
+class Keyring:
+    """
+    Versioned symmetric keys, grouped by purpose (master, evidence, data).
+
+    Each purpose has one active version used for new ciphertext and any
+    number of older versions kept for decryption until re-encryption has
+    moved everything to the active one and they are retired. The keyring
+    is a JSON file shared by all processes; it is read on first use and
+    re-read when it changes on disk, so a rotation in one process is seen
+    by the others. Changes are made under an exclusive lock on
+    "<path>.lock" against a fresh read of the file, so processes creating
+    or rotating keys at the same time do not overwrite each other. The
+    file also holds the random per-window salts of pseudonyms.
+    Missing keys are an error until 'python src/wanaiq.py keys init' has
+    created them, unless KEYS_REQUIRE_INIT=false (the default with
+    DEBUG=true), in which case they are created on first use.
+    """
+
+    def __init__(self, path: Optional[str] = KEYRING_FILE, legacy_files: Dict[str, str] = None,
+                 require_init: bool = KEYS_REQUIRE_INIT):
+        self.path = path
+        self.legacy_files = LEGACY_KEY_FILES if legacy_files is None else legacy_files
+        self.require_init = require_init
+        self._data: Dict[str, Any] = {'purposes': {}}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        self._loaded = path is None
+
+    @classmethod
+    def from_keys(cls, keys: Dict[str, Dict[int, bytes]]) -> 'Keyring':
+        """In-memory keyring, e.g. a snapshot handed to worker processes"""
+        keyring = cls(path=None)
+        for purpose, versions in keys.items():
+            keyring._data['purposes'][purpose] = {
+                'active': max(versions),
+                'versions': {str(key_id): {'key': key.decode(), 'status': 'active'}
+                             for key_id, key in versions.items()}
+            }
+        return keyring
+
+    def _read(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self._data = json.load(f)
+            self._mtime = os.path.getmtime(self.path)
+
+    def _missing_legacy(self):
+        return [purpose for purpose in self.legacy_files if purpose not in self._data['purposes']]
+
+    @contextmanager
+    def _updating(self):
+        """Hold the cross-process keyring lock with the file freshly read; the caller saves"""
+        with self._lock:
+            if self.path is None:
+                yield
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self._read()
+                    self._checked_at = time.monotonic()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _load(self, create: Optional[bool] = None):
+        if create is None:
+            create = not self.require_init
+        with self._lock:
+            self._read()
+            self._loaded = True
+            if not self._missing_legacy():
+                return
+            if not create:
+                raise UnknownKeyError(f"Keyring {self.path} is not initialized; run 'python src/wanaiq.py keys init'")
+
+            with self._updating():
+                # Another process may have created them while we waited for the lock
+                missing = self._missing_legacy()
+                for purpose in missing:
+                    legacy_file = self.legacy_files[purpose]
+                    if os.path.exists(legacy_file):
+                        with open(legacy_file, 'rb') as f:
+                            key = f.read().strip()
+                    else:
+                        key = Fernet.generate_key()
+                    self._data['purposes'][purpose] = {
+                        'active': LEGACY_KEY_ID,
+                        'versions': {str(LEGACY_KEY_ID): self._entry(key)}
+                    }
+                if missing:
+                    self._save()
+
+    def init(self) -> bool:
+        """Create the keyring file now. Returns False if it already existed."""
+        with self._lock:
+            existed = os.path.exists(self.path)
+            self._load(create=True)
+            return not existed
+
+    def ensure(self, purpose: str, create: Optional[bool] = None):
+        """Create version 1 of a purpose that has no keys yet"""
+        with self._lock:
+            self._refresh()
+            if purpose in self._data['purposes']:
+                return
+            if self.path is not None and not (create if create is not None else not self.require_init):
+                raise UnknownKeyError(f"No keys for purpose {purpose}; run 'python src/wanaiq.py keys init'")
+            with self._updating():
+                if purpose in self._data['purposes']:
+                    return
+                self._data['purposes'][purpose] = {
+                    'active': LEGACY_KEY_ID,
+                    'versions': {str(LEGACY_KEY_ID): self._entry(Fernet.generate_key())}
+                }
+                if self.path is not None:
+                    self._save()
+
+    def _save(self):
+        """Replace the keyring file atomically; only called inside _updating"""
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_file = tempfile.mkstemp(dir=directory, prefix='.keyring-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.path)
+        except Exception:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        self._mtime = os.path.getmtime(self.path)
+
+    @staticmethod
+    def _entry(key: bytes) -> Dict[str, Any]:
+        return {'key': key.decode(), 'status': 'active', 'created_at': datetime.utcnow().isoformat()}
+
+    def _refresh(self):
+        """Load on first use and pick up rotations made by other processes"""
+        if not self._loaded:
+            self._load()
+            self._checked_at = time.monotonic()
+            return
+        if self.path is None or time.monotonic() - self._checked_at < RELOAD_INTERVAL_SECONDS:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def _purpose(self, purpose: str) -> Dict[str, Any]:
+        try:
+            return self._data['purposes'][purpose]
+        except KeyError:
+            raise UnknownKeyError(f"No keys for purpose {purpose}")
+
+    def active(self, purpose: str) -> Tuple[int, bytes]:
+        """Return (key_id, key) of the version used for new ciphertext"""
+        with self._lock:
+            self._refresh()
+            entry = self._purpose(purpose)
+            key_id = entry['active']
+            return key_id, entry['versions'][str(key_id)]['key'].encode()
+
+    def get(self, purpose: str, key_id: int) -> bytes:
+        """Return a key version that can still decrypt"""
+        with self._lock:
+            self._refresh()
+            version = self._purpose(purpose)['versions'].get(str(key_id))
+            if version is None:
+                # It may have been added by a rotation in another process
+                self._checked_at = 0.0
+                self._refresh()
+                version = self._purpose(purpose)['versions'].get(str(key_id))
+            if version is None or version['status'] == 'retired':
+                raise UnknownKeyError(f"Key {purpose}/{key_id} is not available")
+            return version['key'].encode()
+
+    def rotate(self, purpose: str) -> int:
+        """Add a new active version; older versions stay available for decryption"""
+        with self._lock:
+            self._refresh()
+        with self._updating():
+            entry = self._purpose(purpose)
+            previous = entry['versions'][str(entry['active'])]
+            previous['status'] = 'decrypt_only'
+            key_id = max(int(k) for k in entry['versions']) + 1
+            entry['versions'][str(key_id)] = self._entry(Fernet.generate_key())
+            entry['active'] = key_id
+            if self.path is not None:
+                self._save()
+            return key_id
+
+    def retire(self, purpose: str, key_id: int):
+        """Drop the key material of a version nothing is encrypted under any more"""
+        with self._lock:
+            self._refresh()
+        with self._updating():
+            entry = self._purpose(purpose)
+            if key_id == entry['active']:
+                raise ValueError("The active key version cannot be retired")
+            version = entry['versions'][str(key_id)]
+            version.update({'key': '', 'status': 'retired', 'retired_at': datetime.utcnow().isoformat()})
+            if self.path is not None:
+                self._save()
+
+    def window_salt(self, name: str, window: int, keep_windows: int) -> bytes:
+        """
+        Random salt of a time window, created on first use. Salts of windows
+        older than window - keep_windows are destroyed and cannot be asked
+        for again.
+        """
+        with self._lock:
+            self._refresh()
+            salts = self._data.get('salts', {}).get(name, {})
+            if str(window) in salts:
+                return bytes.fromhex(salts[str(window)])
+            with self._updating():
+                salts = self._data.setdefault('salts', {}).setdefault(name, {})
+                oldest = max(int(w) for w in salts) - keep_windows if salts else window
+                if window < oldest:
+                    raise UnknownKeyError(f"Salt {name}/{window} has been destroyed")
+                if str(window) not in salts:
+                    salts[str(window)] = os.urandom(32).hex()
+                    for expired in [w for w in salts if int(w) < window - keep_windows]:
+                        del salts[expired]
+                    if self.path is not None:
+                        self._save()
+                return bytes.fromhex(salts[str(window)])
+
+    def decryptable_versions(self, purpose: str) -> Dict[int, bytes]:
+        with self._lock:
+            self._refresh()
+            return {int(key_id): version['key'].encode()
+                    for key_id, version in self._purpose(purpose)['versions'].items()
+                    if version['status'] != 'retired'}
+
+    def snapshot(self, *purposes: str) -> Dict[str, Dict[int, bytes]]:
+        """Decryptable keys for the given purposes, for Keyring.from_keys"""
+        return {purpose: self.decryptable_versions(purpose) for purpose in purposes}
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                purpose: {
+                    'active': entry['active'],
+                    'versions': {key_id: version['status'] for key_id, version in entry['versions'].items()}
+                }
+                for purpose, entry in self._data['purposes'].items()
+            }
+
+
+# Initialize keyring
+keyring = Keyring()
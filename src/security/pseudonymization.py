@@ -0,0 +1,83 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from security.keyring import UnknownKeyError
+
+ROTATION_SECONDS = int(os.getenv('PSEUDONYM_ROTATION_SECONDS', '86400'))
+# How long after its window ends a salt is kept, so pseudonyms of that
+# window can still be looked up
+SALT_RETENTION_SECONDS = int(os.getenv('PSEUDONYM_SALT_RETENTION_SECONDS', str(ROTATION_SECONDS)))
+PSEUDONYM_HEX_LENGTH = 32
+
+
+class Pseudonymizer:
+    """
+    Keyed pseudonyms for IP addresses and reporter identities.
+
+    A value is mapped to HMAC-SHA256 under a key derived from the pseudonym
+    key and a random salt of the namespace and current rotation window (a
+    UTC day by default). Salts are kept in the keyring, shared by all
+    processes, for the window plus SALT_RETENTION_SECONDS and then
+    destroyed. Within a window the same input always gives the same
+    pseudonym, so it can be used for equality lookups and counting; once
+    the salt is gone, not even the pseudonym key links a pseudonym back
+    to its input.
+    Output is a fixed-length lowercase hex string (128 bits), suitable for
+    a plain B-tree index.
+    """
+
+    def __init__(self, keyring, purpose: str = 'pseudonym', rotation_seconds: int = ROTATION_SECONDS,
+                 salt_retention_seconds: int = SALT_RETENTION_SECONDS):
+        self.keyring = keyring
+        self.purpose = purpose
+        self.rotation_seconds = rotation_seconds
+        self.keep_windows = -(-salt_retention_seconds // rotation_seconds)
+        self._salts: Dict[Tuple[str, int, int], 'hmac.HMAC'] = {}
+        self._lock = threading.Lock()
+        self._ensured = False
+
+    def window(self, at: Optional[datetime] = None) -> int:
+        timestamp = at.replace(tzinfo=at.tzinfo or timezone.utc).timestamp() if at else time.time()
+        return int(timestamp // self.rotation_seconds)
+
+    def _salted(self, namespace: str, window: int) -> 'hmac.HMAC':
+        if not self._ensured:
+            self.keyring.ensure(self.purpose)
+            self._ensured = True
+        key_id, key = self.keyring.active(self.purpose)
+        salted = self._salts.get((namespace, window, key_id))
+        if salted is None:
+            salt = HKDF(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=self.keyring.window_salt(f'{self.purpose}-{namespace}', window, self.keep_windows),
+                info=f'wanaiq-pseudonym-{namespace}-{window}'.encode(),
+            ).derive(key)
+            salted = hmac.new(salt, digestmod=hashlib.sha256)
+            with self._lock:
+                # Drop salts the keyring has destroyed
+                for cached in [k for k in self._salts if k[1] < window - self.keep_windows]:
+                    del self._salts[cached]
+                self._salts[(namespace, window, key_id)] = salted
+        return salted
+
+    def pseudonymize(self, value: str, namespace: str, at: Optional[datetime] = None) -> str:
+        """
+        Pseudonym of value in namespace for the window containing at
+        (default now). Raises UnknownKeyError once that window's salt has
+        been destroyed.
+        """
+        window = self.window(at)
+        if window < self.window() - self.keep_windows:
+            raise UnknownKeyError(f"Pseudonym salts of window {window} have been destroyed")
+        digest = self._salted(namespace, window).copy()
+        digest.update(value.encode())
+        return digest.hexdigest()[:PSEUDONYM_HEX_LENGTH]
@@ -4,68 +4,80 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
 import secrets
-from typing import Dict, Any, Optional
+import threading
+from typing import BinaryIO, Dict, Any, Optional
 import logging
 from datetime import datetime
 
+from security.envelope_encryption import EnvelopeCipher
+from security.keyring import LEGACY_KEY_ID, UnknownKeyError, keyring as default_keyring
+from security.pseudonymization import Pseudonymizer
+from security.stream_encryption import StreamCipher
+
 class SecurityManager:
-    def __init__(self):
-        self.encryption_keys = self._load_or_generate_keys()
-        self.fernet = Fernet(self.encryption_keys['data'])
+    def __init__(self, keyring=None):
+        self.keyring = keyring or default_keyring
+        self.envelope = EnvelopeCipher(self.keyring, 'master')
+        self.evidence_cipher = StreamCipher(
+            self.keyring, 'evidence',
+            algorithm=os.getenv('EVIDENCE_STREAM_ALGORITHM', 'aes-gcm')
+        )
+        self.pseudonymizer = Pseudonymizer(self.keyring, 'pseudonym')
         self.logger = logging.getLogger(__name__)
+        self._encryption_keys = None
+        self._fernet = None
+        self._keys_lock = threading.Lock()
+
+    def _load_keys(self):
+        """Keys are read from the keyring on first use, so importing this module does no I/O"""
+        if self._encryption_keys is not None:
+            return
+        with self._keys_lock:
+            if self._encryption_keys is not None:
+                return
+            self.keyring.ensure('pseudonym')
+            # Legacy Fernet report content predates the keyring and is always
+            # under data key version 1, which is retired once it is re-encrypted
+            try:
+                self._fernet = Fernet(self.keyring.get('data', LEGACY_KEY_ID))
+            except UnknownKeyError:
+                self._fernet = None
+            self._encryption_keys = self._load_or_generate_keys()
+
+    @property
+    def encryption_keys(self) -> Dict[str, bytes]:
+        self._load_keys()
+        return self._encryption_keys
+
+    @property
+    def fernet(self) -> Optional[Fernet]:
+        self._load_keys()
+        return self._fernet
 
     def _load_or_generate_keys(self) -> Dict[str, bytes]:
-        """Load existing keys or generate new ones"""
-        keys = {}
-
-        # Master key for sensitive data
-        master_key_file = os.getenv('MASTER_KEY_FILE', 'keys/master.key')
-        if os.path.exists(master_key_file):
-            with open(master_key_file, 'rb') as f:
-                keys['master'] = f.read()
-        else:
-            keys['master'] = Fernet.generate_key()
-            os.makedirs('keys', exist_ok=True)
-            with open(master_key_file, 'wb') as f:
-                f.write(keys['master'])
-
-        # Evidence encryption key
-        evidence_key_file = os.getenv('EVIDENCE_KEY_FILE', 'keys/evidence.key')
-        if os.path.exists(evidence_key_file):
-            with open(evidence_key_file, 'rb') as f:
-                keys['evidence'] = f.read()
-        else:
-            keys['evidence'] = Fernet.generate_key()
-            with open(evidence_key_file, 'wb') as f:
-                f.write(keys['evidence'])
+        """Active key of each purpose from the keyring, plus a per-process session key"""
+        keys = {purpose: self.keyring.active(purpose)[1] for purpose in ('master', 'evidence', 'data')}
 
         # Session key for temporary data
         keys['session'] = Fernet.generate_key()
 
-        # Data encryption key (main key for general data)
-        data_key_file = os.getenv('DATA_KEY_FILE', 'keys/data.key')
-        if os.path.exists(data_key_file):
-            with open(data_key_file, 'rb') as f:
-                keys['data'] = f.read()
-        else:
-            keys['data'] = Fernet.generate_key()
-            with open(data_key_file, 'wb') as f:
-                f.write(keys['data'])
-
         return keys
 
     def encrypt_sensitive_data(self, data: str, level: str = 'standard') -> str:
-        """Encrypt sensitive report content"""
-        if level == 'military_grade':
-            # Double encryption for highest security
-            encrypted_once = self.fernet.encrypt(data.encode())
-            return self.fernet.encrypt(encrypted_once).decode()
-        else:
-            return self.fernet.encrypt(data.encode()).decode()
+        """
+        Encrypt sensitive report content with a fresh wrapped data key.
+
+        'high' (or the legacy name 'military_grade') wraps the data key with
+        a separate key-encryption key instead of encrypting twice.
+        """
+        return self.envelope.encrypt(data.encode(), level)
 
     def decrypt_sensitive_data(self, encrypted_data: str, level: str = 'standard') -> str:
         """Decrypt sensitive report content with audit logging"""
         try:
+            if self.envelope.is_envelope(encrypted_data):
+                return self.envelope.decrypt(encrypted_data).decode()
+            # Content written before envelope encryption
             if level == 'military_grade':
                 # Double decryption
                 decrypted_once = self.fernet.decrypt(encrypted_data.encode())
@@ -76,15 +88,29 @@ class SecurityManager:
             self.logger.error(f"Decryption failed: {e}")
             raise
 
+    def encrypt_evidence_stream(self, src: BinaryIO, dst: BinaryIO) -> int:
+        """Encrypt an evidence file stream chunk by chunk with constant memory"""
+        return self.evidence_cipher.encrypt_stream(src, dst)
+
+    def decrypt_evidence_stream(self, src: BinaryIO, dst: BinaryIO) -> int:
+        """Decrypt an evidence file stream, authenticating every chunk"""
+        return self.evidence_cipher.decrypt_stream(src, dst)
+
+    def decrypt_evidence_range(self, src: BinaryIO, offset: int, length: int) -> bytes:
+        """Decrypt a byte range of an evidence file, e.g. for video seeking"""
+        return self.evidence_cipher.decrypt_range(src, offset, length)
+
     def generate_session_token(self) -> str:
         """Generate secure session token for anonymous reporting"""
         return secrets.token_urlsafe(32)
 
     def hash_reporter_identity(self, identity_data: str) -> str:
-        """Create one-way hash for anonymous reporter tracking"""
-        return base64.b64encode(
-            hashes.Hash(hashes.SHA256()).finalize()
-        ).decode()
+        """Create a keyed pseudonym for anonymous reporter tracking, stable for the current day"""
+        return self.pseudonymizer.pseudonymize(identity_data, 'reporter')
+
+    def hash_ip(self, ip_address: str) -> str:
+        """Create a keyed pseudonym of a client IP for anonymized analytics, stable for the current day"""
+        return self.pseudonymizer.pseudonymize(ip_address, 'ip')
 
     def generate_report_id(self) -> str:
         """Generate unique report ID in SR-XXXX format"""
@@ -100,11 +126,12 @@ class SecurityManager:
         }
         self.logger.info(f"ADMIN_ACTION: {audit_entry}")
 
-    def get_status(self) -> Dict[str, str]:
+    def get_status(self) -> Dict[str, Any]:
         """Get security manager status"""
         return {
             'status': 'healthy',
             'keys_loaded': len(self.encryption_keys),
+            'key_versions': self.keyring.get_status(),
             'encryption_available': 'true'
         }
 
@@ -0,0 +1,182 @@
+import os
+import struct
+from typing import BinaryIO, Iterator, Tuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from security.keyring import LEGACY_KEY_ID
+
+# Segmented AEAD stream format
+#
+#   header: magic(4) | version(1) | algorithm(1) | chunk_size(4) | salt(16) | nonce_prefix(7) | key_id(4)
+#   chunks: ciphertext(chunk_size) + tag(16), the final chunk may be shorter
+#
+# Every chunk is sealed with nonce = nonce_prefix | chunk_index(4) | last_flag(1)
+# and the header as associated data, so chunks cannot be reordered, dropped,
+# truncated or moved between files. A fresh key is derived per file from
+# evidence key version key_id and the salt. Version 1 headers have no
+# key_id and were written under evidence key version 1.
+
+MAGIC = b'WIQE'
+VERSION = 2
+ALGORITHMS = {
+    'aes-gcm': (1, AESGCM),
+    'chacha20-poly1305': (2, ChaCha20Poly1305),
+}
+ALGORITHM_IDS = {algorithm_id: cipher for algorithm_id, cipher in ALGORITHMS.values()}
+HEADER = struct.Struct('>4sBBI16s7sI')
+HEADER_V1 = struct.Struct('>4sBBI16s7s')
+PREAMBLE_SIZE = 5
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class StreamDecryptionError(Exception):
+    """Raised when an encrypted stream is malformed or fails authentication"""
+
+
+class StreamCipher:
+    """
+    Chunked authenticated encryption for large evidence files.
+
+    Encryption and decryption work from streams with memory bounded by one
+    chunk, and byte ranges can be decrypted without reading the rest of
+    the file.
+    """
+
+    def __init__(self, keyring, purpose: str = 'evidence', algorithm: str = 'aes-gcm',
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unsupported stream algorithm: {algorithm}")
+        self.keyring = keyring
+        self.purpose = purpose
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+
+    def _file_cipher(self, key_id: int, algorithm_id: int, salt: bytes):
+        cipher = ALGORITHM_IDS.get(algorithm_id)
+        if cipher is None:
+            raise StreamDecryptionError(f"Unknown algorithm id {algorithm_id}")
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=b'wanaiq-evidence-stream-v1',
+        ).derive(self.keyring.get(self.purpose, key_id))
+        return cipher(key)
+
+    @staticmethod
+    def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+        return prefix + struct.pack('>I?', index, last)
+
+    def _read_header(self, src: BinaryIO) -> Tuple[bytes, int, int, int, bytes, bytes]:
+        preamble = src.read(PREAMBLE_SIZE)
+        header_struct = {VERSION: HEADER, 1: HEADER_V1}.get(preamble[4] if len(preamble) == PREAMBLE_SIZE else None)
+        if preamble[:4] != MAGIC or header_struct is None:
+            raise StreamDecryptionError("Not a supported encrypted evidence stream")
+        header = preamble + src.read(header_struct.size - PREAMBLE_SIZE)
+        if len(header) != header_struct.size:
+            raise StreamDecryptionError("Truncated stream header")
+        fields = header_struct.unpack(header)
+        _, _, algorithm_id, chunk_size, salt, prefix = fields[:6]
+        key_id = fields[6] if header_struct is HEADER else LEGACY_KEY_ID
+        if chunk_size <= 0:
+            raise StreamDecryptionError("Not a supported encrypted evidence stream")
+        return header, key_id, algorithm_id, chunk_size, salt, prefix
+
+    def key_id(self, src: BinaryIO) -> int:
+        """Evidence key version a stream was written under"""
+        return self._read_header(src)[1]
+
+    def encrypt_stream(self, src: BinaryIO, dst: BinaryIO) -> int:
+        """Encrypt src into dst. Returns the number of plaintext bytes."""
+        algorithm_id = ALGORITHMS[self.algorithm][0]
+        key_id, _ = self.keyring.active(self.purpose)
+        salt = os.urandom(16)
+        prefix = os.urandom(7)
+        header = HEADER.pack(MAGIC, VERSION, algorithm_id, self.chunk_size, salt, prefix, key_id)
+        aead = self._file_cipher(key_id, algorithm_id, salt)
+        dst.write(header)
+
+        total = 0
+        index = 0
+        chunk = src.read(self.chunk_size)
+        while True:
+            # Read one chunk ahead so the final chunk can be flagged
+            next_chunk = src.read(self.chunk_size) if len(chunk) == self.chunk_size else b''
+            last = not next_chunk
+            dst.write(aead.encrypt(self._nonce(prefix, index, last), chunk, header))
+            total += len(chunk)
+            if last:
+                return total
+            chunk = next_chunk
+            index += 1
+
+    def _iter_chunks(self, src: BinaryIO, start_index: int = 0) -> Iterator[Tuple[int, bytes]]:
+        base = src.tell()
+        header, key_id, algorithm_id, chunk_size, salt, prefix = self._read_header(src)
+        aead = self._file_cipher(key_id, algorithm_id, salt)
+        sealed_size = chunk_size + TAG_SIZE
+
+        if start_index:
+            src.seek(base + len(header) + start_index * sealed_size)
+        index = start_index
+        sealed = src.read(sealed_size)
+        while True:
+            if len(sealed) < TAG_SIZE:
+                raise StreamDecryptionError("Truncated encrypted stream")
+            next_sealed = src.read(sealed_size) if len(sealed) == sealed_size else b''
+            last = not next_sealed
+            try:
+                yield index, aead.decrypt(self._nonce(prefix, index, last), sealed, header)
+            except Exception:
+                raise StreamDecryptionError(f"Authentication failed for chunk {index}")
+            if last:
+                return
+            sealed = next_sealed
+            index += 1
+
+    def decrypt_chunks(self, src: BinaryIO) -> Iterator[bytes]:
+        """Yield the authenticated plaintext of src one chunk at a time"""
+        for _, plaintext in self._iter_chunks(src):
+            yield plaintext
+
+    def decrypt_stream(self, src: BinaryIO, dst: BinaryIO) -> int:
+        """Decrypt src into dst. Returns the number of plaintext bytes."""
+        total = 0
+        for plaintext in self.decrypt_chunks(src):
+            dst.write(plaintext)
+            total += len(plaintext)
+        return total
+
+    def decrypt_range(self, src: BinaryIO, offset: int, length: int) -> bytes:
+        """
+        Decrypt plaintext bytes [offset, offset + length) from a seekable
+        stream, authenticating only the chunks that cover the range.
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("offset and length must be non-negative")
+        if length == 0:
+            return b''
+        start = src.tell()
+        chunk_size = self._read_header(src)[3]
+        src.seek(start)
+
+        first_index = offset // chunk_size
+        end = offset + length
+        parts = []
+        for index, plaintext in self._iter_chunks(src, first_index):
+            chunk_start = index * chunk_size
+            parts.append(plaintext[max(offset - chunk_start, 0):end - chunk_start])
+            if chunk_start + len(plaintext) >= end:
+                break
+        return b''.join(parts)
+
+    @staticmethod
+    def plaintext_size(ciphertext_size: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Plaintext length of an encrypted stream, computed from its size alone"""
+        body = ciphertext_size - HEADER.size
+        chunks = max(1, -(-body // (chunk_size + TAG_SIZE)))
+        return body - chunks * TAG_SIZE
@@ -0,0 +1,88 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import psutil
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv('AUDIT_METRICS_INTERVAL_SECONDS', '5'))
+
+
+class SystemMetricsSampler:
+    """
+    Cached system context for audit records.
+
+    The hostname and its IP are resolved once. CPU, memory and disk usage
+    are sampled by a background thread every interval seconds into a new
+    dict, so snapshot() is a single attribute read and records can share
+    the returned dict without copying it. The first snapshot() samples
+    synchronously and starts the thread.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS, disk_path: str = '/'):
+        self.interval = interval
+        self.disk_path = disk_path
+        self._host: Optional[Dict[str, Any]] = None
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _resolve_host(self) -> Dict[str, Any]:
+        hostname = socket.gethostname()
+        try:
+            ip_address = socket.gethostbyname(hostname)
+        except OSError:
+            ip_address = None
+        return {'hostname': hostname, 'ip_address': ip_address, 'process_id': os.getpid()}
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a fresh sample and make it the current snapshot"""
+        if self._host is None:
+            self._host = self._resolve_host()
+        snapshot = {
+            **self._host,
+            'cpu_usage': psutil.cpu_percent(),
+            'memory_usage': psutil.virtual_memory().percent,
+            'disk_usage': psutil.disk_usage(self.disk_path).percent,
+            'sampled_at': datetime.utcnow().isoformat()
+        }
+        self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest sample; treat it as read-only"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.sample()
+                    self.start()
+                snapshot = self._snapshot
+        return snapshot
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                # Keep serving the previous snapshot
+                pass
+
+
+# Initialize system metrics sampler
+system_metrics = SystemMetricsSampler()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+WanaIQ operations CLI.
+
+    python src/wanaiq.py keys init [--rsa-bits 4096]
+    python src/wanaiq.py keys status
+    python src/wanaiq.py audit verify [--log-file logs/audit.log] [--workers 4] [--full]
+    python src/wanaiq.py audit read --since 2026-03-01T00:00 [--until ...] [--event ADMIN_ACTION]
+
+'keys init' creates the keyring and the RSA key pair ahead of the first
+start, so neither is generated on a request path. Run it during deploy:
+unless DEBUG=true or KEYS_REQUIRE_INIT=false, a missing key is an error
+instead of a new key.
+'audit verify' checks the audit log's hash chain and signed checkpoints,
+rehashing the intervals between checkpoints in parallel. By default only
+what was added since the last successful run is rehashed; --full rechecks
+everything. Archived segments are verified too, including that the chain
+continues from one segment to the next and into the live log. It exits
+with status 1 if anything does not verify. 'audit read' prints the
+entries in a time range as JSON lines, decompressing only the archived
+segments that overlap it.
+None of the commands import the Flask app.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from security.audit_archive import AuditArchive, archive_dir_for
+from security.audit_chain import KEY_PURPOSE as AUDIT_KEY_PURPOSE, load_checkpoints, verify_log
+from security.audit_pipeline import AUDIT_LOG_FILE, AuditPipeline
+from security.encryption_manager import EncryptionManager, RSA_KEY_SIZE
+from security.keyring import keyring
+
+logger = logging.getLogger(__name__)
+
+
+def keys_init(args) -> int:
+    manager = EncryptionManager(keyring, rsa_key_size=args.rsa_bits)
+    created = manager.init_keys()
+    from evidence_store import BLOB_KEY_PURPOSE
+
+    for purpose in ('pseudonym', AUDIT_KEY_PURPOSE, BLOB_KEY_PURPOSE):
+        keyring.ensure(purpose, create=True)
+    logger.info(f"Keyring {keyring.path}: {'created' if created['keyring'] else 'already initialized'}")
+    logger.info(f"RSA key pair {manager.private_key_file}: {'created' if created['rsa'] else 'already present'}")
+    return 0
+
+
+def keys_status(args) -> int:
+    print(json.dumps(keyring.get_status(), indent=2))
+    return 0
+
+
+def audit_verify(args) -> int:
+    archive = AuditArchive(archive_dir_for(args.log_file))
+    last = archive.last_segment()
+    if last is not None and not os.path.exists(f"{args.log_file}.checkpoints"):
+        # Rotated, and nothing written since
+        result = {'ok': True, 'entries': 0, 'checkpoints': 0, 'unsealed': 0, 'errors': []}
+    else:
+        result = verify_log(args.log_file, keyring, workers=args.workers, incremental=not args.full)
+    if last is not None:
+        result['archive'] = archive.verify(keyring, workers=args.workers, incremental=not args.full)
+        result['errors'].extend(result['archive']['errors'])
+        checkpoints = load_checkpoints(f"{args.log_file}.checkpoints")
+        if checkpoints and (checkpoints[0]['seq'], checkpoints[0]['chain_hash']) != (
+                last['seq_end'], last['chain_end']):
+            result['errors'].append(f"log does not continue segment {last['name']}")
+        result['ok'] = not result['errors']
+    print(json.dumps(result, indent=2))
+    return 0 if result['ok'] else 1
+
+
+def audit_read(args) -> int:
+    pipeline = AuditPipeline(log_file=args.log_file, keyring=keyring)
+    for entry in pipeline.read(args.since, args.until):
+        if args.event is None or entry['event'] == args.event:
+            print(json.dumps(dict(entry, time=entry['time'].isoformat()), default=str))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='wanaiq', description='WanaIQ operations')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    keys = commands.add_parser('keys', help='Manage encryption keys').add_subparsers(dest='action', required=True)
+    init = keys.add_parser('init', help='Create the keyring and RSA key pair if missing')
+    init.add_argument('--rsa-bits', type=int, default=RSA_KEY_SIZE)
+    init.set_defaults(handler=keys_init)
+    status = keys.add_parser('status', help='Show key versions per purpose')
+    status.set_defaults(handler=keys_status)
+
+    audit = commands.add_parser('audit', help='Audit log tools').add_subparsers(dest='action', required=True)
+    verify = audit.add_parser('verify', help='Verify the audit log hash chain and checkpoints')
+    verify.add_argument('--log-file', default=AUDIT_LOG_FILE)
+    verify.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    verify.add_argument('--full', action='store_true', help='Rehash everything, not only new intervals')
+    verify.set_defaults(handler=audit_verify)
+    read = audit.add_parser('read', help='Print audit entries in a time range (log-local time)')
+    read.add_argument('--log-file', default=AUDIT_LOG_FILE)
+    read.add_argument('--since', type=datetime.fromisoformat)
+    read.add_argument('--until', type=datetime.fromisoformat)
+    read.add_argument('--event', help='Only this event type, e.g. ADMIN_ACTION')
+    read.set_defaults(handler=audit_read)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Tests build their keys on first use instead of running 'keys init'
+os.environ.setdefault('KEYS_REQUIRE_INIT', 'false')
+
+# Keys, audit logs and job checkpoints the app writes go to a scratch
+# directory instead of the repository's keys/ and logs/
+_scratch = tempfile.mkdtemp(prefix='wanaiq-tests-')
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+for name, path in {
+    'AUDIT_LOG_FILE': 'logs/audit.log',
+    'REENCRYPTION_CHECKPOINT_FILE': 'logs/reencryption_checkpoint.json',
+    'RESCORE_CHECKPOINT_FILE': 'logs/rescore_checkpoint.json',
+    'KEYRING_FILE': 'keys/keyring.json',
+    'MASTER_KEY_FILE': 'keys/master.key',
+    'EVIDENCE_KEY_FILE': 'keys/evidence.key',
+    'DATA_KEY_FILE': 'keys/data.key',
+    'PRIVATE_KEY_FILE': 'keys/private.pem',
+    'PUBLIC_KEY_FILE': 'keys/public.pem',
+    'EVIDENCE_STORE_PATH': 'evidence_store',
+}.items():
+    os.environ.setdefault(name, os.path.join(_scratch, path))
@@ -0,0 +1,141 @@
+import pytest
+import base64
+import struct
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from main import app, db
+from database.models import SensitiveReport, EvidenceBlob, EvidenceFile
+from security.keyring import Keyring
+from security.stream_encryption import StreamCipher
+from evidence_store import EvidenceBlobStore, LocalBlobBackend
+from evidence_ingest import evidence_pipeline, strip_metadata
+
+def jpeg_segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+JFIF = jpeg_segment(0xE0, b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00')
+EXIF = jpeg_segment(0xE1, b'Exif\x00\x00GPS -1.2921,36.8219')
+SCAN = b'\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00' + b'\x12\x34' * 64 + b'\xff\xd9'
+JPEG = b'\xff\xd8' + JFIF + EXIF + jpeg_segment(0xFE, b'phone model') + SCAN
+
+KEYRING = Keyring.from_keys({'evidence': {1: Fernet.generate_key()}})
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    store = EvidenceBlobStore(LocalBlobBackend(str(tmp_path / 'blobs')), StreamCipher(KEYRING))
+    previous_store, evidence_pipeline.store = evidence_pipeline.store, store
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            evidence_pipeline.shutdown()
+            db.drop_all()
+    evidence_pipeline.store = previous_store
+
+def wait_for_evidence(client, report_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f'/api/anonymous/status/{report_id}').get_json()
+        if status['evidence_complete']:
+            return status
+        time.sleep(0.05)
+    raise AssertionError('Evidence ingest did not finish')
+
+def test_strip_metadata_removes_exif_and_comments():
+    stripped, was_stripped = strip_metadata(JPEG)
+    assert was_stripped
+    assert stripped == b'\xff\xd8' + JFIF + SCAN
+    assert strip_metadata(b'%PDF-1.7 body') == (b'%PDF-1.7 body', False)
+
+def test_submit_returns_before_evidence_is_processed(client):
+    """Evidence is acknowledged with the report and ingested in the background"""
+    response = client.post('/api/anonymous/report', json={
+        'category': 'corruption',
+        'content': 'The county officer asked for a bribe',
+        'evidence': [
+            {'filename': '../photo.jpg', 'content_type': 'image/jpeg', 'data': base64.b64encode(JPEG).decode()},
+            {'filename': 'notes.txt', 'content_type': 'text/plain', 'data': 'not base64!'}
+        ]
+    })
+    assert response.status_code == 201
+    report_id = response.get_json()['report_id']
+    assert response.get_json()['evidence_files'] == 2
+
+    status = wait_for_evidence(client, report_id)
+    photo, notes = status['evidence']
+    assert photo['filename'] == 'photo.jpg'
+    assert photo['state'] == 'stored' and photo['metadata_stripped'] is True
+    assert notes['state'] == 'failed'
+
+    evidence = EvidenceFile.query.filter_by(status='stored').one()
+    assert EvidenceFile.query.filter_by(status='failed').one().filename == 'notes.txt'
+    assert evidence.file_size == len(JPEG) - len(EXIF) - 15
+    out = BytesIO()
+    evidence_pipeline.store.read_to(evidence.blob_key, out)
+    assert b'GPS' not in out.getvalue() and b'phone model' not in out.getvalue()
+    assert db.session.get(EvidenceBlob, evidence.blob_key).ref_count == 1
+
+def test_status_falls_back_to_row_states(client):
+    """Without in-memory progress, evidence is only complete once every row is"""
+    report = SensitiveReport(report_id='SR-1', encrypted_content=b'x', content_hash='h', category='corruption')
+    db.session.add(report)
+    db.session.commit()
+    assert client.get('/api/anonymous/status/SR-1').get_json()['evidence_complete'] is False
+
+    db.session.add_all([
+        EvidenceFile(report_id=report.id, filename='a.jpg', blob_key='k', file_hash='k',
+                     file_type='image/jpeg', file_size=10, status='stored'),
+        EvidenceFile(report_id=report.id, filename='b.jpg', file_hash='',
+                     file_type='image/jpeg', file_size=0, status='queued')
+    ])
+    db.session.commit()
+    status = client.get('/api/anonymous/status/SR-1').get_json()
+    assert [entry['state'] for entry in status['evidence']] == ['stored', 'queued']
+    assert status['evidence_complete'] is False
+
+    EvidenceFile.query.filter_by(filename='b.jpg').update({'status': 'failed'})
+    db.session.commit()
+    assert client.get('/api/anonymous/status/SR-1').get_json()['evidence_complete'] is True
+
+def test_rows_left_queued_by_a_stopped_process_are_failed(client, monkeypatch):
+    """A sweep marks rows queued past the timeout as failed, so the status completes"""
+    report = SensitiveReport(report_id='SR-2', encrypted_content=b'x', content_hash='h', category='corruption')
+    db.session.add(report)
+    db.session.flush()
+    db.session.add_all([
+        EvidenceFile(report_id=report.id, filename='lost.jpg', file_hash='', file_type='image/jpeg',
+                     file_size=0, status='queued', uploaded_at=datetime.utcnow() - timedelta(hours=2)),
+        EvidenceFile(report_id=report.id, filename='recent.jpg', file_hash='', file_type='image/jpeg',
+                     file_size=0, status='queued')
+    ])
+    db.session.commit()
+    monkeypatch.setattr(evidence_pipeline, '_last_sweep', None)
+
+    status = client.get('/api/anonymous/status/SR-2').get_json()
+    assert [entry['state'] for entry in status['evidence']] == ['failed', 'queued']
+
+def test_evidence_is_refused_while_the_pipeline_is_full(client, monkeypatch):
+    """Uploads beyond the in-memory bound get a 503 and no report is stored"""
+    monkeypatch.setattr(evidence_pipeline, 'max_pending', 1)
+    response = client.post('/api/anonymous/report', json={
+        'category': 'corruption',
+        'content': 'The county officer asked for a bribe',
+        'evidence': [{'filename': name, 'data': base64.b64encode(JPEG).decode()} for name in ('a.jpg', 'b.jpg')]
+    })
+    assert response.status_code == 503 and response.headers['Retry-After']
+    assert SensitiveReport.query.count() == 0
+    assert evidence_pipeline._pending == 0
+
+def test_status_of_unknown_report(client):
+    assert client.get('/api/anonymous/status/missing').status_code == 404
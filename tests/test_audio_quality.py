@@ -0,0 +1,63 @@
+import asyncio
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from audio_quality import ListenerQualityController, next_tier
+
+class FakeTrack:
+    def __init__(self, tier):
+        self.tier = tier
+
+    def stop(self):
+        pass
+
+class FakeTiers:
+    def subscribe(self, tier):
+        return FakeTrack(tier)
+
+class FakeSender:
+    def __init__(self):
+        self.track = FakeTrack('medium')
+
+    def replaceTrack(self, track):
+        self.track = track
+
+def test_next_tier_is_clamped():
+    """Test stepping through tiers stops at the best and worst tier"""
+    assert next_tier('medium', 1) == 'low'
+    assert next_tier('low', 1) == 'low'
+    assert next_tier('medium', -1) == 'high'
+    assert next_tier('high', -1) == 'high'
+
+def test_congested_listener_is_downgraded_then_recovers():
+    """Test that sustained loss drops a tier and sustained clean reports raise it"""
+    async def scenario():
+        sender = FakeSender()
+        controller = ListenerQualityController(sender, FakeTiers(), tier='medium')
+
+        # A single bad report is not enough to switch
+        controller.observe(loss=0.10, jitter=0.005)
+        assert controller.tier == 'medium'
+
+        controller.observe(loss=0.10, jitter=0.005)
+        assert controller.tier == 'low'
+        assert sender.track.tier == 'low'
+
+        for _ in range(5):
+            controller.observe(loss=0.0, jitter=0.002)
+        assert controller.tier == 'medium'
+
+    asyncio.run(scenario())
+
+def test_high_jitter_counts_as_congestion():
+    """Test that jitter alone can trigger a downgrade"""
+    async def scenario():
+        controller = ListenerQualityController(FakeSender(), FakeTiers(), tier='high')
+        controller.observe(loss=0.0, jitter=0.050)
+        controller.observe(loss=0.0, jitter=0.050)
+        assert controller.tier == 'medium'
+
+    asyncio.run(scenario())
@@ -0,0 +1,172 @@
+import pytest
+import json
+import logging
+import stat
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from security.audit_archive import AuditArchive, decompress
+from security.audit_chain import load_checkpoints
+from security.audit_pipeline import AuditPipeline
+from security.keyring import Keyring
+import wanaiq
+
+START = datetime(2026, 3, 1)
+
+@pytest.fixture
+def keyring():
+    return Keyring.from_keys({'audit': {1: Fernet.generate_key()}})
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / 'audit.log')
+
+def make_pipeline(log_file, keyring, **kwargs):
+    archive = AuditArchive(os.path.join(os.path.dirname(log_file), 'archive'), retention_days=3650)
+    settings = dict(keyring=keyring, checkpoint_interval=10, archive=archive, segment_max_bytes=4096)
+    settings.update(kwargs)
+    return AuditPipeline(log_file=log_file, **settings)
+
+def write(pipeline, count, first=0, hours_apart=1):
+    logger = logging.getLogger('audit.test.archive')
+    for i in range(first, first + count):
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 0, 'DATA_ACCESS', (), None,
+                                   extra={'audit_event': 'DATA_ACCESS', 'audit_data': {'i': i, 'pad': 'x' * 100}})
+        record.created = time.mktime((START + timedelta(hours=i * hours_apart)).timetuple())
+        pipeline.put(record)
+        # One record per batch, so rotation points are deterministic
+        assert pipeline.flush(timeout=5)
+
+def test_log_rotates_into_compressed_read_only_segments(log_file, keyring):
+    pipeline = make_pipeline(log_file, keyring)
+    write(pipeline, 100)
+    pipeline.close()
+
+    segments = pipeline.archive.load_manifest()['segments']
+    assert len(segments) >= 3
+    assert all(segment['bytes'] >= 4096 and segment['stored_bytes'] < segment['bytes'] for segment in segments)
+    for previous, segment in zip(segments, segments[1:]):
+        assert (segment['seq_start'], segment['chain_start']) == (previous['seq_end'], previous['chain_end'])
+
+    path = os.path.join(pipeline.archive.directory, segments[0]['file'])
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o444
+    with open(path, 'rb') as f:
+        assert b'"i": 0' in decompress(f.read(), segments[0]['codec'])
+
+    entries = list(pipeline.read())
+    assert [entry['data']['i'] for entry in entries] == list(range(100))
+    assert [entry['seq'] for entry in entries] == list(range(100))
+
+def test_time_range_reads_only_overlapping_segments(log_file, keyring, monkeypatch):
+    pipeline = make_pipeline(log_file, keyring)
+    write(pipeline, 100)
+    pipeline.close()
+
+    opened = []
+    read_segment = pipeline.archive.read_segment
+    monkeypatch.setattr(pipeline.archive, 'read_segment', lambda segment: opened.append(segment['name']) or read_segment(segment))
+
+    entries = list(pipeline.read(START + timedelta(hours=40), START + timedelta(hours=45)))
+    assert [entry['data']['i'] for entry in entries] == [40, 41, 42, 43, 44]
+    assert 1 <= len(opened) <= 2 < len(pipeline.archive.load_manifest()['segments'])
+
+def test_time_based_rotation(log_file, keyring):
+    pipeline = make_pipeline(log_file, keyring, segment_max_bytes=10 ** 9, segment_max_seconds=0)
+    write(pipeline, 3)
+    pipeline.close()
+    assert len(pipeline.archive.load_manifest()['segments']) == 3
+
+def test_retention_deletes_oldest_segments(log_file, keyring):
+    pipeline = make_pipeline(log_file, keyring)
+    write(pipeline, 100, hours_apart=24)
+    pipeline.close()
+    archive = pipeline.archive
+    archive.retention_days = 30
+
+    before = archive.load_manifest()['segments']
+    removed = archive.enforce_retention(now=START + timedelta(days=60))
+    after = archive.load_manifest()
+    assert 0 < removed < len(before)
+    assert after['segments'] == before[removed:]
+    assert after['pruned_through_seq'] == before[removed - 1]['seq_end']
+    assert not os.path.exists(os.path.join(archive.directory, before[0]['file']))
+    assert all(datetime.fromisoformat(segment['last_time']) >= START + timedelta(days=30)
+               for segment in after['segments'])
+
+def test_archive_and_live_log_verify_as_one_chain(log_file, keyring, monkeypatch, capsys):
+    pipeline = make_pipeline(log_file, keyring)
+    write(pipeline, 60)
+    pipeline.close()
+    monkeypatch.setattr(wanaiq, 'keyring', keyring)
+    monkeypatch.setenv('AUDIT_ARCHIVE_DIR', pipeline.archive.directory)
+
+    assert wanaiq.main(['audit', 'verify', '--log-file', log_file, '--workers', '2', '--full']) == 0
+    result = json.loads(capsys.readouterr().out)
+    assert result['entries'] + result['unsealed'] + result['archive']['entries'] == 60
+
+    # A writer restarted after the rotation keeps chaining from the archive
+    restarted = make_pipeline(log_file, keyring)
+    write(restarted, 5, first=60)
+    restarted.close()
+    assert wanaiq.main(['audit', 'verify', '--log-file', log_file]) == 0
+    capsys.readouterr()
+
+    segment = pipeline.archive.load_manifest()['segments'][0]
+    path = os.path.join(pipeline.archive.directory, segment['file'])
+    os.chmod(path, 0o644)
+    with open(path, 'ab') as f:
+        f.write(b'x')
+    assert wanaiq.main(['audit', 'verify', '--log-file', log_file, '--full']) == 1
+    assert 'checksum mismatch' in capsys.readouterr().out
+
+def test_interrupted_rotation_is_completed_on_restart(log_file, keyring):
+    pipeline = make_pipeline(log_file, keyring, segment_max_bytes=10 ** 9)
+    write(pipeline, 5)
+    pipeline.close()
+    # Archived, but the crash came before the live files were removed
+    pipeline.archive.add_segment(log_file, log_file + '.checkpoints')
+
+    restarted = make_pipeline(log_file, keyring, segment_max_bytes=10 ** 9)
+    write(restarted, 2, first=5)
+    restarted.close()
+    assert [entry['data']['i'] for entry in restarted.read()] == list(range(7))
+
+def test_rotation_by_another_process_is_followed(log_file, keyring, monkeypatch, capsys):
+    # Two pipelines on one file stand in for two worker processes
+    pipelines = [make_pipeline(log_file, keyring), make_pipeline(log_file, keyring)]
+    for i in range(60):
+        write(pipelines[i % 2], 1, first=i)
+    for pipeline in pipelines:
+        pipeline.close()
+
+    assert len(pipelines[0].archive.load_manifest()['segments']) >= 2
+    assert [entry['data']['i'] for entry in pipelines[0].read()] == list(range(60))
+    monkeypatch.setattr(wanaiq, 'keyring', keyring)
+    monkeypatch.setenv('AUDIT_ARCHIVE_DIR', pipelines[0].archive.directory)
+    assert wanaiq.main(['audit', 'verify', '--log-file', log_file, '--full']) == 0
+    result = json.loads(capsys.readouterr().out)
+    assert result['entries'] + result['unsealed'] + result['archive']['entries'] == 60
+
+def test_live_log_is_read_from_the_checkpoint_before_start(log_file, keyring):
+    pipeline = make_pipeline(log_file, keyring, segment_max_bytes=10 ** 9)
+    write(pipeline, 25)
+    # Written after the checkpoints above were sealed
+    later = (datetime.now() + timedelta(hours=1)).replace(microsecond=0)
+    logger = logging.getLogger('audit.test.archive')
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 0, 'DATA_ACCESS', (), None,
+                               extra={'audit_event': 'DATA_ACCESS', 'audit_data': {'i': 25}})
+    record.created = time.mktime(later.timetuple())
+    pipeline.put(record)
+    assert pipeline.flush(timeout=5)
+
+    assert pipeline._read_offset(later) == load_checkpoints(log_file + '.checkpoints')[-1]['offset'] > 0
+    assert [entry['data']['i'] for entry in pipeline.read(later)] == [25]
+    assert [entry['data']['i'] for entry in pipeline.read()] == list(range(26))
+    pipeline.close()
@@ -0,0 +1,208 @@
+import pytest
+import json
+import logging
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from security.audit_chain import load_checkpoints, merkle_root, verify_log
+from security.audit_pipeline import AuditPipeline
+from security.keyring import Keyring
+import wanaiq
+
+@pytest.fixture
+def keyring():
+    return Keyring.from_keys({'audit': {1: Fernet.generate_key()}})
+
+def write_log(log_file, keyring, count, checkpoint_interval=10):
+    pipeline = AuditPipeline(log_file=log_file, keyring=keyring, checkpoint_interval=checkpoint_interval)
+    logger = logging.getLogger('audit.test.chain')
+    for i in range(count):
+        pipeline.put(logger.makeRecord(logger.name, logging.INFO, __file__, 0, 'DATA_ACCESS', (), None,
+                                       extra={'audit_event': 'DATA_ACCESS', 'audit_data': {'i': i}}))
+    assert pipeline.flush(timeout=10)
+    pipeline.close()
+    return pipeline
+
+def rewrite(log_file, index, old, new):
+    with open(log_file) as f:
+        lines = f.readlines()
+    lines[index] = lines[index].replace(old, new)
+    with open(log_file, 'w') as f:
+        f.writelines(lines)
+
+def test_chained_log_verifies_serially_and_in_parallel(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    write_log(log_file, keyring, 95)
+
+    checkpoints = load_checkpoints(log_file + '.checkpoints')
+    # Genesis, nine full intervals and the remainder sealed on close
+    assert [c['count'] for c in checkpoints] == [0] + [10] * 9 + [5]
+    serial = verify_log(log_file, keyring, incremental=False)
+    parallel = verify_log(log_file, keyring, workers=2, incremental=False)
+    assert serial == parallel
+    assert parallel['ok'] and parallel['entries'] == 95 and parallel['unsealed'] == 0
+
+def test_edits_are_detected(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    write_log(log_file, keyring, 30)
+    rewrite(log_file, 12, '{"i": 12}', '{"i": 99}')
+
+    result = verify_log(log_file, keyring, incremental=False)
+    assert not result['ok'] and result['errors'] == ['entry 12: hash mismatch']
+
+def test_recomputed_chain_fails_checkpoint_signature(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    write_log(log_file, keyring, 20)
+    forged = Keyring.from_keys({'audit': {1: Fernet.generate_key()}})
+    os.remove(log_file + '.checkpoints')
+    os.remove(log_file)
+    write_log(log_file, forged, 20)
+
+    result = verify_log(log_file, keyring, incremental=False)
+    assert not result['ok'] and all('bad signature' in error for error in result['errors'])
+
+def test_incremental_verification_starts_at_last_verified_checkpoint(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    write_log(log_file, keyring, 40)
+    assert verify_log(log_file, keyring, incremental=True)['entries'] == 40
+
+    # The writer resumes the chain after the last checkpoint
+    write_log(log_file, keyring, 25)
+    result = verify_log(log_file, keyring, incremental=True)
+    assert result['ok'] and result['verified_from'] == 40 and result['entries'] == 25
+
+    rewrite(log_file, 3, '{"i": 3}', '{"i": 4}')
+    assert verify_log(log_file, keyring, incremental=True)['ok']
+    assert not verify_log(log_file, keyring, incremental=False)['ok']
+
+def test_incremental_verification_detects_truncation(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    write_log(log_file, keyring, 40)
+    assert verify_log(log_file, keyring, incremental=True)['ok']
+
+    # Cut the log and its checkpoints back to entry 20, consistently
+    checkpoints = load_checkpoints(log_file + '.checkpoints')
+    with open(log_file, 'r+b') as f:
+        f.truncate(checkpoints[2]['offset'])
+    with open(log_file + '.checkpoints') as f:
+        lines = f.readlines()
+    with open(log_file + '.checkpoints', 'w') as f:
+        f.writelines(lines[:3])
+
+    result = verify_log(log_file, keyring, incremental=True)
+    assert not result['ok'] and result['errors'] == [
+        'last verified checkpoint 40 is missing; the log or its checkpoints were truncated']
+    # What is left is still a valid chain
+    assert verify_log(log_file, keyring, incremental=False)['ok']
+
+def put(pipeline, i):
+    logger = logging.getLogger('audit.test.chain')
+    pipeline.put(logger.makeRecord(logger.name, logging.INFO, __file__, 0, 'DATA_ACCESS', (), None,
+                                   extra={'audit_event': 'DATA_ACCESS', 'audit_data': {'i': i}}))
+    assert pipeline.flush(timeout=10)
+
+def test_failed_write_does_not_advance_the_chain(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    pipeline = AuditPipeline(log_file=log_file, keyring=keyring, checkpoint_interval=10, retry_seconds=0)
+    put(pipeline, 0)
+
+    def torn_write(lines):
+        data = ''.join(lines).encode('utf-8')
+        pipeline._file.write(data[:len(data) // 2])
+        pipeline._file.flush()
+        del pipeline._append
+        raise OSError('No space left on device')
+
+    # The torn batch is retried once the file is reopened
+    pipeline._append = torn_write
+    put(pipeline, 1)
+    for i in range(2, 15):
+        put(pipeline, i)
+    pipeline.close()
+
+    result = verify_log(log_file, keyring, incremental=False)
+    assert result['ok'] and result['entries'] == 15 and pipeline.dropped == 0
+
+def test_batch_that_keeps_failing_is_counted_as_dropped(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    pipeline = AuditPipeline(log_file=log_file, keyring=keyring, write_retries=2, retry_seconds=0)
+    attempts = []
+
+    def failing_write(lines):
+        attempts.append(lines)
+        raise OSError('No space left on device')
+
+    pipeline._append = failing_write
+    put(pipeline, 0)
+    assert len(attempts) == 3 and pipeline.dropped == 1
+    del pipeline._append
+    put(pipeline, 1)
+    pipeline.close()
+
+    with open(log_file) as f:
+        lines = f.readlines()
+    assert len(lines) == 2 and '"dropped_records": 1' in lines[-1]
+    assert verify_log(log_file, keyring, incremental=False)['ok']
+
+def test_log_that_does_not_verify_is_moved_aside(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    pipeline = AuditPipeline(log_file=log_file, keyring=keyring, checkpoint_interval=10)
+    for i in range(15):
+        put(pipeline, i)
+    rewrite(log_file, 12, '{"i": 12}', '{"i": 99}')
+
+    other = AuditPipeline(log_file=log_file, keyring=keyring, checkpoint_interval=10)
+    put(other, 15)
+    put(pipeline, 16)
+    other.close()
+    pipeline.close()
+
+    moved = [name for name in os.listdir(tmp_path) if '.broken-' in name]
+    assert len(moved) == 2
+    with open(log_file) as f:
+        lines = f.readlines()
+    assert 'AUDIT_CHAIN_BREAK: {' in lines[0] and '"resumed_at_seq": 12' in lines[0]
+    assert len(lines) == 3
+    result = verify_log(log_file, keyring, incremental=False)
+    assert result['ok'] and result['entries'] == 3
+
+def test_writers_in_several_processes_extend_one_chain(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    # Two pipelines on one file stand in for two worker processes
+    first = AuditPipeline(log_file=log_file, keyring=keyring, checkpoint_interval=10)
+    second = AuditPipeline(log_file=log_file, keyring=keyring, checkpoint_interval=10)
+    for i in range(25):
+        put(first if i % 3 else second, i)
+    first.close()
+    second.close()
+
+    result = verify_log(log_file, keyring, incremental=False)
+    assert result['ok'] and result['entries'] == 25
+
+def test_legacy_lines_before_the_chain_are_skipped(tmp_path, keyring):
+    log_file = str(tmp_path / 'audit.log')
+    with open(log_file, 'w') as f:
+        f.write('2026-01-01 00:00:00 | INFO | DATA_ACCESS: {}\n')
+    write_log(log_file, keyring, 5)
+    assert load_checkpoints(log_file + '.checkpoints')[0]['offset'] > 0
+    assert verify_log(log_file, keyring)['ok']
+
+def test_merkle_root_pairs_odd_nodes():
+    leaves = [f'{i:064x}' for i in range(3)]
+    assert merkle_root(leaves) == merkle_root(leaves + leaves[-1:])
+    assert merkle_root(leaves) != merkle_root(leaves[:2])
+
+def test_verify_cli_exit_status(tmp_path, keyring, monkeypatch, capsys):
+    log_file = str(tmp_path / 'audit.log')
+    write_log(log_file, keyring, 12)
+    monkeypatch.setattr(wanaiq, 'keyring', keyring)
+    assert wanaiq.main(['audit', 'verify', '--log-file', log_file, '--workers', '2']) == 0
+    assert json.loads(capsys.readouterr().out)['entries'] == 12
+
+    rewrite(log_file, 0, '{"i": 0}', '{"i": 1}')
+    assert wanaiq.main(['audit', 'verify', '--log-file', log_file, '--full']) == 1
@@ -0,0 +1,107 @@
+import pytest
+import logging
+import sys
+import os
+import time
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+from sqlalchemy import event
+
+from main import app, db
+from database.models import AdminAuditLog
+from security.audit_logger import AuditLogger
+from security.audit_pipeline import AuditPipeline
+from security.keyring import Keyring
+
+AUDIT_KEYRING = Keyring.from_keys({'audit': {1: Fernet.generate_key()}})
+
+@pytest.fixture
+def audit(tmp_path, request):
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    pipeline = AuditPipeline(log_file=str(tmp_path / 'audit.log'), fsync_interval=60, keyring=AUDIT_KEYRING)
+    pipeline.init_app(app, db)
+    audit = AuditLogger(pipeline, logger_name=f'audit.test.{request.node.name}')
+    audit.logger.propagate = False
+    with app.app_context():
+        db.create_all()
+        yield audit
+        pipeline.close()
+        db.drop_all()
+
+def log_action(audit, i):
+    audit.log_admin_action(admin_user_id=f'admin-{i % 3}', action='view_reports',
+                           target_resource='admin_reports', details={'ip_address': '10.0.0.1'})
+
+def test_admin_actions_reach_file_and_database_in_batches(audit):
+    commits = []
+    listener = lambda session: commits.append(session)
+    event.listen(db.session, 'after_commit', listener)
+    try:
+        for i in range(200):
+            log_action(audit, i)
+        assert audit.pipeline.flush(timeout=10)
+    finally:
+        event.remove(db.session, 'after_commit', listener)
+
+    with open(audit.pipeline.log_file) as f:
+        lines = f.readlines()
+    assert len(lines) == 200 and ' | INFO | ADMIN_ACTION: {' in lines[0]
+    assert AdminAuditLog.query.count() == 200
+    assert AdminAuditLog.query.first().admin_id == 'admin-0'
+    assert len(commits) < 200
+
+def test_full_queue_drops_and_records_the_gap(tmp_path):
+    pipeline = AuditPipeline(log_file=str(tmp_path / 'audit.log'), queue_size=5, keyring=AUDIT_KEYRING)
+    pipeline._ensure_started = lambda: None  # writer not running yet
+    logger = logging.getLogger('audit.test.overflow')
+    for i in range(12):
+        pipeline.put(logger.makeRecord(logger.name, logging.INFO, __file__, 0, 'DATA_ACCESS', (), None,
+                                       extra={'audit_event': 'DATA_ACCESS', 'audit_data': {'i': i}}))
+    assert pipeline.dropped == 7
+
+    del pipeline._ensure_started
+    pipeline._ensure_started()
+    assert pipeline.flush(timeout=5)
+    pipeline.close()
+    with open(pipeline.log_file) as f:
+        lines = f.readlines()
+    assert len(lines) == 6
+    assert 'AUDIT_OVERFLOW: {' in lines[-1] and '"dropped_records": 7' in lines[-1]
+
+def test_logging_an_action_does_not_wait_for_io(audit):
+    started = time.perf_counter()
+    for i in range(1000):
+        log_action(audit, i)
+    per_call = (time.perf_counter() - started) / 1000
+    assert audit.pipeline.flush(timeout=20)
+    # Dominated by building the record; the write happens on the audit thread
+    assert per_call < 0.005
+
+def test_system_context_is_sampled_not_read_per_record(monkeypatch):
+    import socket
+    import psutil
+    from security.system_metrics import SystemMetricsSampler
+
+    calls = {'dns': 0, 'cpu': 0}
+    resolve = socket.gethostbyname
+    cpu_percent = psutil.cpu_percent
+    monkeypatch.setattr(socket, 'gethostbyname', lambda host: calls.__setitem__('dns', calls['dns'] + 1) or resolve('localhost'))
+    monkeypatch.setattr(psutil, 'cpu_percent', lambda: calls.__setitem__('cpu', calls['cpu'] + 1) or cpu_percent())
+
+    metrics = SystemMetricsSampler(interval=0.05)
+    audit = AuditLogger(AuditPipeline(log_file=os.devnull), logger_name='audit.test.metrics', metrics=metrics)
+    try:
+        contexts = [audit._get_system_context() for _ in range(500)]
+        assert calls == {'dns': 1, 'cpu': 1}
+        assert contexts[0] is contexts[-1]
+        assert {'hostname', 'ip_address', 'cpu_usage', 'memory_usage', 'disk_usage', 'sampled_at'} <= set(contexts[0])
+
+        time.sleep(0.3)
+        assert calls['cpu'] > 1 and calls['dns'] == 1
+        assert audit._get_system_context()['sampled_at'] >= contexts[0]['sampled_at']
+    finally:
+        metrics.stop(timeout=1)
@@ -0,0 +1,110 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from main import app, db
+from database.models import AdminAuditLog, SensitiveReport, User
+from security.audit_pipeline import admin_audit_row
+
+LOGS_URL = '/api/admin/audit/logs'
+START = datetime(2026, 3, 1)
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            report = SensitiveReport(report_id='r1', encrypted_content=b'x', content_hash='h',
+                                     category='corruption', risk_level=3)
+            db.session.add_all([report, User(id='investigator', role='admin'), User(id='reporter', role='journalist')])
+            db.session.flush()
+            db.session.add_all(AdminAuditLog(
+                admin_id=f'admin-{i % 3}', action='decrypt_report' if i % 5 == 0 else 'view_reports',
+                report_id=report.id if i % 4 == 0 else None, timestamp=START + timedelta(minutes=i // 2),
+                is_error=i % 10 == 0, severity='error' if i % 10 == 0 else 'info'
+            ) for i in range(60))
+            db.session.commit()
+            yield client
+            db.drop_all()
+
+def auth(identity='investigator'):
+    with app.app_context():
+        return {'Authorization': f"Bearer {create_access_token(identity=identity)}"}
+
+def fetch_all(client, **params):
+    pages, cursor = [], None
+    while True:
+        query = dict(params, cursor=cursor) if cursor else params
+        data = client.get(LOGS_URL, query_string=query, headers=auth()).get_json()
+        pages.append(data['logs'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            return pages
+
+def test_keyset_pages_cover_every_row_once_newest_first(client):
+    # Bounded in time so the audited searches themselves are not counted
+    pages = fetch_all(client, limit=7, until=(START + timedelta(days=1)).isoformat())
+    logs = [log for page in pages for log in page]
+    assert len(pages) == 9 and len(logs) == 60
+    assert len({log['id'] for log in logs}) == 60
+    keys = [(log['timestamp'], log['id']) for log in logs]
+    assert keys == sorted(keys, reverse=True)
+
+def test_filters_combine(client):
+    logs = fetch_all(client, admin_id='admin-0', action='decrypt_report')[0]
+    assert {(log['admin_id'], log['action']) for log in logs} == {('admin-0', 'decrypt_report')}
+    assert len(logs) == 4
+
+    logs = fetch_all(client, report_id='r1', since=(START + timedelta(minutes=10)).isoformat(),
+                     until=(START + timedelta(minutes=20)).isoformat())[0]
+    assert len(logs) == 5 and all(log['report_pk'] == 1 for log in logs)
+
+    assert len(fetch_all(client, errors_only='true')[0]) == 6
+    assert fetch_all(client, report_id='unknown')[0] == []
+
+def test_bad_parameters_are_rejected(client):
+    assert client.get(LOGS_URL, query_string={'since': 'yesterday'}, headers=auth()).status_code == 400
+    assert client.get(LOGS_URL, query_string={'cursor': 'bm90IGpzb24'}, headers=auth()).status_code == 400
+    # Valid JSON, but not a [timestamp, id] pair
+    assert client.get(LOGS_URL, query_string={'cursor': 'NQ'}, headers=auth()).status_code == 400
+    assert client.get(LOGS_URL, query_string={'cursor': 'WzEsIDJd'}, headers=auth()).status_code == 400
+
+def test_only_admins_can_search(client):
+    assert client.get(LOGS_URL, headers=auth('reporter')).status_code == 403
+    assert client.get(LOGS_URL, headers=auth('unknown')).status_code == 403
+    assert client.get(LOGS_URL).status_code == 401
+
+def test_queries_use_the_composite_indexes(client):
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        client.get(LOGS_URL, query_string={'admin_id': 'admin-1', 'limit': 5}, headers=auth())
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    select, parameters = next((s, p) for s, p in statements if s.lstrip().startswith('SELECT')
+                              and 'FROM admin_audit_logs' in s)
+    with db.engine.connect() as conn:
+        plan = ' '.join(str(row) for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + select, parameters))
+    assert 'idx_admin_audit_logs_admin_time' in plan
+
+def test_error_flag_is_set_on_write():
+    data = {'action': 'export_error', 'admin_user_id': 'a', 'timestamp': START.isoformat()}
+    assert admin_audit_row(data)['is_error'] is True
+    assert admin_audit_row(dict(data, action='view_reports'))['is_error'] is False
+    assert admin_audit_row(dict(data, action='view_reports', severity='critical'))['is_error'] is True
+
+def test_health_check_lists_flagged_errors(client):
+    data = client.get('/api/system/status').get_json()
+    assert len(data['recent_errors']) == 5
+    assert all(error['severity'] == 'error' for error in data['recent_errors'])
@@ -0,0 +1,136 @@
+import pytest
+import json
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import app, db
+from baraza_presence import presence_tracker, InMemoryPresenceBackend
+from baraza_join_buffer import join_buffer
+from database.models import BarazaParticipant
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    presence_tracker.backend = InMemoryPresenceBackend()
+    presence_tracker._last_reconcile = 0.0
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.drop_all()
+
+def create_space(client, host_user_id='host1'):
+    response = client.post('/api/baraza/create', json={'title': 'Town Hall', 'host_user_id': host_user_id})
+    assert response.status_code == 201
+    return json.loads(response.data)['space_id']
+
+def get_participant_count(client, space_id):
+    response = client.get('/api/baraza/spaces')
+    assert response.status_code == 200
+    spaces = json.loads(response.data)['spaces']
+    return next(space['participant_count'] for space in spaces if space['space_id'] == space_id)
+
+def test_live_spaces_count_active_participants(client):
+    """Test that joins are counted once per user and leaves are excluded"""
+    space_id = create_space(client)
+    client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener1'})
+    client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener2'})
+    client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener2'})
+
+    assert get_participant_count(client, space_id) == 3
+
+    response = client.post('/api/baraza/leave', json={'space_id': space_id, 'user_id': 'listener1'})
+    assert response.status_code == 200
+    assert get_participant_count(client, space_id) == 2
+
+def test_presence_reconciles_with_participant_rows(client):
+    """Test that reconciliation rebuilds counts from participants who have not left"""
+    space_id = create_space(client)
+    client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener1'})
+    client.post('/api/baraza/leave', json={'space_id': space_id, 'user_id': 'listener1'})
+
+    # Simulate a process restart losing the in-memory cache
+    presence_tracker.backend = InMemoryPresenceBackend()
+    presence_tracker._last_reconcile = 0.0
+
+    assert get_participant_count(client, space_id) == 1
+
+def test_join_buffer_collapses_duplicate_joins_and_handles_rejoin(client):
+    """Test that buffered joins write one open row per user and a new row on rejoin"""
+    space_id = create_space(client)
+    for _ in range(3):
+        response = client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener1'})
+        assert response.status_code == 200
+    join_buffer.flush()
+
+    rows = BarazaParticipant.query.filter_by(user_id='listener1').all()
+    assert len(rows) == 1
+
+    # Joining again while the row is still open does not add another row
+    client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener1'})
+    join_buffer.flush()
+    assert BarazaParticipant.query.filter_by(user_id='listener1').count() == 1
+
+    client.post('/api/baraza/leave', json={'space_id': space_id, 'user_id': 'listener1'})
+    client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener1'})
+    join_buffer.flush()
+
+    rows = BarazaParticipant.query.filter_by(user_id='listener1').order_by(BarazaParticipant.id).all()
+    assert len(rows) == 2
+    assert rows[0].left_at is not None
+    assert rows[1].left_at is None
+
+def test_join_rejects_space_that_is_not_live(client):
+    """Test that joins are validated against live spaces"""
+    response = client.post('/api/baraza/join', json={'space_id': 'missing', 'user_id': 'listener1'})
+    assert response.status_code == 404
+
+def test_ended_space_is_rejected_before_its_cache_expires(client):
+    """Test that a space ended by the WebSocket server is seen through shared presence"""
+    from database.models import BarazaSpace
+
+    space_id = create_space(client)
+    response = client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener1'})
+    assert response.status_code == 200
+
+    BarazaSpace.query.filter_by(space_id=space_id).update({'is_live': False})
+    db.session.commit()
+    presence_tracker.end_space(space_id)
+
+    response = client.post('/api/baraza/join', json={'space_id': space_id, 'user_id': 'listener2'})
+    assert response.status_code == 404
+
+def test_join_violating_a_constraint_does_not_block_the_others(client):
+    """Test that a permanently failing join is dropped and the rest of its chunk written"""
+    space_id = create_space(client)
+    space_pk = join_buffer.get_live_space(space_id)
+    join_buffer.flush()
+    join_buffer.add(space_pk, 'viewer1', 'listener')
+    join_buffer.add(space_pk, 'viewer2', None)
+    join_buffer.add(space_pk, 'viewer3', 'listener')
+
+    assert join_buffer.flush() == 2
+    users = {row.user_id for row in BarazaParticipant.query.filter(BarazaParticipant.user_id.like('viewer%'))}
+    assert users == {'viewer1', 'viewer3'}
+    # The failing join is not requeued
+    assert join_buffer.flush() == 0
+
+def test_presence_must_be_shared_between_processes(monkeypatch):
+    """Test that the WebSocket server cannot run on per-process presence"""
+    from baraza_presence import PresenceTracker
+
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    with pytest.raises(RuntimeError):
+        PresenceTracker().require_shared(debug=False)
+    # Local development runs on one machine without Redis
+    PresenceTracker().require_shared(debug=True)
+
+    # A configured Redis without the client library is an error, not a silent fallback
+    monkeypatch.setenv('REDIS_URL', 'redis://localhost:6379/0')
+    monkeypatch.setitem(sys.modules, 'redis', None)
+    with pytest.raises(RuntimeError):
+        PresenceTracker()
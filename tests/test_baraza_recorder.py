@@ -0,0 +1,130 @@
+import pytest
+import asyncio
+import json
+import shutil
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import av
+from aiortc.mediastreams import MediaStreamError
+
+from baraza_recorder import BarazaRecorder
+
+SAMPLE_RATE = 48000
+FRAME_SAMPLES = 960  # 20 ms
+
+class FakeTrack:
+    """Relay subscription yielding a fixed number of silent 20 ms frames"""
+    def __init__(self, frames):
+        self.remaining = frames
+        self.stopped = False
+
+    async def recv(self):
+        if self.remaining == 0:
+            raise MediaStreamError
+        self.remaining -= 1
+        frame = av.AudioFrame(format='s16', layout='mono', samples=FRAME_SAMPLES)
+        for plane in frame.planes:
+            plane.update(bytes(plane.buffer_size))
+        frame.sample_rate = SAMPLE_RATE
+        return frame
+
+    def stop(self):
+        self.stopped = True
+
+class FakeStorage:
+    """Copies uploads into a directory; fails uploads whose name is in fail (each listed count times)"""
+    def __init__(self, root, fail=None):
+        self.root = root
+        self.fail = dict(fail or {})
+        self.attempts = {}
+
+    def upload_video(self, path, remote_name):
+        self.attempts[remote_name] = self.attempts.get(remote_name, 0) + 1
+        if self.fail.get(remote_name, 0) > 0:
+            self.fail[remote_name] -= 1
+            raise IOError('storage unavailable')
+        target = os.path.join(self.root, remote_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def get_video_url(self, remote_name):
+        return f'file://{os.path.join(self.root, remote_name)}'
+
+def record(tmp_path, seconds, storage, **kwargs):
+    recorder = BarazaRecorder('space-1', FakeTrack(int(seconds * SAMPLE_RATE / FRAME_SAMPLES)), storage,
+                              segment_seconds=1, output_dir=str(tmp_path / 'local'),
+                              upload_retry_seconds=0, **kwargs)
+
+    async def scenario():
+        await recorder.start()
+        await recorder._record_task
+        return await recorder.stop()
+
+    return recorder, asyncio.run(scenario())
+
+def manifest(storage):
+    with open(os.path.join(storage.root, 'space-1', 'manifest.json')) as f:
+        return json.load(f)
+
+def test_audio_is_split_into_uploaded_segments_with_a_manifest(tmp_path):
+    storage = FakeStorage(str(tmp_path / 'bucket'))
+    recorder, summary = record(tmp_path, 2.5, storage)
+
+    assert summary['is_complete'] and summary['duration_seconds'] == 2
+    assert summary['recording_url'].endswith('space-1/manifest.json')
+    data = manifest(storage)
+    assert [segment['index'] for segment in data['segments']] == [0, 1, 2]
+    assert data['complete'] and data['missing_segments'] == []
+    assert summary['file_size_bytes'] == sum(segment['size_bytes'] for segment in data['segments'])
+    for segment in data['segments']:
+        with av.open(os.path.join(storage.root, segment['path'])) as container:
+            assert container.streams.audio[0].codec_context.name == 'opus'
+    # Uploaded segments are removed locally
+    assert os.listdir(recorder.output_dir) == []
+    assert recorder.track.stopped
+
+def test_transient_upload_failure_is_retried(tmp_path):
+    storage = FakeStorage(str(tmp_path / 'bucket'), fail={'space-1/segment-00001.ogg': 2})
+    _, summary = record(tmp_path, 2.5, storage, upload_attempts=3)
+
+    assert summary['is_complete']
+    assert storage.attempts['space-1/segment-00001.ogg'] == 3
+    assert len(manifest(storage)['segments']) == 3
+
+def test_failed_segment_marks_the_recording_incomplete(tmp_path):
+    storage = FakeStorage(str(tmp_path / 'bucket'), fail={'space-1/segment-00001.ogg': 10})
+    recorder, summary = record(tmp_path, 2.5, storage, upload_attempts=2)
+
+    assert summary['is_complete'] is False
+    data = manifest(storage)
+    assert not data['complete'] and data['missing_segments'] == [1]
+    assert [segment['index'] for segment in data['segments']] == [0, 2]
+    # The segment that never made it stays on disk for a manual re-upload
+    assert os.listdir(recorder.output_dir) == ['segment-00001.ogg']
+
+def test_nothing_recorded_publishes_nothing(tmp_path):
+    storage = FakeStorage(str(tmp_path / 'bucket'))
+    _, summary = record(tmp_path, 0, storage)
+    assert summary is None
+    assert not os.path.exists(storage.root)
+
+def test_failed_manifest_upload_can_be_retried(tmp_path):
+    storage = FakeStorage(str(tmp_path / 'bucket'), fail={'space-1/manifest.json': 2})
+    recorder = BarazaRecorder('space-1', FakeTrack(int(1.5 * SAMPLE_RATE / FRAME_SAMPLES)), storage,
+                              segment_seconds=1, output_dir=str(tmp_path / 'local'),
+                              upload_attempts=2, upload_retry_seconds=0)
+
+    async def scenario():
+        await recorder.start()
+        await recorder._record_task
+        with pytest.raises(RuntimeError):
+            await recorder.stop()
+        return await recorder.stop()
+
+    summary = asyncio.run(scenario())
+    assert summary['is_complete'] and storage.attempts['space-1/manifest.json'] == 3
+    assert len(manifest(storage)['segments']) == 2
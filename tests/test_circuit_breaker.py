@@ -0,0 +1,63 @@
+import pytest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CLOSED, OPEN, HALF_OPEN
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+def test_opens_on_error_rate_and_recovers_through_half_open(clock):
+    breaker = CircuitBreaker(window_seconds=60, min_requests=4, error_rate_threshold=0.5,
+                             consecutive_failures=10, open_seconds=30, clock=clock)
+    for ok in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(ok, 0.1)
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_in() == 30
+
+    clock.now += 30
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(True, 0.05)
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(consecutive_failures=2, open_seconds=10, clock=clock)
+    breaker.record(False, 1.0)
+    breaker.record(False, 1.0)
+    assert breaker.state == OPEN
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False, 1.0)
+    assert breaker.state == OPEN and breaker.retry_in() == 10
+
+def test_old_calls_leave_the_window(clock):
+    breaker = CircuitBreaker(window_seconds=60, min_requests=3, error_rate_threshold=0.5,
+                             consecutive_failures=10, clock=clock)
+    breaker.record(False, 0.2)
+    breaker.record(False, 0.2)
+    clock.now += 61
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.3)
+    status = breaker.get_status()
+    assert status['state'] == CLOSED and status['requests'] == 2 and status['error_rate'] == 0.5
+    assert status['latency_ms'] == {'p50': 300.0, 'p95': 300.0, 'max': 300.0}
+
+def test_registry_lists_open_partners(clock):
+    registry = CircuitBreakerRegistry(consecutive_failures=1, open_seconds=30, clock=clock)
+    registry.get('knchr').record(False, 5.0)
+    registry.get('transparency_intl').record(True, 0.1)
+    assert registry.open_keys() == ['knchr']
+    assert registry.get_status()['knchr']['retry_in_seconds'] == 30.0
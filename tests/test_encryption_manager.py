@@ -0,0 +1,27 @@
+import pytest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.exceptions import InvalidTag
+
+from security.encryption_manager import encryption_manager, HYBRID_PREFIX
+
+def test_hybrid_encryption_has_no_size_limit():
+    payload = 'Witness statement. ' * 1000
+    encrypted = encryption_manager.encrypt_asymmetric(payload)
+    assert encrypted.startswith(HYBRID_PREFIX)
+    assert encryption_manager.decrypt_asymmetric(encrypted) == payload
+
+def test_direct_rsa_values_still_decrypt():
+    encrypted = encryption_manager.encrypt_asymmetric('short secret', hybrid=False)
+    assert not encrypted.startswith(HYBRID_PREFIX)
+    assert encryption_manager.decrypt_asymmetric(encrypted) == 'short secret'
+
+def test_tampered_hybrid_value_is_rejected():
+    encrypted = encryption_manager.encrypt_asymmetric('report')
+    tampered = encrypted[:-6] + ('A' if encrypted[-6] != 'A' else 'B') + encrypted[-5:]
+    with pytest.raises(InvalidTag):
+        encryption_manager.decrypt_asymmetric(tampered)
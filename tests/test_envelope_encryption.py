@@ -0,0 +1,58 @@
+import pytest
+import base64
+import os
+import sys
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from security.keyring import Keyring
+from security.envelope_encryption import EnvelopeCipher, EnvelopeDecryptionError, TOKEN_PREFIX
+from security.security_config import security_manager
+
+KEYRING = Keyring.from_keys({'master': {1: Fernet.generate_key()}})
+
+@pytest.mark.parametrize('level', ['standard', 'high', 'military_grade'])
+def test_envelope_round_trip(level):
+    cipher = EnvelopeCipher(KEYRING)
+    token = cipher.encrypt(b'Torture in detention', level)
+    assert token.startswith(TOKEN_PREFIX)
+    # A fresh cipher has to unwrap the data key itself
+    assert EnvelopeCipher(KEYRING).decrypt(token) == b'Torture in detention'
+
+def test_each_value_gets_its_own_data_key():
+    cipher = EnvelopeCipher(KEYRING, cache_size=0)
+    first, second = cipher.encrypt(b'same', 'high'), cipher.encrypt(b'same', 'high')
+    assert first != second
+    assert cipher.cache_info()['size'] == 0
+
+def test_levels_use_separate_key_encryption_keys():
+    """A token relabelled to another level no longer unwraps"""
+    cipher = EnvelopeCipher(KEYRING)
+    token = cipher.encrypt(b'report', 'high')
+    raw = bytearray(base64.urlsafe_b64decode(token[len(TOKEN_PREFIX):] + '=='))
+    raw[1] = 1
+    relabelled = TOKEN_PREFIX + base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode()
+
+    with pytest.raises(EnvelopeDecryptionError):
+        EnvelopeCipher(KEYRING).decrypt(relabelled)
+    with pytest.raises(EnvelopeDecryptionError):
+        EnvelopeCipher(Keyring.from_keys({'master': {1: Fernet.generate_key()}})).decrypt(token)
+
+def test_data_key_cache_is_bounded():
+    cipher = EnvelopeCipher(KEYRING, cache_size=2)
+    tokens = [cipher.encrypt(f'report {i}'.encode()) for i in range(5)]
+    assert cipher.cache_info() == {'size': 2, 'max_size': 2}
+    assert [cipher.decrypt(token) for token in tokens] == [f'report {i}'.encode() for i in range(5)]
+
+def test_security_manager_reads_legacy_tokens():
+    """Content written with the single and double Fernet scheme still decrypts"""
+    single = security_manager.fernet.encrypt(b'bribe').decode()
+    double = security_manager.fernet.encrypt(security_manager.fernet.encrypt(b'bribe')).decode()
+    assert security_manager.decrypt_sensitive_data(single) == 'bribe'
+    assert security_manager.decrypt_sensitive_data(double, level='military_grade') == 'bribe'
+
+    token = security_manager.encrypt_sensitive_data('bribe', level='high')
+    assert security_manager.decrypt_sensitive_data(token) == 'bribe'
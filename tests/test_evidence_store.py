@@ -0,0 +1,116 @@
+import pytest
+import hashlib
+import sys
+import os
+from io import BytesIO
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from main import app, db
+from database.models import SensitiveReport, EvidenceBlob, EvidenceFile
+from security.keyring import Keyring
+from security.stream_encryption import StreamCipher
+from evidence_store import EvidenceBlobStore, LocalBlobBackend, IntegrityError, migrate_inline_evidence
+
+KEYRING = Keyring.from_keys({'evidence': {1: Fernet.generate_key()}})
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.drop_all()
+
+@pytest.fixture
+def store(tmp_path):
+    return EvidenceBlobStore(LocalBlobBackend(str(tmp_path / 'blobs')), StreamCipher(KEYRING, chunk_size=1024))
+
+def test_put_deduplicates_by_content_hash(store, tmp_path):
+    """Identical evidence is stored once under its keyed hash"""
+    data = os.urandom(5000)
+    file_hash = store.blob_key(data)
+    # The key cannot be computed from the plaintext alone
+    assert file_hash != hashlib.sha256(data).hexdigest()
+
+    blob_key, size, deduplicated = store.put(BytesIO(data))
+    assert (blob_key, size, deduplicated) == (file_hash, 5000, False)
+    assert store.put(BytesIO(data)) == (file_hash, 5000, True)
+    assert store.put(BytesIO(data), file_hash) == (file_hash, 5000, True)
+
+    blobs = [name for _, _, files in os.walk(tmp_path / 'blobs') for name in files]
+    assert blobs == [file_hash]
+
+    out = BytesIO()
+    store.read_to(blob_key, out)
+    assert out.getvalue() == data
+    assert store.read_range(blob_key, 1000, 1500) == data[1000:2500]
+
+def test_put_rejects_wrong_file_hash(store):
+    with pytest.raises(IntegrityError):
+        store.put(BytesIO(b'evidence'), store.blob_key(b'other'))
+
+def test_release_keeps_blobs_that_are_still_referenced(client, store):
+    """A deduplicated blob is only deleted with its last reference"""
+    data = b'shared photo'
+    blob_key = store.blob_key(data)
+    for _ in range(2):
+        store.acquire(db, blob_key)
+        db.session.commit()
+        store.put(BytesIO(data), blob_key)
+    assert db.session.get(EvidenceBlob, blob_key).ref_count == 2
+
+    assert store.release(db, blob_key) is False
+    assert store.backend.exists(blob_key)
+    assert store.release(db, blob_key) is True
+    assert not store.backend.exists(blob_key)
+    assert db.session.get(EvidenceBlob, blob_key) is None
+
+def test_reference_taken_after_release_stores_the_blob_again(client, store):
+    """An upload racing the last release either keeps the blob or writes it anew"""
+    data = b'shared photo'
+    blob_key = store.blob_key(data)
+    store.acquire(db, blob_key)
+    db.session.commit()
+    store.put(BytesIO(data), blob_key)
+    assert store.release(db, blob_key) is True
+
+    store.acquire(db, blob_key)
+    db.session.commit()
+    assert store.put(BytesIO(data), blob_key) == (blob_key, len(data), False)
+    assert store.backend.exists(blob_key)
+
+def test_migrate_inline_evidence(client, store):
+    """Legacy inline Fernet blobs are moved into the store and cleared"""
+    legacy_fernet = Fernet(Fernet.generate_key())
+    report = SensitiveReport(report_id='r1', encrypted_content=b'x', content_hash='hash', category='corruption')
+    db.session.add(report)
+    db.session.commit()
+
+    data = b'scanned receipt' * 100
+    for name in ('a.pdf', 'b.pdf'):
+        db.session.add(EvidenceFile(
+            report_id=report.id, filename=name, encrypted_file=legacy_fernet.encrypt(data),
+            file_hash='legacy', file_type='application/pdf', file_size=len(data)
+        ))
+    db.session.add(EvidenceFile(
+        report_id=report.id, filename='broken.pdf', encrypted_file=b'not a token',
+        file_hash='legacy', file_type='application/pdf', file_size=11
+    ))
+    db.session.commit()
+
+    stats = migrate_inline_evidence(db, store, legacy_fernet, batch_size=1)
+    assert stats == {'migrated': 2, 'deduplicated': 1, 'failed': 1}
+
+    migrated = EvidenceFile.query.filter(EvidenceFile.blob_key.isnot(None)).all()
+    assert {evidence.filename for evidence in migrated} == {'a.pdf', 'b.pdf'}
+    assert all(evidence.encrypted_file is None for evidence in migrated)
+    out = BytesIO()
+    store.read_to(migrated[0].blob_key, out)
+    assert out.getvalue() == data
+    assert db.session.get(EvidenceBlob, migrated[0].blob_key).ref_count == 2
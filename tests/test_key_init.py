@@ -0,0 +1,69 @@
+import pytest
+import sys
+import os
+import stat
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from security.encryption_manager import EncryptionManager
+from security.keyring import Keyring, UnknownKeyError
+from security.security_config import SecurityManager
+
+@pytest.fixture
+def keyring_path(tmp_path):
+    return str(tmp_path / 'keys' / 'keyring.json')
+
+def test_construction_does_no_key_io(tmp_path, keyring_path):
+    keyring = Keyring(keyring_path, legacy_files={'master': str(tmp_path / 'master.key')})
+    SecurityManager(keyring)
+    EncryptionManager(keyring, private_key_file=str(tmp_path / 'keys' / 'private.pem'),
+                      public_key_file=str(tmp_path / 'keys' / 'public.pem'))
+    assert not (tmp_path / 'keys').exists()
+
+def test_uninitialized_keyring_can_refuse_to_create_keys(tmp_path, keyring_path):
+    keyring = Keyring(keyring_path, legacy_files={'master': str(tmp_path / 'master.key')})
+    with pytest.raises(UnknownKeyError):
+        keyring._load(create=False)
+
+def test_required_init_refuses_to_create_new_purposes(tmp_path, keyring_path):
+    legacy_files = {'master': str(tmp_path / 'master.key')}
+    Keyring(keyring_path, legacy_files, require_init=False).init()
+    keyring = Keyring(keyring_path, legacy_files, require_init=True)
+    keyring.active('master')
+    with pytest.raises(UnknownKeyError):
+        keyring.ensure('audit')
+    keyring.ensure('audit', create=True)
+    assert Keyring(keyring_path, legacy_files, require_init=True).active('audit')[0] == 1
+
+def test_init_keys_creates_keyring_and_private_rsa_key(tmp_path, keyring_path):
+    keyring = Keyring(keyring_path, legacy_files={'master': str(tmp_path / 'master.key')})
+    manager = EncryptionManager(keyring, private_key_file=str(tmp_path / 'keys' / 'private.pem'),
+                                public_key_file=str(tmp_path / 'keys' / 'public.pem'), rsa_key_size=2048)
+    assert manager.init_keys() == {'keyring': True, 'rsa': True}
+    assert stat.S_IMODE(os.stat(manager.private_key_file).st_mode) == 0o600
+    assert manager.decrypt_asymmetric(manager.encrypt_asymmetric('report')) == 'report'
+
+    reloaded = EncryptionManager(Keyring(keyring_path, legacy_files={}), private_key_file=manager.private_key_file,
+                                 public_key_file=manager.public_key_file)
+    assert reloaded.init_keys() == {'keyring': False, 'rsa': False}
+    assert reloaded.keys['master'] == manager.keys['master']
+
+def test_rsa_rotation_keeps_old_private_key(tmp_path, keyring_path, monkeypatch):
+    keyring = Keyring(keyring_path, legacy_files={purpose: str(tmp_path / f'{purpose}.key')
+                                                  for purpose in ('master', 'evidence')})
+    manager = EncryptionManager(keyring, private_key_file=str(tmp_path / 'keys' / 'private.pem'),
+                                public_key_file=str(tmp_path / 'keys' / 'public.pem'), rsa_key_size=2048)
+    manager.init_keys()
+    monkeypatch.setattr(manager, '_schedule_data_reencryption', lambda new_versions: None)
+    old = [manager.encrypt_asymmetric('hybrid report'), manager.encrypt_asymmetric('direct', hybrid=False)]
+
+    manager.rotate_encryption_keys()
+    assert os.path.exists(manager.private_key_file + '.1')
+    assert stat.S_IMODE(os.stat(manager.private_key_file + '.1').st_mode) == 0o600
+    new = manager.encrypt_asymmetric('after rotation')
+    assert [manager.decrypt_asymmetric(value) for value in old + [new]] == ['hybrid report', 'direct', 'after rotation']
+
+    reloaded = EncryptionManager(keyring, private_key_file=manager.private_key_file,
+                                 public_key_file=manager.public_key_file)
+    assert [reloaded.decrypt_asymmetric(value) for value in old + [new]] == ['hybrid report', 'direct', 'after rotation']
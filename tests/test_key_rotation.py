@@ -0,0 +1,174 @@
+import pytest
+import json
+import sys
+import os
+from io import BytesIO
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from main import app, db
+from database.models import SensitiveReport, EvidenceFile, NGOPartner
+from security.keyring import Keyring, UnknownKeyError
+from security.security_config import SecurityManager
+from security.encryption_manager import EncryptionManager
+from evidence_store import EvidenceBlobStore, LocalBlobBackend
+from key_rotation import ReencryptionWorker
+from security.stream_encryption import StreamCipher
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.drop_all()
+
+@pytest.fixture
+def keyring(tmp_path):
+    legacy_files = {}
+    for purpose in ('master', 'evidence', 'data'):
+        legacy_files[purpose] = str(tmp_path / f'{purpose}.key')
+        with open(legacy_files[purpose], 'wb') as f:
+            f.write(Fernet.generate_key())
+    return Keyring(str(tmp_path / 'keyring.json'), legacy_files)
+
+def test_keyring_imports_legacy_keys_and_rotates(keyring, tmp_path):
+    with open(tmp_path / 'master.key', 'rb') as f:
+        legacy_master = f.read()
+    assert keyring.active('master') == (1, legacy_master)
+
+    assert keyring.rotate('master') == 2
+    # Another process sees the rotation and can still read version 1
+    other = Keyring(keyring.path, keyring.legacy_files)
+    assert other.active('master')[0] == 2
+    assert other.get('master', 1) == legacy_master
+
+    keyring.retire('master', 1)
+    with pytest.raises(UnknownKeyError):
+        Keyring(keyring.path, keyring.legacy_files).get('master', 1)
+    with pytest.raises(ValueError):
+        keyring.retire('master', 2)
+
+def _ensure_purpose(path, legacy_files, purpose):
+    Keyring(path, legacy_files).ensure(purpose)
+
+def test_keyring_changes_from_several_processes_are_kept(keyring, tmp_path):
+    """Concurrent writers re-read the file under the lock instead of overwriting it"""
+    import multiprocessing
+
+    stale = Keyring(keyring.path, keyring.legacy_files)
+    stale.active('master')
+    keyring.ensure('audit')
+    # The stale copy has not reloaded yet, but must not drop the audit key
+    stale.ensure('evidence_index')
+    assert {'audit', 'evidence_index'} <= set(Keyring(keyring.path, keyring.legacy_files).get_status())
+
+    processes = [multiprocessing.Process(target=_ensure_purpose, args=(keyring.path, keyring.legacy_files, f'p{i}'))
+                 for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    status = Keyring(keyring.path, keyring.legacy_files).get_status()
+    assert {f'p{i}' for i in range(4)} <= set(status)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+def test_reencryption_moves_all_data_to_new_keys(client, keyring, tmp_path):
+    """Reports, evidence blobs and partner API keys end up under the active versions"""
+    security = SecurityManager(keyring)
+    encryption = EncryptionManager(keyring)
+    store = EvidenceBlobStore(LocalBlobBackend(str(tmp_path / 'blobs')), security.evidence_cipher)
+
+    contents = {
+        'SR-1': security.fernet.encrypt(b'legacy bribe'),
+        'SR-2': security.fernet.encrypt(security.fernet.encrypt(b'legacy torture')),
+        'SR-3': security.encrypt_sensitive_data('envelope report', level='high').encode(),
+    }
+    for report_id, encrypted in contents.items():
+        db.session.add(SensitiveReport(report_id=report_id, encrypted_content=encrypted,
+                                       content_hash='hash', category='corruption'))
+    db.session.add(NGOPartner(name='Legacy', api_endpoint='https://ngo.example',
+                              api_key_encrypted=Fernet(keyring.get('master', 1)).encrypt(b'legacy-key')))
+    db.session.add(NGOPartner(name='Current', api_endpoint='https://ngo.example',
+                              api_key_encrypted=encryption._software_encrypt('current-key').encode(),
+                              signing_secret_encrypted=encryption._software_encrypt('current-secret').encode()))
+    blob_key, size, _ = store.put(BytesIO(b'photo bytes' * 1000))
+    db.session.commit()
+    db.session.add(EvidenceFile(report_id=1, filename='photo.jpg', blob_key=blob_key, file_hash=blob_key,
+                                file_type='image/jpeg', file_size=size))
+    db.session.commit()
+
+    keyring.rotate('master')
+    keyring.rotate('evidence')
+
+    worker = ReencryptionWorker(security, encryption, store, checkpoint_file=str(tmp_path / 'checkpoint.json'),
+                                batch_size=2, pause_seconds=0)
+    worker.init_app(app, db)
+    result = worker.run()
+    assert result['completed'] and result['failed'] == 0
+    assert result['reencrypted'] == 7
+
+    assert worker.retire_old_versions(result) == ['master/1', 'evidence/1']
+    plaintexts = {}
+    for report in SensitiveReport.query.all():
+        token = report.encrypted_content.decode()
+        assert security.envelope.key_id(token) == 2
+        plaintexts[report.report_id] = security.decrypt_sensitive_data(token)
+    assert plaintexts == {'SR-1': 'legacy bribe', 'SR-2': 'legacy torture', 'SR-3': 'envelope report'}
+
+    partners = [encryption._software_decrypt(ngo.api_key_encrypted.decode()) for ngo in NGOPartner.query.all()]
+    assert partners == ['legacy-key', 'current-key']
+    current = NGOPartner.query.filter_by(name='Current').one()
+    assert encryption.software_key_id(current.signing_secret_encrypted.decode()) == 2
+    assert encryption._software_decrypt(current.signing_secret_encrypted.decode()) == 'current-secret'
+    assert store.key_id(blob_key) == 2
+    out = BytesIO()
+    store.read_to(blob_key, out)
+    assert out.getvalue() == b'photo bytes' * 1000
+
+def test_reencryption_resumes_from_checkpoint(client, keyring, tmp_path):
+    security = SecurityManager(keyring)
+    for report_id in ('SR-1', 'SR-2'):
+        db.session.add(SensitiveReport(report_id=report_id, content_hash='hash', category='corruption',
+                                       encrypted_content=security.encrypt_sensitive_data('report').encode()))
+    db.session.commit()
+    keyring.rotate('master')
+
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    with open(checkpoint_file, 'w') as f:
+        json.dump({'targets': {'master': 2, 'evidence': 1},
+                   'last_ids': {'sensitive_reports': 1, 'evidence_files': 0, 'ngo_partners': 0},
+                   'scanned': 1, 'reencrypted': 1, 'failed': 0}, f)
+
+    store = EvidenceBlobStore(LocalBlobBackend(str(tmp_path / 'blobs')), security.evidence_cipher)
+    worker = ReencryptionWorker(security, EncryptionManager(keyring), store,
+                                checkpoint_file=str(checkpoint_file), pause_seconds=0)
+    worker.init_app(app, db)
+    result = worker.run()
+
+    assert result['scanned'] == 2 and result['reencrypted'] == 2
+    key_ids = [security.envelope.key_id(r.encrypted_content.decode()) for r in SensitiveReport.query.all()]
+    assert key_ids == [1, 2]
+
+def test_blob_reencryption_streams_through_memory(keyring, tmp_path, monkeypatch):
+    """Plaintext goes chunk by chunk from the old blob into the new one without a temp file"""
+    import tempfile
+
+    store = EvidenceBlobStore(LocalBlobBackend(str(tmp_path / 'blobs')), StreamCipher(keyring, chunk_size=1024))
+    data = os.urandom(5000)
+    blob_key, _, _ = store.put(BytesIO(data))
+    keyring.rotate('evidence')
+
+    def no_temporary_file(*args, **kwargs):
+        raise AssertionError("plaintext must not be written to a temporary file")
+    monkeypatch.setattr(tempfile, 'TemporaryFile', no_temporary_file)
+    assert store.reencrypt(blob_key)
+    assert store.key_id(blob_key) == 2
+    out = BytesIO()
+    store.read_to(blob_key, out)
+    assert out.getvalue() == data
@@ -0,0 +1,214 @@
+import pytest
+import json
+import sys
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import app, db
+from database.models import NGONotification
+from api.ngo_escalation import ngo_manager
+from ngo_outbox import NotificationDispatcher, notification_dispatcher, sign_payload
+
+class StubNGOHandler(BaseHTTPRequestHandler):
+    """Partner endpoint: /ok accepts, /down fails, /gone rejects, /slow takes a while"""
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Idempotency-Key')))
+            server.bodies.append((self.path, dict(self.headers), body))
+            server.in_flight[self.path] = server.in_flight.get(self.path, 0) + 1
+            server.max_in_flight[self.path] = max(server.max_in_flight.get(self.path, 0), server.in_flight[self.path])
+        if self.path == '/slow':
+            time.sleep(0.2)
+        status = {'/ok': 200, '/slow': 200, '/down': 503, '/gone': 404}[self.path]
+        with server.lock:
+            server.in_flight[self.path] -= 1
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_ngo():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubNGOHandler)
+    server.requests, server.bodies, server.in_flight, server.max_in_flight = [], [], {}, {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', server
+    server.shutdown()
+
+@pytest.fixture
+def dispatcher(stub_ngo):
+    url, _ = stub_ngo
+    partners = {
+        key: {'name': key, 'tier': 1, 'api_endpoint': f'{url}/{key}', 'api_key': 'test-key'}
+        for key in ('ok', 'down', 'gone', 'slow')
+    }
+    partners['digest'] = {'name': 'digest', 'tier': 2, 'api_endpoint': f'{url}/ok', 'api_key': 'digest-key',
+                          'signing_secret': 'digest-secret'}
+    partners['unsigned'] = {'name': 'unsigned', 'tier': 2, 'api_endpoint': f'{url}/ok', 'api_key': 'unsigned-key',
+                            'signing_secret': None}
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    dispatcher = NotificationDispatcher(per_partner_concurrency=2, max_attempts=3, base_backoff=60,
+                                        digest_windows={2: 900}, digest_max_items=3)
+    dispatcher.init_app(app, db, partners.get)
+    with app.app_context():
+        db.create_all()
+        yield dispatcher
+        db.drop_all()
+
+def queue(ngo_key, count=1):
+    for i in range(count):
+        db.session.add(NGONotification(report_id=f'report-{ngo_key}-{i}', ngo_key=ngo_key, payload={'report_id': 'r'}))
+    db.session.commit()
+
+def test_escalation_is_written_with_the_report_session(dispatcher):
+    workflow = ngo_manager.evaluate_and_escalate('report-1', 9.0, 'human_rights', session=db.session)
+    assert workflow['escalated_ngos'] == ['knchr']
+    db.session.rollback()
+    assert NGONotification.query.count() == 0
+
+    ngo_manager.evaluate_and_escalate('report-1', 9.0, 'human_rights', session=db.session)
+    db.session.commit()
+    notification = NGONotification.query.one()
+    assert notification.ngo_key == 'knchr' and notification.status == 'pending'
+    assert notification.payload['category'] == 'human_rights'
+
+def test_delivers_concurrently_with_per_partner_limit(dispatcher, stub_ngo):
+    _, server = stub_ngo
+    queue('slow', 6)
+    queue('ok', 3)
+
+    started = time.monotonic()
+    assert dispatcher.dispatch_once() == {'delivered': 9, 'retry': 0, 'deferred': 0, 'dead': 0}
+    # Six slow requests two at a time take three rounds, not six
+    assert time.monotonic() - started < 1.0
+    assert server.max_in_flight['/slow'] == 2
+    assert {key for _, key in server.requests} == {f'wanaiq-notification-{n.id}' for n in NGONotification.query}
+    assert dispatcher.get_status()['delivered'] == 9
+
+def test_lease_covers_requests_waiting_for_the_partner_limit(dispatcher):
+    """A claimed batch keeps its rows until every queued request could have timed out"""
+    queue('slow', 7)
+    queue('digest', 5)
+    queue('ok')
+    now = datetime.utcnow()
+    dispatcher._claim(now)
+
+    # Seven requests two at a time take four rounds, plus one to record the results
+    lease = now + timedelta(seconds=5 * dispatcher.timeout + dispatcher.poll_interval)
+    assert {n.next_attempt_at for n in NGONotification.query} == {lease}
+
+def test_results_do_not_overwrite_a_row_claimed_again(dispatcher):
+    """A dispatcher whose lease expired cannot record over the new claim"""
+    queue('ok', 2)
+    rows = dispatcher._claim(datetime.utcnow())
+    NGONotification.query.filter_by(id=rows[0].id).update({'claim_token': 'other-dispatcher'})
+    db.session.commit()
+
+    dispatcher._record([[row] for row in rows], [None, None])
+    first, second = (db.session.get(NGONotification, row.id) for row in rows)
+    assert (first.status, first.claim_token) == ('sending', 'other-dispatcher')
+    assert second.status == 'delivered'
+
+def test_failures_back_off_then_dead_letter(dispatcher):
+    queue('down')
+    queue('gone')
+
+    assert dispatcher.dispatch_once() == {'delivered': 0, 'retry': 1, 'deferred': 0, 'dead': 1}
+    down = NGONotification.query.filter_by(ngo_key='down').one()
+    assert down.status == 'pending' and down.attempts == 1 and down.last_error == 'HTTP 503'
+    assert down.next_attempt_at > datetime.utcnow() + timedelta(seconds=25)
+    assert NGONotification.query.filter_by(ngo_key='gone').one().status == 'dead'
+
+    # Not due yet
+    assert dispatcher.dispatch_once() == {'delivered': 0, 'retry': 0, 'deferred': 0, 'dead': 0}
+
+    later = datetime.utcnow() + timedelta(days=1)
+    assert dispatcher.dispatch_once(now=later)['retry'] == 1
+    assert dispatcher.dispatch_once(now=later)['dead'] == 1
+    assert dispatcher.get_status() == {'pending': 0, 'sending': 0, 'delivered': 0, 'dead': 2}
+
+    assert dispatcher.requeue_dead() == 2
+    assert NGONotification.query.filter_by(ngo_key='down').one().attempts == 0
+
+def test_background_loop_delivers_after_wake(dispatcher, stub_ngo):
+    _, server = stub_ngo
+    dispatcher.poll_interval = 60
+    assert dispatcher.start()
+    try:
+        queue('ok', 2)
+        dispatcher._signal()
+        deadline = time.monotonic() + 5
+        while len(server.requests) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(server.requests) == 2
+    finally:
+        dispatcher.stop(timeout=5)
+
+def test_open_circuit_skips_partner_without_using_attempts(dispatcher, stub_ngo):
+    _, server = stub_ngo
+    dispatcher.breakers.settings.update(consecutive_failures=2, open_seconds=60)
+    queue('down', 2)
+    queue('ok')
+    assert dispatcher.dispatch_once()['retry'] == 2
+    assert dispatcher.breakers.get('down').state == 'open'
+
+    queue('down')
+    queue('ok')
+    sent = len(server.requests)
+    assert dispatcher.dispatch_once(now=datetime.utcnow() + timedelta(days=1))['delivered'] == 1
+    assert len(server.requests) == sent + 1  # only the healthy partner was called
+    assert {n.attempts for n in NGONotification.query.filter_by(ngo_key='down')} == {0, 1}
+
+def test_admin_system_status_reports_partner_health(dispatcher):
+    from flask_jwt_extended import create_access_token
+
+    token = create_access_token(identity='admin')
+    with app.test_client() as client:
+        response = client.get('/api/admin/system-status', headers={'Authorization': f'Bearer {token}'})
+    data = response.get_json()['data']
+    assert data['ngo_partners']['knchr']['state'] == 'closed'
+    assert 'latency_ms' in data['ngo_partners']['knchr']
+    assert data['ngo_outbox']['pending'] == 0
+
+def test_lower_tiers_wait_for_their_digest_window(dispatcher):
+    assert dispatcher.digest_due_at(2, datetime(2026, 3, 2, 10, 7)) == datetime(2026, 3, 2, 10, 15)
+    assert dispatcher.digest_due_at(1, datetime(2026, 3, 2, 10, 7)) == datetime(2026, 3, 2, 10, 7)
+
+    ngo_manager.evaluate_and_escalate('report-1', 9.0, 'corruption', session=db.session)
+    db.session.commit()
+    notification = NGONotification.query.one()
+    assert notification.ngo_key == 'transparency_intl'
+    assert notification.next_attempt_at == notification_dispatcher.digest_due_at(2, notification.created_at)
+
+def test_digest_partners_get_one_signed_batch(dispatcher, stub_ngo):
+    _, server = stub_ngo
+    queue('digest', 5)
+    queue('ok')
+
+    assert dispatcher.dispatch_once()['delivered'] == 6
+    digests = [(headers, body) for path, headers, body in server.bodies if 'X-WanaIQ-Signature' in headers]
+    assert len(server.bodies) == 3 and len(digests) == 2  # five rows in chunks of three, plus one immediate
+
+    headers, body = digests[0]
+    assert headers['X-WanaIQ-Signature'] == sign_payload('digest-secret', headers['X-WanaIQ-Timestamp'], body)
+    assert headers['X-WanaIQ-Signature'] != sign_payload('digest-key', headers['X-WanaIQ-Timestamp'], body)
+    assert json.loads(body)['type'] == 'escalation_digest'
+    assert sorted(json.loads(body)['count'] for _, body in digests) == [2, 3]
+
+def test_digest_is_not_sent_without_a_signing_secret(dispatcher, stub_ngo):
+    _, server = stub_ngo
+    queue('unsigned', 2)
+    assert dispatcher.dispatch_once()['dead'] == 2
+    assert server.bodies == []
@@ -0,0 +1,81 @@
+import pytest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import app, db
+from database.models import NGOPartner
+from api.ngo_escalation import ngo_manager
+from security.encryption_manager import encryption_manager
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.drop_all()
+    ngo_manager.invalidate()
+
+def add_partner(slug, threshold, categories, api_key):
+    partner = NGOPartner(name=slug.upper(), slug=slug, api_endpoint=f'https://{slug}.example/escalation',
+                         tier=1, escalation_threshold=threshold, categories=categories,
+                         api_key_encrypted=encryption_manager._software_encrypt(api_key).encode())
+    db.session.add(partner)
+    db.session.commit()
+    return partner
+
+def routed(category, risk_score):
+    return [ngo['id'] for ngo in ngo_manager._get_relevant_ngos(category, risk_score)]
+
+def test_builtin_partners_route_categories_no_stored_partner_handles(client):
+    assert routed('human_rights', 9.0) == ['knchr']
+    assert routed('human_rights', 7.0) == []
+
+    add_partner('legal_aid', 6.0, ['human_rights', 'legal'], 'legal-key')
+    assert routed('human_rights', 9.0) == ['legal_aid']
+    assert routed('tribalism', 9.0) == ['knchr']
+    assert routed('corruption', 9.0) == ['transparency_intl']
+
+def test_partner_without_categories_does_not_disable_the_fallback(client):
+    add_partner('unassigned', 5.0, None, 'unassigned-key')
+    assert routed('human_rights', 9.0) == ['knchr']
+    assert ngo_manager.find_partner_by_api_key('unassigned-key')['id'] == 'unassigned'
+
+def test_builtin_thresholds_compare_raw_scores(client):
+    """KNCHR takes human rights reports from 8.0 and TI corruption reports from 7.5"""
+    assert [routed('human_rights', score) for score in (7.0, 7.5, 8.0)] == [[], [], ['knchr']]
+    assert [routed('corruption', score) for score in (7.0, 7.5, 8.0)] == [
+        [], ['transparency_intl'], ['transparency_intl']]
+
+def test_routes_by_category_and_threshold(client):
+    add_partner('hrw', 5.0, ['human_rights', 'police_brutality'], 'hrw-key')
+    add_partner('legal_aid', 8.5, ['human_rights', 'legal'], 'legal-key')
+    add_partner('ti', 7.5, ['corruption'], 'ti-key')
+
+    assert routed('human_rights', 5.5) == ['hrw']
+    assert routed('human_rights', 8.4) == ['hrw']
+    assert routed('human_rights', 9.0) == ['hrw', 'legal_aid']
+    assert routed('corruption', 9.0) == ['ti']
+    assert routed('tribalism', 9.0) == ['knchr']
+    assert ngo_manager._handles_category('legal_aid', 'legal')
+
+def test_index_is_rebuilt_when_a_partner_changes(client):
+    partner = add_partner('hrw', 5.0, ['human_rights'], 'hrw-key')
+    assert routed('human_rights', 9.0) == ['hrw']
+
+    partner.is_active = False
+    add_partner('ti', 7.5, ['corruption'], 'ti-key')
+    assert routed('human_rights', 9.0) == ['knchr']
+    assert ngo_manager.find_partner_by_api_key('hrw-key') is None
+
+def test_report_access_authenticates_by_hashed_api_key(client):
+    add_partner('hrw', 5.0, ['human_rights'], 'hrw-key')
+    assert ngo_manager.find_partner_by_api_key('hrw-key')['id'] == 'hrw'
+
+    assert client.get('/api/ngo/api/ngo/access/r1', headers={'Authorization': 'Bearer hrw-key'}).status_code == 200
+    assert client.get('/api/ngo/api/ngo/access/r1', headers={'Authorization': 'Bearer wrong'}).status_code == 403
@@ -0,0 +1,109 @@
+import pytest
+import json
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sqlalchemy import event
+
+from main import app, db
+from database.models import EscalationWorkflow, NGOPartner, NGOWebhookDelivery, SensitiveReport
+from api.ngo_escalation import ngo_manager
+from security.encryption_manager import encryption_manager
+
+RESPONSE_URL = '/api/ngo/api/ngo/response'
+AUTH = {'Authorization': 'Bearer hrw-key'}
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            db.session.add(NGOPartner(name='HRW', slug='hrw', api_endpoint='https://hrw.example/escalation',
+                                      tier=1, escalation_threshold=3, categories=['human_rights'],
+                                      api_key_encrypted=encryption_manager._software_encrypt('hrw-key').encode()))
+            db.session.commit()
+            yield client
+            db.drop_all()
+    ngo_manager.invalidate()
+
+def escalate(report_id):
+    report = SensitiveReport(report_id=report_id, encrypted_content=b'x', content_hash='h',
+                             category='human_rights', risk_level=5)
+    db.session.add(report)
+    ngo_manager.evaluate_and_escalate(report_id, 9.0, 'human_rights', session=db.session, report=report)
+    db.session.commit()
+    return report
+
+def workflow(report_id):
+    return EscalationWorkflow.query.join(SensitiveReport).filter(SensitiveReport.report_id == report_id).one()
+
+def test_escalation_creates_pending_workflow(client):
+    escalate('r1')
+    assert workflow('r1').status == 'pending'
+    assert workflow('r1').ngo.slug == 'hrw'
+
+def test_single_response_is_applied_once(client):
+    escalate('r1')
+    response = client.post(RESPONSE_URL, headers=AUTH, json={
+        'delivery_id': 'd-1', 'report_id': 'r1', 'status': 'investigating', 'response': 'Team assigned'})
+    assert response.status_code == 200
+    assert response.get_json()['accepted'] == 1
+    assert workflow('r1').status == 'investigating'
+    assert json.loads(workflow('r1').ngo_response)['response'] == 'Team assigned'
+
+    # A redelivered callback is acknowledged but not applied again
+    response = client.post(RESPONSE_URL, headers=AUTH, json={
+        'delivery_id': 'd-1', 'report_id': 'r1', 'status': 'resolved'})
+    assert response.get_json()['duplicates'] == 1
+    assert workflow('r1').status == 'investigating'
+
+def test_older_callback_does_not_roll_back_a_newer_one(client):
+    escalate('r1')
+    newer = {'delivery_id': 'd-2', 'report_id': 'r1', 'status': 'resolved', 'sent_at': '2026-03-02T10:05:00Z'}
+    older = {'delivery_id': 'd-1', 'report_id': 'r1', 'status': 'investigating', 'sent_at': '2026-03-02T10:00:00Z'}
+    assert client.post(RESPONSE_URL, headers=AUTH, json=newer).get_json()['accepted'] == 1
+
+    result = client.post(RESPONSE_URL, headers=AUTH, json=older).get_json()
+    assert (result['accepted'], result['stale']) == (0, 1)
+    assert workflow('r1').status == 'resolved'
+
+    # Within one batch the newest callback wins whatever the order
+    escalate('r2')
+    batch = [{**newer, 'delivery_id': 'd-4', 'report_id': 'r2'}, {**older, 'delivery_id': 'd-3', 'report_id': 'r2'}]
+    result = client.post(RESPONSE_URL, headers=AUTH, json={'responses': batch}).get_json()
+    assert workflow('r2').status == 'resolved'
+
+    bad = client.post(RESPONSE_URL, headers=AUTH, json={**older, 'delivery_id': 'd-5', 'sent_at': 'yesterday'})
+    assert bad.get_json()['rejected'][0]['error'] == 'sent_at must be an ISO 8601 timestamp'
+    numeric = client.post(RESPONSE_URL, headers=AUTH, json={**older, 'delivery_id': 'd-6', 'sent_at': 1772445600})
+    assert numeric.status_code == 200
+    assert numeric.get_json()['rejected'][0]['error'] == 'sent_at must be an ISO 8601 timestamp'
+
+def test_batch_is_deduplicated_and_committed_once(client):
+    for i in range(50):
+        escalate(f'r{i}')
+    commits = []
+    listener = lambda session: commits.append(session)
+    event.listen(db.session, 'after_commit', listener)
+    try:
+        responses = [{'delivery_id': f'd-{i}', 'report_id': f'r{i}', 'status': 'resolved'} for i in range(50)]
+        responses += [responses[0], {'delivery_id': 'd-x', 'report_id': 'missing'}, {'report_id': 'r1'}]
+        result = client.post(RESPONSE_URL, headers=AUTH, json={'responses': responses}).get_json()
+    finally:
+        event.remove(db.session, 'after_commit', listener)
+
+    assert len(commits) == 1
+    assert (result['accepted'], result['duplicates'], result['unmatched'], result['stale']) == (50, 1, 1, 0)
+    assert result['rejected'] == [{'index': 52, 'error': 'delivery_id and report_id are required'}]
+    assert EscalationWorkflow.query.filter_by(status='resolved').count() == 50
+    assert NGOWebhookDelivery.query.count() == 51
+
+def test_callbacks_require_a_partner_key(client):
+    assert client.post(RESPONSE_URL, json={'delivery_id': 'd', 'report_id': 'r'}).status_code == 401
+    assert client.post(RESPONSE_URL, headers={'Authorization': 'Bearer nope'}, json={}).status_code == 401
+    assert client.post(RESPONSE_URL, headers=AUTH, json={'responses': 'x'}).status_code == 400
@@ -0,0 +1,63 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from security.keyring import Keyring, UnknownKeyError
+from security.pseudonymization import Pseudonymizer, PSEUDONYM_HEX_LENGTH
+from security.security_config import security_manager
+
+@pytest.fixture
+def pseudonymizer():
+    return Pseudonymizer(Keyring.from_keys({'pseudonym': {1: Fernet.generate_key()}}))
+
+TODAY = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def test_pseudonyms_are_stable_within_a_day(pseudonymizer):
+    morning, evening = TODAY + timedelta(hours=6), TODAY + timedelta(hours=23, minutes=59)
+    first = pseudonymizer.pseudonymize('197.248.10.4', 'ip', at=morning)
+    assert first == pseudonymizer.pseudonymize('197.248.10.4', 'ip', at=evening)
+    assert len(first) == PSEUDONYM_HEX_LENGTH and int(first, 16) >= 0
+    assert first != pseudonymizer.pseudonymize('197.248.10.5', 'ip', at=morning)
+
+def test_pseudonyms_rotate_daily_and_per_namespace(pseudonymizer):
+    day_one, day_two = TODAY - timedelta(hours=12), TODAY + timedelta(hours=12)
+    ip_today = pseudonymizer.pseudonymize('197.248.10.4', 'ip', at=day_one)
+    assert ip_today != pseudonymizer.pseudonymize('197.248.10.4', 'ip', at=day_two)
+    assert ip_today != pseudonymizer.pseudonymize('197.248.10.4', 'reporter', at=day_one)
+
+def test_pseudonyms_depend_on_the_key(pseudonymizer):
+    other = Pseudonymizer(Keyring.from_keys({'pseudonym': {1: Fernet.generate_key()}}))
+    at = TODAY
+    assert pseudonymizer.pseudonymize('reporter', 'reporter', at=at) != other.pseudonymize('reporter', 'reporter', at=at)
+
+def test_salts_are_random_and_destroyed_after_retention(tmp_path):
+    """The key alone cannot re-derive a window's salt, and old salts are gone"""
+    key = Fernet.generate_key()
+    first = Pseudonymizer(Keyring.from_keys({'pseudonym': {1: key}}))
+    second = Pseudonymizer(Keyring.from_keys({'pseudonym': {1: key}}))
+    assert first.pseudonymize('197.248.10.4', 'ip') != second.pseudonymize('197.248.10.4', 'ip')
+
+    # Processes sharing a keyring file share the salts
+    legacy_files = {'pseudonym': str(tmp_path / 'pseudonym.key')}
+    keyring_path = str(tmp_path / 'keyring.json')
+    shared = Pseudonymizer(Keyring(keyring_path, legacy_files, require_init=False))
+    assert shared.pseudonymize('197.248.10.4', 'ip') == Pseudonymizer(
+        Keyring(keyring_path, legacy_files, require_init=False)).pseudonymize('197.248.10.4', 'ip')
+
+    with pytest.raises(UnknownKeyError):
+        first.pseudonymize('197.248.10.4', 'ip', at=TODAY - timedelta(days=3))
+    keyring = first.keyring
+    keyring.window_salt('pseudonym-ip', first.window() + 2, first.keep_windows)
+    assert str(first.window()) not in keyring._data['salts']['pseudonym-ip']
+    with pytest.raises(UnknownKeyError):
+        keyring.window_salt('pseudonym-ip', first.window(), first.keep_windows)
+
+def test_security_manager_hashes_use_their_input():
+    assert security_manager.hash_reporter_identity('a') != security_manager.hash_reporter_identity('b')
+    assert security_manager.hash_ip('10.0.0.1') == security_manager.hash_ip('10.0.0.1')
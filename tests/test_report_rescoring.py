@@ -0,0 +1,75 @@
+import pytest
+import json
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import app, db
+from database.models import SensitiveReport
+from security.security_config import security_manager
+from report_rescoring import ReportRescoringJob
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            yield client
+            db.drop_all()
+
+def add_report(report_id, content, category, level='standard', status='pending'):
+    report = SensitiveReport(
+        report_id=report_id,
+        encrypted_content=security_manager.encrypt_sensitive_data(content, level=level).encode(),
+        content_hash='hash',
+        risk_level=1,
+        category=category,
+        status=status
+    )
+    db.session.add(report)
+    db.session.commit()
+    return report.id
+
+def make_job(checkpoint_file, **kwargs):
+    return ReportRescoringJob(db, security_manager.encryption_keys['data'],
+                              checkpoint_file=str(checkpoint_file), chunk_size=2, workers=2,
+                              master_keys=security_manager.keyring.decryptable_versions('master'), **kwargs)
+
+def test_rescoring_updates_pending_reports(client, tmp_path):
+    """Test pending reports are decrypted, rescored and bulk updated"""
+    first = add_report('SR-0001', 'A bribe was demanded', 'corruption')
+    second = add_report('SR-0002', 'Torture in detention', 'human_rights', level='military_grade')
+    third = add_report('SR-0003', 'Road delay', 'mismanagement')
+    resolved = add_report('SR-0004', 'Old kickback case', 'corruption', status='resolved')
+
+    result = make_job(tmp_path / 'checkpoint.json').run()
+
+    assert result['scanned'] == 3
+    assert result['failed'] == 0
+    levels = {report.id: report.risk_level for report in SensitiveReport.query.all()}
+    assert levels[first] == 4
+    assert levels[second] == 5
+    assert levels[third] == 4
+    assert levels[resolved] == 1
+
+def test_rescoring_resumes_from_checkpoint(client, tmp_path):
+    """Test a restarted job skips reports committed before the crash"""
+    first = add_report('SR-0001', 'A bribe was demanded', 'corruption')
+    second = add_report('SR-0002', 'Torture in detention', 'human_rights')
+
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    job = make_job(checkpoint_file)
+    checkpoint_file.write_text(json.dumps({
+        'last_id': first, 'scanned': 1, 'updated': 0, 'failed': 0,
+        'keywords_digest': job.keywords_digest, 'status': 'pending'
+    }))
+
+    result = job.run()
+
+    assert result['scanned'] == 2
+    assert db.session.get(SensitiveReport, first).risk_level == 1
+    assert db.session.get(SensitiveReport, second).risk_level == 5
@@ -0,0 +1,45 @@
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import risk_scoring
+from risk_scoring import KeywordAutomaton, risk_scorer
+
+def test_automaton_finds_overlapping_keywords():
+    """Test that one scan finds every keyword, including overlapping ones"""
+    automaton = KeywordAutomaton([('a', 'he'), ('a', 'she'), ('b', 'hers'), ('b', 'corrupt')])
+    assert automaton.find('ushers and corruption') == {'a': {'he', 'she'}, 'b': {'hers', 'corrupt'}}
+    assert automaton.find('nothing here') == {'a': {'he'}}
+
+def test_fallback_matches_substring_search(monkeypatch):
+    """Test the pure-Python fallback agrees with plain substring checks"""
+    monkeypatch.setattr(risk_scoring, 'ahocorasick', None)
+    keywords = [('x', 'aa'), ('x', 'aab'), ('y', 'ab'), ('y', 'bab'), ('z', 'kitu kidogo'), ('z', 'aa')]
+    automaton = KeywordAutomaton(keywords)
+    for text in ['aab', 'babab', 'aaab kitu kidogo', 'kitu kid', '']:
+        expected = {}
+        for category, keyword in keywords:
+            if keyword in text:
+                expected.setdefault(category, set()).add(keyword)
+        assert automaton.find(text) == expected
+
+def test_score_matches_submitted_category():
+    """Test the submitted category keeps the original base risk and keyword bonus"""
+    result = risk_scorer.score('A BRIBE and a kickback were paid', 'corruption')
+    assert result['score'] == 8.0
+    assert result['category_hits'] == {'corruption': ['bribe', 'kickback']}
+
+def test_other_categories_are_reported_but_not_scored():
+    """Test Swahili/Sheng terms are found in every category without raising the score"""
+    result = risk_scorer.score('Walidai kitu kidogo, kisha mateso kizuizini', 'mismanagement')
+    assert result['category_hits']['corruption'] == ['kitu kidogo']
+    assert result['category_hits']['human_rights'] == ['kizuizini', 'mateso']
+    assert result['score'] == 6.0
+
+def test_keyword_inside_another_word_does_not_raise_the_score():
+    """Test that "hate" inside "whatever" does not give the report tribalism's base risk"""
+    result = risk_scorer.score('Whatever, the county officer asked for a bribe', 'corruption')
+    assert result['score'] == 7.5
+    assert result['category_hits']['tribalism'] == ['hate']
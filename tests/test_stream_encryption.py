@@ -0,0 +1,57 @@
+import pytest
+import os
+import sys
+from io import BytesIO
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cryptography.fernet import Fernet
+
+from security.keyring import Keyring
+from security.stream_encryption import StreamCipher, StreamDecryptionError, HEADER, TAG_SIZE
+
+KEYRING = Keyring.from_keys({'evidence': {1: Fernet.generate_key()}})
+
+def encrypt(data, **kwargs):
+    cipher = StreamCipher(KEYRING, **kwargs)
+    encrypted = BytesIO()
+    cipher.encrypt_stream(BytesIO(data), encrypted)
+    return cipher, encrypted.getvalue()
+
+@pytest.mark.parametrize('algorithm', ['aes-gcm', 'chacha20-poly1305'])
+@pytest.mark.parametrize('size', [0, 1, 100, 256, 257, 1000])
+def test_stream_round_trip(algorithm, size):
+    """Test streams of every size relative to the chunk size round-trip"""
+    data = os.urandom(size)
+    cipher, encrypted = encrypt(data, algorithm=algorithm, chunk_size=256)
+
+    decrypted = BytesIO()
+    assert cipher.decrypt_stream(BytesIO(encrypted), decrypted) == size
+    assert decrypted.getvalue() == data
+    assert StreamCipher.plaintext_size(len(encrypted), chunk_size=256) == size
+
+def test_decrypt_range_reads_only_covering_chunks():
+    """Test random-access decryption of byte ranges across chunk boundaries"""
+    data = os.urandom(1000)
+    cipher, encrypted = encrypt(data, chunk_size=64)
+
+    for offset, length in [(0, 10), (60, 10), (64, 64), (500, 300), (990, 50), (999, 1)]:
+        assert cipher.decrypt_range(BytesIO(encrypted), offset, length) == data[offset:offset + length]
+
+def test_tampered_chunk_is_rejected():
+    """Test that modifying ciphertext fails authentication"""
+    cipher, encrypted = encrypt(os.urandom(300), chunk_size=64)
+    tampered = bytearray(encrypted)
+    tampered[HEADER.size + 70] ^= 1
+
+    with pytest.raises(StreamDecryptionError):
+        cipher.decrypt_stream(BytesIO(bytes(tampered)), BytesIO())
+
+def test_truncated_stream_is_rejected():
+    """Test that dropping trailing chunks is detected"""
+    cipher, encrypted = encrypt(os.urandom(300), chunk_size=64)
+    truncated = encrypted[:HEADER.size + 2 * (64 + TAG_SIZE)]
+
+    with pytest.raises(StreamDecryptionError):
+        cipher.decrypt_stream(BytesIO(truncated), BytesIO())